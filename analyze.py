@@ -0,0 +1,141 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import BitboardPosition
+from evaluation import evaluate
+from rules import Position
+from search import Search
+from transposition import TranspositionTable
+
+CHUNK_SIZE = 256
+# Chunks in flight per worker, which bounds memory however long the input is
+CHUNKS_PER_WORKER = 4
+
+# Per-process state, set up once by _init_worker
+_search = None
+_depth = None
+
+
+def _init_worker(depth, hash_mb):
+    global _search, _depth
+    _depth = depth
+    if depth:
+        _search = Search(TranspositionTable(hash_mb))
+
+
+def _analyze_chunk(fens):
+    return [analyze_fen(fen, _depth, _search) for fen in fens]
+
+
+def analyze_fen(fen, depth=None, search=None):
+    # (fen, legal move count, status, score) where status is ok, check,
+    # checkmate, stalemate or invalid. The score is from the side to move's
+    # point of view: None without a depth, the static evaluation at depth 0
+    # and a search result otherwise. Only the search needs rules.Position,
+    # the rest runs on the faster bitboard move generator.
+    try:
+        position = (Position if depth else BitboardPosition).from_fen(fen)
+    except ValueError:
+        return fen, 0, "invalid", None
+
+    legal = len(position.legal_moves())
+    in_check = position.is_in_check(position.turn[0])
+    if not legal:
+        return fen, 0, "checkmate" if in_check else "stalemate", None
+
+    score = None
+    if depth == 0:
+        score = evaluate(position)
+    elif depth:
+        score = search.search(position, depth=depth).score
+    return fen, legal, "check" if in_check else "ok", score
+
+
+def epd_fen(line):
+    # The FEN part of a FEN or EPD line: placement, side, castling and en
+    # passant, plus the move counters when they are there. EPD operations
+    # such as "bm Qg6; id ..." are dropped.
+    fields = line.split(";")[0].split()
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        return " ".join(fields[:6])
+    return " ".join(fields[:4])
+
+
+def read_fens(lines):
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield epd_fen(line)
+
+
+def analyze(fens, workers=None, depth=None, hash_mb=16, chunk_size=CHUNK_SIZE):
+    # Yields analyze_fen results in input order, keeping only a few chunks per
+    # worker in flight so memory stays flat on inputs of any length
+    workers = workers or os.cpu_count() or 1
+    fens = iter(fens)
+    pending = deque()
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(depth, hash_mb)) as pool:
+        while True:
+            while len(pending) < workers * CHUNKS_PER_WORKER:
+                chunk = list(itertools.islice(fens, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_analyze_chunk, chunk))
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+
+def format_result(result):
+    fen, legal, status, score = result
+    return f"{fen}\t{legal}\t{status}\t{'-' if score is None else score}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Count legal moves and find checks, mates and stalemates for a file of FENs"
+    )
+    parser.add_argument("input", help="FEN or EPD file, - for stdin")
+    parser.add_argument("-o", "--output", help="results file, stdout by default")
+    parser.add_argument(
+        "--depth", type=int, help="also score each position, 0 for the static evaluation"
+    )
+    parser.add_argument("--workers", type=int, help="worker processes, default one per core")
+    parser.add_argument("--hash", type=int, default=16, help="MB of hash per worker")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output = open(args.output, "w") if args.output else sys.stdout
+
+    started = time.perf_counter()
+    count = invalid = 0
+    try:
+        results = analyze(read_fens(source), args.workers, args.depth, args.hash, args.chunk_size)
+        for result in results:
+            output.write(format_result(result) + "\n")
+            count += 1
+            invalid += result[2] == "invalid"
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"{count} positions ({invalid} invalid) in {elapsed:.2f}s, "
+        f"{count / elapsed if elapsed else 0:.0f} positions/s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import argparse
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bitboard import PIECE_INDEX, SQUARES
+from evaluation import (
+    DOUBLED_PAWN,
+    ISOLATED_PAWN,
+    MOBILITY_WEIGHTS,
+    PASSED_PAWN,
+    SQUARE_SCORES,
+    evaluate_full,
+)
+from rules import (
+    BISHOP_DIRECTIONS,
+    EMPTY_SQUARE,
+    KNIGHT_TARGETS,
+    ROOK_DIRECTIONS,
+    STARTING_FEN,
+    Position,
+)
+
+# Boards are packed as K x 64 int8 codes, 0 for an empty square and
+# PIECE_INDEX + 1 otherwise, squares in y * 8 + x order like the bitboards
+CODES = {EMPTY_SQUARE: 0}
+CODES.update({piece: index + 1 for piece, index in PIECE_INDEX.items()})
+# Positions scored per block, bounds the temporary ray arrays to a few MB
+BLOCK_SIZE = 4096
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("batch evaluation needs numpy, pip install numpy")
+
+
+def _build_tables():
+    # Tables indexed by piece code, row 0 being the empty square
+    _require_numpy()
+    tables = {}
+
+    square_scores = np.zeros((13, 64), dtype=np.int32)
+    for piece, code in CODES.items():
+        if code:
+            square_scores[code] = SQUARE_SCORES[piece]
+    tables["square_scores"] = square_scores
+
+    # Knight target squares padded with 64, a square that is never empty
+    knight_targets = np.full((64, 8), 64, dtype=np.intp)
+    for sq, square in enumerate(SQUARES):
+        for index, (tx, ty) in enumerate(KNIGHT_TARGETS[square]):
+            knight_targets[sq, index] = ty * 8 + tx
+    tables["knight_targets"] = knight_targets
+
+    # Ray squares per square and direction, padded the same way so every ray
+    # can be read as 8 squares
+    rays = np.full((64, 8, 8), 64, dtype=np.intp)
+    for sq, (x, y) in enumerate(SQUARES):
+        for direction, (dx, dy) in enumerate(ROOK_DIRECTIONS + BISHOP_DIRECTIONS):
+            step = 0
+            cx, cy = x + dx, y + dy
+            while 0 <= cx <= 7 and 0 <= cy <= 7:
+                rays[sq, direction, step] = cy * 8 + cx
+                step += 1
+                cx += dx
+                cy += dy
+    tables["rays"] = rays
+
+    # Signed mobility weights for knight, rook-line and bishop-line moves
+    knight = np.zeros(13, dtype=np.int32)
+    straight = np.zeros(13, dtype=np.int32)
+    diagonal = np.zeros(13, dtype=np.int32)
+    for piece, code in CODES.items():
+        if not code or piece[1] not in MOBILITY_WEIGHTS:
+            continue
+        weight = MOBILITY_WEIGHTS[piece[1]] * (1 if piece[0] == "w" else -1)
+        if piece[1] == "n":
+            knight[code] = weight
+        if piece[1] in "rq":
+            straight[code] = weight
+        if piece[1] in "bq":
+            diagonal[code] = weight
+    tables["knight_weights"] = knight
+    tables["straight_weights"] = straight
+    tables["diagonal_weights"] = diagonal
+    tables["mobile"] = (knight != 0) | (straight != 0) | (diagonal != 0)
+
+    tables["rows"] = np.arange(8).reshape(1, 8, 1)
+    # Passed pawn bonus by row, for white pawns advancing up and black down
+    tables["white_passed"] = np.array([PASSED_PAWN[7 - y] for y in range(8)]).reshape(1, 8, 1)
+    tables["black_passed"] = np.array(PASSED_PAWN).reshape(1, 8, 1)
+    return tables
+
+
+_tables = None
+
+
+def tables():
+    global _tables
+    if _tables is None:
+        _tables = _build_tables()
+    return _tables
+
+
+def pack_boards(boards):
+    # K boards as board[y][x] lists -> K x 64 int8 codes
+    _require_numpy()
+    boards = list(boards)
+    codes = np.zeros((len(boards), 64), dtype=np.int8)
+    for index, board in enumerate(boards):
+        codes[index] = [CODES[piece] for row in board for piece in row]
+    return codes
+
+
+def pack_positions(positions):
+    # (codes, side) where side is 1 for white to move and -1 for black
+    _require_numpy()
+    positions = list(positions)
+    codes = pack_boards(position.board for position in positions)
+    side = np.array([1 if p.turn == "white" else -1 for p in positions], dtype=np.int32)
+    return codes, side
+
+
+def _neighbour_min(values, fill):
+    # Smallest value on each file and the files either side of it
+    padded = np.pad(values, ((0, 0), (1, 1)), constant_values=fill)
+    return np.minimum(np.minimum(padded[:, :-2], padded[:, 1:-1]), padded[:, 2:])
+
+
+def pawn_structure(codes):
+    t = tables()
+    rows = t["rows"]
+    white = (codes == CODES["wp"]).reshape(-1, 8, 8)
+    black = (codes == CODES["bp"]).reshape(-1, 8, 8)
+    score = np.zeros(len(codes), dtype=np.int32)
+
+    for pawns, sign in ((white, 1), (black, -1)):
+        counts = pawns.sum(axis=1)
+        padded = np.pad(counts, ((0, 0), (1, 1)))
+        isolated = (padded[:, :-2] == 0) & (padded[:, 2:] == 0)
+        score -= sign * DOUBLED_PAWN * np.maximum(counts - 1, 0).sum(axis=1)
+        score -= sign * ISOLATED_PAWN * (counts * isolated).sum(axis=1)
+
+    # A white pawn is passed when every black pawn near its file is on its row
+    # or behind it, the frontmost black pawn per file decides
+    black_front = np.where(black, rows, 8).min(axis=1)
+    white_passed = white & (_neighbour_min(black_front, 8)[:, None, :] >= rows)
+    score += (white_passed * t["white_passed"]).sum(axis=(1, 2))
+
+    # Mirrored for black, on negated rows so the same minimum helper works
+    white_front = np.where(white, -rows, 1).min(axis=1)
+    black_passed = black & (_neighbour_min(white_front, 1)[:, None, :] >= -rows)
+    score -= (black_passed * t["black_passed"]).sum(axis=(1, 2))
+
+    return score
+
+
+def mobility(codes):
+    t = tables()
+    pieces = codes.astype(np.intp)
+    empty = np.pad(codes == 0, ((0, 0), (0, 1)))
+
+    # Only the squares holding a knight, bishop, rook or queen are looked at
+    boards, squares = np.nonzero(t["mobile"][pieces])
+    kinds = pieces[boards, squares]
+
+    knight = empty[boards[:, None], t["knight_targets"][squares]].sum(axis=1)
+
+    # Empty squares reached along each ray, the index of the first piece on
+    # it, which the padding square guarantees exists
+    blocked = ~empty[boards[:, None, None], t["rays"][squares]]
+    reach = blocked.argmax(axis=2)
+    straight = reach[:, :4].sum(axis=1)
+    diagonal = reach[:, 4:].sum(axis=1)
+
+    weights = (
+        t["knight_weights"][kinds] * knight
+        + t["straight_weights"][kinds] * straight
+        + t["diagonal_weights"][kinds] * diagonal
+    )
+    return np.bincount(boards, weights, minlength=len(codes)).astype(np.int32)
+
+
+def evaluate_codes(codes):
+    # White-relative scores for K x 64 codes, equal to evaluate_board_full per board
+    t = tables()
+    scores = np.empty(len(codes), dtype=np.int32)
+    for start in range(0, len(codes), BLOCK_SIZE):
+        block = codes[start : start + BLOCK_SIZE]
+        material = t["square_scores"][block.astype(np.intp), np.arange(64)].sum(axis=1)
+        scores[start : start + BLOCK_SIZE] = material + mobility(block) + pawn_structure(block)
+    return scores
+
+
+def evaluate_positions(positions):
+    # Side to move relative scores, equal to evaluate_full per position
+    codes, side = pack_positions(positions)
+    return evaluate_codes(codes) * side
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a file of FENs in one batch")
+    parser.add_argument("fens", nargs="?", help="file of FENs, one per line")
+    parser.add_argument("--check", action="store_true", help="compare with evaluate_full()")
+    args = parser.parse_args(argv)
+
+    if args.fens:
+        with open(args.fens) as fens:
+            lines = [line.strip() for line in fens if line.strip()]
+    else:
+        lines = [STARTING_FEN]
+    positions = [Position.from_fen(fen) for fen in lines]
+
+    started = time.perf_counter()
+    scores = evaluate_positions(positions)
+    elapsed = time.perf_counter() - started
+
+    mismatches = 0
+    for fen, position, score in zip(lines, positions, scores):
+        line = f"{fen}: {score}"
+        if args.check:
+            expected = evaluate_full(position)
+            if expected != score:
+                mismatches += 1
+                line += f" MISMATCH (scalar {expected})"
+        print(line)
+
+    print(
+        f"{len(positions)} positions in {elapsed:.3f}s "
+        f"({len(positions) / elapsed if elapsed else 0:.0f} per second)",
+        file=sys.stderr,
+    )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
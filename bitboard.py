@@ -0,0 +1,645 @@
+from rules import (
+    BISHOP_DIRECTIONS,
+    CASTLING_RIGHTS,
+    EMPTY_POSITION,
+    EMPTY_SQUARE,
+    KING_OFFSETS,
+    KNIGHT_OFFSETS,
+    PROMOTIONS,
+    ROOK_DIRECTIONS,
+    parse_fen,
+    starting_board,
+)
+from zobrist import BLACK_TO_MOVE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS, PIECE_KEYS
+
+# Squares are indexed y * 8 + x, so a8 is 0 and h1 is 63, matching board[y][x]
+SQUARES = [(sq % 8, sq // 8) for sq in range(64)]
+BITS = [1 << sq for sq in range(64)]
+FULL = (1 << 64) - 1
+FILE_A = sum(BITS[y * 8] for y in range(8))
+FILE_H = FILE_A << 7
+# Where pawns promote, rank 8 then rank 1
+PROMOTION_SQUARES = 0xFF | 0xFF << 56
+# Single pushes that land here can go one further, rank 3 for white, 6 for black
+DOUBLE_PUSH_RANKS = [0xFF << 40, 0xFF << 16]
+
+PIECES = ["wp", "wn", "wb", "wr", "wq", "wk", "bp", "bn", "bb", "br", "bq", "bk"]
+PIECE_INDEX = {piece: index for index, piece in enumerate(PIECES)}
+COLOR_INDEX = {"w": 0, "b": 1}
+
+
+def _step_attacks(offsets):
+    table = []
+    for x, y in SQUARES:
+        mask = 0
+        for dx, dy in offsets:
+            if 0 <= x + dx <= 7 and 0 <= y + dy <= 7:
+                mask |= BITS[(y + dy) * 8 + x + dx]
+        table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _step_attacks(KNIGHT_OFFSETS)
+KING_ATTACKS = _step_attacks(KING_OFFSETS)
+# PAWN_ATTACKS[color][sq]: squares a pawn of that color on sq attacks
+PAWN_ATTACKS = [_step_attacks(((-1, -1), (1, -1))), _step_attacks(((-1, 1), (1, 1)))]
+
+
+def _line_table(directions):
+    # For each square, map every occupancy of the line's inner squares to the
+    # attacked squares, so a slider lookup is one mask and one dict access
+    masks = []
+    tables = []
+
+    for x, y in SQUARES:
+        rays = []
+        mask = 0
+        for dx, dy in directions:
+            ray = []
+            cx, cy = x + dx, y + dy
+            while 0 <= cx <= 7 and 0 <= cy <= 7:
+                ray.append(cy * 8 + cx)
+                cx += dx
+                cy += dy
+            rays.append(ray)
+            for sq in ray[:-1]:
+                mask |= BITS[sq]
+
+        table = {}
+        subset = 0
+        while True:
+            attacks = 0
+            for ray in rays:
+                for sq in ray:
+                    attacks |= BITS[sq]
+                    if subset & BITS[sq]:
+                        break
+            table[subset] = attacks
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+
+        masks.append(mask)
+        tables.append(table)
+
+    return masks, tables
+
+
+RANK_MASKS, RANK_ATTACKS = _line_table(((1, 0), (-1, 0)))
+FILE_MASKS, FILE_ATTACKS = _line_table(((0, 1), (0, -1)))
+DIAGONAL_MASKS, DIAGONAL_ATTACKS = _line_table(((1, 1), (-1, -1)))
+ANTI_DIAGONAL_MASKS, ANTI_DIAGONAL_ATTACKS = _line_table(((1, -1), (-1, 1)))
+
+
+def rook_attacks(sq, occupied):
+    return (
+        RANK_ATTACKS[sq][occupied & RANK_MASKS[sq]]
+        | FILE_ATTACKS[sq][occupied & FILE_MASKS[sq]]
+    )
+
+
+def bishop_attacks(sq, occupied):
+    return (
+        DIAGONAL_ATTACKS[sq][occupied & DIAGONAL_MASKS[sq]]
+        | ANTI_DIAGONAL_ATTACKS[sq][occupied & ANTI_DIAGONAL_MASKS[sq]]
+    )
+
+
+def _between_table():
+    # BETWEEN[a][b]: squares strictly between a and b when they share a line
+    table = [[0] * 64 for _ in range(64)]
+    for sq, (x, y) in enumerate(SQUARES):
+        for dx, dy in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            between = 0
+            cx, cy = x + dx, y + dy
+            while 0 <= cx <= 7 and 0 <= cy <= 7:
+                table[sq][cy * 8 + cx] = between
+                between |= BITS[cy * 8 + cx]
+                cx += dx
+                cy += dy
+    return table
+
+
+BETWEEN = _between_table()
+
+
+def iter_bits(bitboard):
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+
+CASTLING_SQUARES = {y * 8 + x: rights for (x, y), rights in CASTLING_RIGHTS.items()}
+
+# (right, king path squares that must be empty, squares the king crosses, king target)
+CASTLING_PATHS = {
+    "w": (
+        ("K", BITS[61] | BITS[62], (61, 62), 62),
+        ("Q", BITS[57] | BITS[58] | BITS[59], (59, 58), 58),
+    ),
+    "b": (
+        ("k", BITS[5] | BITS[6], (5, 6), 6),
+        ("q", BITS[1] | BITS[2] | BITS[3], (3, 2), 2),
+    ),
+}
+
+
+class BitboardPosition:
+    def __init__(self, board=None, turn="white"):
+        board = starting_board() if board is None else board
+
+        self.pieces = [0] * 12
+        self.mailbox = [piece for row in board for piece in row]
+        for sq, piece in enumerate(self.mailbox):
+            if piece != EMPTY_SQUARE:
+                self.pieces[PIECE_INDEX[piece]] |= BITS[sq]
+
+        self.occupied = [0, 0]
+        self.update_occupancy()
+
+        self.turn = turn
+        self.castling = "KQkq"
+        self.ep_square = -1
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.undo_stack = []
+        self.hash = self.full_hash()
+
+    @classmethod
+    def from_fen(cls, fen):
+        board, turn, castling, en_passant, halfmove_clock, fullmove_number = parse_fen(fen)
+        position = cls(board, turn)
+        if position.is_in_check("b" if turn == "white" else "w"):
+            raise ValueError(f"Invalid FEN, the side not to move is in check: {fen!r}")
+
+        position.castling = castling
+        position.en_passant = en_passant
+        position.halfmove_clock = halfmove_clock
+        position.fullmove_number = fullmove_number
+        position.hash = position.full_hash()
+        return position
+
+    @classmethod
+    def from_position(cls, position):
+        bitboard_position = cls(position.board, position.turn)
+        bitboard_position.castling = position.castling
+        bitboard_position.en_passant = position.en_passant
+        bitboard_position.halfmove_clock = position.halfmove_clock
+        bitboard_position.fullmove_number = position.fullmove_number
+        bitboard_position.hash = bitboard_position.full_hash()
+        return bitboard_position
+
+    def full_hash(self):
+        # The same key as zobrist.hash_position, without building board
+        key = 0
+        for sq, piece in enumerate(self.mailbox):
+            if piece != EMPTY_SQUARE:
+                key ^= PIECE_KEYS[piece][sq]
+        for right in self.castling:
+            key ^= CASTLING_KEYS[right]
+        if self.ep_square >= 0:
+            key ^= EN_PASSANT_KEYS[self.ep_square % 8]
+        if self.turn == "black":
+            key ^= BLACK_TO_MOVE_KEY
+        return key
+
+    @property
+    def board(self):
+        return [self.mailbox[y * 8 : y * 8 + 8] for y in range(8)]
+
+    @property
+    def kings(self):
+        kings = {}
+        for color, index in (("w", 5), ("b", 11)):
+            king = self.pieces[index]
+            kings[color] = SQUARES[king.bit_length() - 1] if king else EMPTY_POSITION
+        return kings
+
+    def update_occupancy(self):
+        self.occupied[0] = 0
+        self.occupied[1] = 0
+        for index in range(6):
+            self.occupied[0] |= self.pieces[index]
+            self.occupied[1] |= self.pieces[index + 6]
+        self.all_occupied = self.occupied[0] | self.occupied[1]
+
+    def attackers_to(self, sq, by_color, occupied=None):
+        occupied = self.all_occupied if occupied is None else occupied
+        pieces = self.pieces
+        offset = 0 if by_color == "w" else 6
+        queens = pieces[offset + 4]
+
+        return (
+            (PAWN_ATTACKS[1 - COLOR_INDEX[by_color]][sq] & pieces[offset])
+            | (KNIGHT_ATTACKS[sq] & pieces[offset + 1])
+            | (KING_ATTACKS[sq] & pieces[offset + 5])
+            | (bishop_attacks(sq, occupied) & (pieces[offset + 2] | queens))
+            | (rook_attacks(sq, occupied) & (pieces[offset + 3] | queens))
+        )
+
+    def is_square_attacked(self, square, by_color):
+        return self.attackers_to(square[1] * 8 + square[0], by_color) != 0
+
+    def is_in_check(self, color):
+        king = self.pieces[5 if color == "w" else 11]
+        if not king:
+            return False
+
+        return self.attackers_to(king.bit_length() - 1, "b" if color == "w" else "w") != 0
+
+    def piece_targets(self, sq):
+        piece = self.mailbox[sq]
+        color = piece[0]
+        kind = piece[1]
+        own = self.occupied[COLOR_INDEX[color]]
+        enemy = self.occupied[1 - COLOR_INDEX[color]]
+        occupied = self.all_occupied
+
+        if kind == "p":
+            empty = ~occupied & FULL
+            if color == "w":
+                single = BITS[sq - 8] & empty if sq >= 8 else 0
+                double = BITS[sq - 16] & empty if single and sq >= 48 else 0
+            else:
+                single = BITS[sq + 8] & empty if sq < 56 else 0
+                double = BITS[sq + 16] & empty if single and sq < 16 else 0
+
+            captures = enemy
+            # The en passant square only belongs to the side to move
+            if self.ep_square >= 0 and color == self.turn[0]:
+                captures |= BITS[self.ep_square]
+
+            return single | double | (PAWN_ATTACKS[COLOR_INDEX[color]][sq] & captures)
+
+        if kind == "n":
+            targets = KNIGHT_ATTACKS[sq]
+        elif kind == "b":
+            targets = bishop_attacks(sq, occupied)
+        elif kind == "r":
+            targets = rook_attacks(sq, occupied)
+        elif kind == "q":
+            targets = bishop_attacks(sq, occupied) | rook_attacks(sq, occupied)
+        else:
+            targets = KING_ATTACKS[sq] | self.castling_targets(color)
+
+        return targets & ~own
+
+    def castling_targets(self, color):
+        targets = 0
+        if not self.castling:
+            return targets
+
+        opp_color = "b" if color == "w" else "w"
+        king_sq = 60 if color == "w" else 4
+        rook = self.pieces[3 if color == "w" else 9]
+
+        if self.mailbox[king_sq] != color + "k" or self.attackers_to(king_sq, opp_color):
+            return targets
+
+        for right, empty, path, target in CASTLING_PATHS[color]:
+            if right not in self.castling or self.all_occupied & empty:
+                continue
+            rook_sq = king_sq + 3 if target > king_sq else king_sq - 4
+            if not rook & BITS[rook_sq]:
+                continue
+            if any(self.attackers_to(sq, opp_color) for sq in path):
+                continue
+            targets |= BITS[target]
+
+        return targets
+
+    def pseudo_moves(self):
+        # (from_sq, to_sq, promotion) for every pseudo-legal move of the side to move
+        moves = []
+        color = self.turn[0]
+        promotion_rank = 8 if color == "w" else 48
+        mailbox = self.mailbox
+
+        for from_sq in iter_bits(self.occupied[COLOR_INDEX[color]]):
+            targets = self.piece_targets(from_sq)
+            if mailbox[from_sq][1] == "p" and promotion_rank <= from_sq < promotion_rank + 8:
+                for to_sq in iter_bits(targets):
+                    for promotion in PROMOTIONS:
+                        moves.append((from_sq, to_sq, promotion))
+            else:
+                for to_sq in iter_bits(targets):
+                    moves.append((from_sq, to_sq, None))
+
+        return moves
+
+    def generate_moves(self, pos):
+        sq = pos[1] * 8 + pos[0]
+        if self.mailbox[sq] == EMPTY_SQUARE:
+            return []
+
+        moves = [SQUARES[target] for target in iter_bits(self.piece_targets(sq))]
+        return self.filter_illegal_moves(pos, moves)
+
+    def filter_illegal_moves(self, pos, moves):
+        legal_moves = []
+        from_sq = pos[1] * 8 + pos[0]
+        color = self.mailbox[from_sq][0]
+
+        for move in moves:
+            self.make(from_sq, move[1] * 8 + move[0])
+
+            if not self.is_in_check(color):
+                legal_moves.append(move)
+
+            self.unmake()
+
+        return legal_moves
+
+    def legal_moves(self, color=None):
+        return [
+            (SQUARES[from_sq], SQUARES[to_sq], promotion)
+            for from_sq, to_sq, promotion in self.generate_legal(color)
+        ]
+
+    def has_legal_moves(self, color=None):
+        return bool(self.generate_legal(color))
+
+    def generate_legal(self, color=None):
+        # (from_sq, to_sq, promotion) for every legal move of color, the side
+        # to move by default. Pieces are masked down to their legal targets
+        # first, so nothing but en passant is played to test it.
+        color = color or self.turn[0]
+        opp_color = "b" if color == "w" else "w"
+        us = COLOR_INDEX[color]
+        offset = 6 * us
+        opp_offset = 6 - offset
+        pieces = self.pieces
+        own = self.occupied[us]
+        enemy = self.occupied[1 - us]
+        occupied = self.all_occupied
+        king_bit = pieces[offset + 5]
+        king_sq = king_bit.bit_length() - 1
+        moves = []
+        append = moves.append
+
+        # The king can't hide from a slider by stepping along its ray
+        without_king = occupied ^ king_bit
+        targets = KING_ATTACKS[king_sq] & ~own
+        while targets:
+            low = targets & -targets
+            targets ^= low
+            to_sq = low.bit_length() - 1
+            if not self.attackers_to(to_sq, opp_color, without_king):
+                append((king_sq, to_sq, None))
+
+        checkers = self.attackers_to(king_sq, opp_color)
+        if checkers & (checkers - 1):
+            return moves
+
+        if checkers:
+            evasions = BETWEEN[king_sq][checkers.bit_length() - 1] | checkers
+        else:
+            evasions = FULL
+            for to_sq in iter_bits(self.castling_targets(color)):
+                append((king_sq, to_sq, None))
+
+        # Enemy sliders that would see the king through exactly one of our
+        # pieces, which may then only move along that line
+        pins = {}
+        queens = pieces[opp_offset + 4]
+        snipers = (rook_attacks(king_sq, enemy) & (pieces[opp_offset + 3] | queens)) | (
+            bishop_attacks(king_sq, enemy) & (pieces[opp_offset + 2] | queens)
+        )
+        for sniper in iter_bits(snipers):
+            between = BETWEEN[king_sq][sniper] & occupied
+            if between and not between & (between - 1) and between & own:
+                pins[between.bit_length() - 1] = BETWEEN[king_sq][sniper] | BITS[sniper]
+
+        # Pawns move as whole sets, each paired with the distance back to the
+        # square the pawn came from
+        pawns = pieces[offset]
+        empty = ~occupied & FULL
+        if us == 0:
+            single = (pawns >> 8) & empty
+            double = ((single & DOUBLE_PUSH_RANKS[0]) >> 8) & empty
+            pawn_targets = (
+                (single, 8),
+                (double, 16),
+                (((pawns & ~FILE_A) >> 9) & enemy, 9),
+                (((pawns & ~FILE_H) >> 7) & enemy, 7),
+            )
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & DOUBLE_PUSH_RANKS[1]) << 8) & empty
+            pawn_targets = (
+                (single, -8),
+                (double, -16),
+                (((pawns & ~FILE_A) << 7) & enemy, -7),
+                (((pawns & ~FILE_H) << 9) & enemy, -9),
+            )
+
+        for targets, back in pawn_targets:
+            targets &= evasions
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                to_sq = low.bit_length() - 1
+                from_sq = to_sq + back
+                if from_sq in pins and not pins[from_sq] & low:
+                    continue
+                if low & PROMOTION_SQUARES:
+                    for promotion in PROMOTIONS:
+                        append((from_sq, to_sq, promotion))
+                else:
+                    append((from_sq, to_sq, None))
+
+        # En passant can uncover the king along the rank, so play it to test it
+        ep_square = self.ep_square
+        if ep_square >= 0 and color == self.turn[0]:
+            for from_sq in iter_bits(PAWN_ATTACKS[1 - us][ep_square] & pawns):
+                self.make(from_sq, ep_square)
+                legal = not self.is_in_check(color)
+                self.unmake()
+                if legal:
+                    append((from_sq, ep_square, None))
+
+        allowed = ~own & evasions
+        for index in range(offset + 1, offset + 5):
+            for from_sq in iter_bits(pieces[index]):
+                if index == offset + 1:
+                    targets = KNIGHT_ATTACKS[from_sq]
+                elif index == offset + 2:
+                    targets = bishop_attacks(from_sq, occupied)
+                elif index == offset + 3:
+                    targets = rook_attacks(from_sq, occupied)
+                else:
+                    targets = bishop_attacks(from_sq, occupied) | rook_attacks(from_sq, occupied)
+
+                targets &= allowed
+                if from_sq in pins:
+                    targets &= pins[from_sq]
+                while targets:
+                    low = targets & -targets
+                    targets ^= low
+                    append((from_sq, low.bit_length() - 1, None))
+
+        return moves
+
+    def is_checkmate(self, color):
+        return self.is_in_check(color) and not self.has_legal_moves(color)
+
+    def is_stalemate(self, color):
+        return not self.is_in_check(color) and not self.has_legal_moves(color)
+
+    @property
+    def en_passant(self):
+        return EMPTY_POSITION if self.ep_square < 0 else SQUARES[self.ep_square]
+
+    @en_passant.setter
+    def en_passant(self, square):
+        self.ep_square = -1 if square == EMPTY_POSITION else square[1] * 8 + square[0]
+
+    def make_move(self, start, end, promotion=None):
+        self.make(start[1] * 8 + start[0], end[1] * 8 + end[0], promotion)
+
+    def unmake_move(self):
+        self.unmake()
+
+    def make(self, from_sq, to_sq, promotion=None):
+        pieces = self.pieces
+        mailbox = self.mailbox
+        occupied = self.occupied
+        piece = mailbox[from_sq]
+        color = COLOR_INDEX[piece[0]]
+        capture_sq = to_sq
+
+        if to_sq == self.ep_square and piece[1] == "p":
+            # En passant, the captured pawn sits beside the start square
+            capture_sq = to_sq + 8 if color == 0 else to_sq - 8
+
+        captured = mailbox[capture_sq]
+        key = self.hash
+
+        self.undo_stack.append(
+            (
+                from_sq,
+                to_sq,
+                piece,
+                captured,
+                capture_sq,
+                self.castling,
+                self.ep_square,
+                self.halfmove_clock,
+                key,
+            )
+        )
+
+        if captured != EMPTY_SQUARE:
+            pieces[PIECE_INDEX[captured]] ^= BITS[capture_sq]
+            occupied[1 - color] ^= BITS[capture_sq]
+            mailbox[capture_sq] = EMPTY_SQUARE
+            key ^= PIECE_KEYS[captured][capture_sq]
+
+        if self.ep_square >= 0:
+            key ^= EN_PASSANT_KEYS[self.ep_square % 8]
+            self.ep_square = -1
+
+        placed = piece
+
+        if piece[1] == "p":
+            if to_sq - from_sq == 16 or from_sq - to_sq == 16:
+                self.set_en_passant(to_sq, piece[0])
+                if self.ep_square >= 0:
+                    key ^= EN_PASSANT_KEYS[to_sq % 8]
+            elif to_sq < 8 or to_sq >= 56:
+                placed = piece[0] + (promotion or "q")
+
+        elif piece[1] == "k" and (to_sq - from_sq == 2 or from_sq - to_sq == 2):
+            rook_from, rook_to = (
+                (from_sq + 3, from_sq + 1) if to_sq > from_sq else (from_sq - 4, from_sq - 1)
+            )
+            rook = mailbox[rook_from]
+            pieces[PIECE_INDEX[rook]] ^= BITS[rook_from] | BITS[rook_to]
+            occupied[color] ^= BITS[rook_from] | BITS[rook_to]
+            mailbox[rook_to] = rook
+            mailbox[rook_from] = EMPTY_SQUARE
+            key ^= PIECE_KEYS[rook][rook_from] ^ PIECE_KEYS[rook][rook_to]
+
+        key ^= PIECE_KEYS[piece][from_sq] ^ PIECE_KEYS[placed][to_sq]
+        pieces[PIECE_INDEX[piece]] ^= BITS[from_sq]
+        pieces[PIECE_INDEX[placed]] |= BITS[to_sq]
+        occupied[color] ^= BITS[from_sq] | BITS[to_sq]
+        self.all_occupied = occupied[0] | occupied[1]
+        mailbox[from_sq] = EMPTY_SQUARE
+        mailbox[to_sq] = placed
+
+        if self.castling:
+            for sq in (from_sq, to_sq):
+                if sq in CASTLING_SQUARES:
+                    for right in CASTLING_SQUARES[sq]:
+                        if right in self.castling:
+                            key ^= CASTLING_KEYS[right]
+                            self.castling = self.castling.replace(right, "")
+
+        if piece[1] == "p" or captured != EMPTY_SQUARE:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+
+        if color:
+            self.fullmove_number += 1
+        self.turn = "black" if color == 0 else "white"
+        self.hash = key ^ BLACK_TO_MOVE_KEY
+
+    def set_en_passant(self, to_sq, color):
+        # Only record the square when an enemy pawn can actually take
+        enemy_pawns = self.pieces[6 if color == "w" else 0]
+        x = to_sq % 8
+        neighbours = (BITS[to_sq - 1] if x > 0 else 0) | (BITS[to_sq + 1] if x < 7 else 0)
+        if enemy_pawns & neighbours:
+            self.ep_square = to_sq + 8 if color == "w" else to_sq - 8
+
+    def unmake(self):
+        (
+            from_sq,
+            to_sq,
+            piece,
+            captured,
+            capture_sq,
+            castling,
+            ep_square,
+            halfmove_clock,
+            key,
+        ) = self.undo_stack.pop()
+        pieces = self.pieces
+        mailbox = self.mailbox
+        occupied = self.occupied
+        color = COLOR_INDEX[piece[0]]
+
+        self.turn = "white" if color == 0 else "black"
+        if color:
+            self.fullmove_number -= 1
+
+        placed = mailbox[to_sq]
+        pieces[PIECE_INDEX[placed]] ^= BITS[to_sq]
+        pieces[PIECE_INDEX[piece]] |= BITS[from_sq]
+        occupied[color] ^= BITS[from_sq] | BITS[to_sq]
+        mailbox[to_sq] = EMPTY_SQUARE
+        mailbox[from_sq] = piece
+
+        if captured != EMPTY_SQUARE:
+            pieces[PIECE_INDEX[captured]] |= BITS[capture_sq]
+            occupied[1 - color] |= BITS[capture_sq]
+            mailbox[capture_sq] = captured
+
+        if piece[1] == "k" and (to_sq - from_sq == 2 or from_sq - to_sq == 2):
+            rook_from, rook_to = (
+                (from_sq + 3, from_sq + 1) if to_sq > from_sq else (from_sq - 4, from_sq - 1)
+            )
+            rook = mailbox[rook_to]
+            pieces[PIECE_INDEX[rook]] ^= BITS[rook_from] | BITS[rook_to]
+            occupied[color] ^= BITS[rook_from] | BITS[rook_to]
+            mailbox[rook_from] = rook
+            mailbox[rook_to] = EMPTY_SQUARE
+
+        self.all_occupied = occupied[0] | occupied[1]
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        self.hash = key
@@ -0,0 +1,163 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+from notation import parse_san
+from pgn import read_games
+from rules import STARTING_FEN, Position, decode_move, encode_move, move_to_uci
+
+# Polyglot layout: big-endian (key, move, weight, learn) entries sorted by key,
+# with our zobrist keys and 16-bit move codes in place of Polyglot's own
+ENTRY = struct.Struct(">QHHI")
+MAX_WEIGHT = 0xFFFF
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size % ENTRY.size:
+            raise ValueError(f"{path} is not a book file")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.entries = size // ENTRY.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.entries
+
+    def key_at(self, entry):
+        return struct.unpack_from(">Q", self.data, entry * ENTRY.size)[0]
+
+    def entries_for(self, key):
+        # [(move code, weight)] stored for key
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        found = []
+        while low < self.entries:
+            entry_key, code, weight, _ = ENTRY.unpack_from(self.data, low * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((code, weight))
+            low += 1
+        return found
+
+    def moves(self, position):
+        # [(move, weight)] for the position, best first, skipping anything that
+        # isn't legal there in case of a key collision
+        legal = position.legal_moves()
+        found = []
+        for code, weight in self.entries_for(position.hash):
+            move = decode_move(code)
+            if move in legal:
+                found.append((move, weight))
+        found.sort(key=lambda item: item[1], reverse=True)
+        return found
+
+    def choose(self, position, rng=random, best=False):
+        # A book move picked in proportion to its weight, or the heaviest one,
+        # None once the game has left the book
+        found = [(move, weight) for move, weight in self.moves(position) if weight]
+        if not found:
+            return None
+        if best:
+            return found[0][0]
+        return rng.choices([move for move, _ in found], [weight for _, weight in found])[0]
+
+
+def build(pgn_paths, path, max_plies=20, min_games=1):
+    # Counts every move played in the first max_plies of the games, scoring
+    # 2 for the winner's moves, 1 for a draw and 0 for the loser's, and writes
+    # the entries seen in at least min_games games
+    scores = {}
+    games = 0
+
+    for pgn_path in pgn_paths:
+        with open(pgn_path, encoding="utf-8", errors="replace") as pgn:
+            for game in read_games(pgn):
+                if "FEN" in game.headers:
+                    continue
+                games += 1
+                position = Position()
+                points = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}.get(game.result, (1, 1))
+
+                for ply, san in enumerate(game.moves[:max_plies]):
+                    try:
+                        move = parse_san(position, san)
+                    except ValueError:
+                        break
+                    entry = (position.hash, encode_move(move))
+                    count, score = scores.get(entry, (0, 0))
+                    scores[entry] = (count + 1, score + points[ply % 2])
+                    position.make_move(*move)
+
+    kept = sorted(
+        (key, code, score) for (key, code), (count, score) in scores.items() if count >= min_games
+    )
+    # Scale down so the heaviest move still fits the 16-bit weight
+    heaviest = max((score for _, _, score in kept), default=0)
+    scale = MAX_WEIGHT / heaviest if heaviest > MAX_WEIGHT else 1
+
+    with open(path, "wb") as book:
+        for key, code, score in kept:
+            weight = int(score * scale)
+            # Moves that only ever lost get weight 0: probe still lists them but
+            # choose never plays them. Anything that scored keeps at least 1.
+            book.write(ENTRY.pack(key, code, max(weight, 1) if score else 0, 0))
+    return games, len(kept)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="make a book from PGN files")
+    build_parser.add_argument("book")
+    build_parser.add_argument("pgn", nargs="+")
+    build_parser.add_argument("--max-plies", type=int, default=20)
+    build_parser.add_argument("--min-games", type=int, default=1)
+
+    probe_parser = commands.add_parser("probe", help="list the book moves for a position")
+    probe_parser.add_argument("book")
+    probe_parser.add_argument("--fen", default=STARTING_FEN)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        games, entries = build(args.pgn, args.book, args.max_plies, args.min_games)
+        print(f"{entries} entries from {games} games")
+        return 0
+
+    with OpeningBook(args.book) as book:
+        position = Position.from_fen(args.fen)
+        started = time.perf_counter()
+        moves = book.moves(position)
+        elapsed = time.perf_counter() - started
+        for move, weight in moves:
+            print(f"{move_to_uci(move)} {weight}")
+        print(f"{len(moves)} moves in {elapsed * 1000:.3f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import queue
+import threading
+
+import pygame
+
+from parallel import pack_position, unpack_position
+
+# Posted when a search finishes, with request, move and result attributes
+ENGINE_MOVE = pygame.event.custom_type()
+
+
+class EngineWorker:
+    # Runs searches on a background thread so the event loop keeps drawing
+    # while the engine thinks. Every submit() returns a request id and the
+    # answer comes back as an ENGINE_MOVE event carrying the same id.
+    # Cancelled requests never post anything.
+    def __init__(self, search, event_type=ENGINE_MOVE):
+        self.search = search
+        self.event_type = event_type
+        self.requests = queue.Queue()
+        self.condition = threading.Condition()
+        self.last_request = 0
+        # Requests up to this id are cancelled
+        self.cancelled = 0
+        # Id of the search running now, None while idle
+        self.running = None
+        self.thread = threading.Thread(target=self.loop, name="engine", daemon=True)
+        self.thread.start()
+
+    def submit(self, position, movetime=None, depth=None, nodes=None):
+        # The search gets its own copy, the caller keeps using position
+        fen, move_codes = pack_position(position)
+        with self.condition:
+            self.last_request += 1
+            request = self.last_request
+        self.requests.put((request, fen, move_codes, movetime, depth, nodes))
+        return request
+
+    def cancel(self):
+        # Drops everything submitted so far and waits for a running search to
+        # unwind, so the caller may touch the search's tables afterwards
+        with self.condition:
+            self.cancelled = self.last_request
+            if self.running is not None:
+                self.search.stop()
+            while self.running is not None:
+                self.condition.wait()
+
+    def close(self):
+        self.cancel()
+        self.requests.put(None)
+        self.thread.join()
+
+    def loop(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+            request, fen, move_codes, movetime, depth, nodes = item
+
+            with self.condition:
+                if request <= self.cancelled:
+                    continue
+                self.running = request
+
+            try:
+                position = unpack_position(fen, move_codes)
+                result = self.search.search(
+                    position, depth=depth, movetime=movetime, nodes=nodes
+                )
+            finally:
+                with self.condition:
+                    self.running = None
+                    cancelled = request <= self.cancelled
+                    # Nothing is searching now, so a stop sent too late to
+                    # catch this search must not hit the next one
+                    self.search.stop_requested = False
+                    self.condition.notify_all()
+
+            if not cancelled:
+                pygame.event.post(
+                    pygame.event.Event(
+                        self.event_type, request=request, move=result.move, result=result
+                    )
+                )
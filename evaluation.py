@@ -0,0 +1,175 @@
+from rules import BISHOP_RAYS, EMPTY_SQUARE, KNIGHT_TARGETS, ROOK_RAYS
+
+PIECE_VALUES = {"p": 100, "n": 320, "b": 330, "r": 500, "q": 900, "k": 0}
+
+# Piece-square tables from white's side, a8 first, so index y * 8 + x
+PIECE_SQUARE_TABLES = {
+    "p": (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ),
+    "n": (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ),
+    "b": (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ),
+    "r": (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ),
+    "q": (
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ),
+    "k": (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ),
+}
+
+# Centipawns per empty square a piece attacks, sliders stop at the first piece
+MOBILITY_WEIGHTS = {"n": 4, "b": 4, "r": 2, "q": 1}
+DOUBLED_PAWN = 10
+ISOLATED_PAWN = 15
+# Passed pawn bonus by how many ranks the pawn has advanced
+PASSED_PAWN = (0, 10, 15, 25, 40, 60, 90, 0)
+
+
+def _square_scores():
+    # Material plus placement for every piece on every square, from white's view
+    scores = {}
+    for kind, table in PIECE_SQUARE_TABLES.items():
+        value = PIECE_VALUES[kind]
+        scores["w" + kind] = [value + table[sq] for sq in range(64)]
+        scores["b" + kind] = [-(value + table[(7 - sq // 8) * 8 + sq % 8]) for sq in range(64)]
+    return scores
+
+
+SQUARE_SCORES = _square_scores()
+
+
+def piece_mobility(board, x, y, kind):
+    if kind == "n":
+        return sum(board[ty][tx] == EMPTY_SQUARE for tx, ty in KNIGHT_TARGETS[(x, y)])
+
+    rays = ()
+    if kind in "rq":
+        rays += ROOK_RAYS[(x, y)]
+    if kind in "bq":
+        rays += BISHOP_RAYS[(x, y)]
+
+    count = 0
+    for ray in rays:
+        for tx, ty in ray:
+            if board[ty][tx] != EMPTY_SQUARE:
+                break
+            count += 1
+    return count
+
+
+def pawn_structure(pawns):
+    # pawns[color][x] lists the rows of that color's pawns on file x
+    score = 0
+    for color, sign in (("w", 1), ("b", -1)):
+        own = pawns[color]
+        enemy = pawns["b" if color == "w" else "w"]
+        for x in range(8):
+            rows = own[x]
+            if not rows:
+                continue
+            score -= sign * DOUBLED_PAWN * (len(rows) - 1)
+            if not (x > 0 and own[x - 1]) and not (x < 7 and own[x + 1]):
+                score -= sign * ISOLATED_PAWN * len(rows)
+
+            blockers = [y for file in range(max(x - 1, 0), min(x + 2, 8)) for y in enemy[file]]
+            for y in rows:
+                # Passed when no enemy pawn on this or a neighbouring file is ahead
+                if color == "w" and all(by >= y for by in blockers):
+                    score += PASSED_PAWN[7 - y]
+                elif color == "b" and all(by <= y for by in blockers):
+                    score -= PASSED_PAWN[y]
+    return score
+
+
+def evaluate_board(board):
+    # Score in centipawns, positive when white is better. Material and
+    # placement only, this is the one search calls at every leaf.
+    score = 0
+    for y in range(8):
+        row = board[y]
+        for x in range(8):
+            piece = row[x]
+            if piece != EMPTY_SQUARE:
+                score += SQUARE_SCORES[piece][y * 8 + x]
+    return score
+
+
+def evaluate(position):
+    # Score from the side to move's point of view, as negamax expects
+    score = evaluate_board(position.board)
+    return score if position.turn == "white" else -score
+
+
+def evaluate_board_full(board):
+    # evaluate_board plus mobility and pawn structure, too slow for search
+    # but what the batch evaluator in batch_eval.py computes
+    score = 0
+    pawns = {"w": [[] for _ in range(8)], "b": [[] for _ in range(8)]}
+    for y in range(8):
+        row = board[y]
+        for x in range(8):
+            piece = row[x]
+            if piece == EMPTY_SQUARE:
+                continue
+            score += SQUARE_SCORES[piece][y * 8 + x]
+            kind = piece[1]
+            if kind == "p":
+                pawns[piece[0]][x].append(y)
+            elif kind != "k":
+                mobility = MOBILITY_WEIGHTS[kind] * piece_mobility(board, x, y, kind)
+                score += mobility if piece[0] == "w" else -mobility
+    return score + pawn_structure(pawns)
+
+
+def evaluate_full(position):
+    score = evaluate_board_full(position.board)
+    return score if position.turn == "white" else -score
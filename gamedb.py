@@ -0,0 +1,385 @@
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+from notation import parse_san
+from pgn import PgnGame, PgnWriter, read_games
+from rules import (
+    EMPTY_POSITION,
+    EMPTY_SQUARE,
+    STARTING_FEN,
+    Position,
+    decode_move,
+    encode_move,
+)
+from zobrist import hash_position
+
+# A database is three files sharing a prefix:
+#   .games    magic, then game records back to back
+#   .offsets  one uint64 per game, where its record starts in .games
+#   .index    magic and entry count, then (hash, game, ply) entries sorted by hash
+GAMES_MAGIC = b"CHGAMES1"
+INDEX_MAGIC = b"CHINDEX1"
+
+# Game record: move count, tag bytes, result, then a position record for the
+# start, the tags and the 16-bit move codes
+GAME_HEADER = struct.Struct("<HHB")
+# Position record: 64 squares as 4-bit piece codes, flags (bit 0 black to
+# move, bits 1-4 KQkq), en passant file + 1 or 0, halfmove clock, fullmove number
+POSITION_RECORD = struct.Struct("<32sBBBH")
+INDEX_HEADER = struct.Struct("<8sQ")
+INDEX_ENTRY = struct.Struct("<QIH2x")
+
+RESULTS = ["*", "1-0", "0-1", "1/2-1/2"]
+RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+PIECES = [EMPTY_SQUARE, "wp", "wn", "wb", "wr", "wq", "wk", "bp", "bn", "bb", "br", "bq", "bk"]
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+CASTLING_FLAGS = "KQkq"
+# Index entries sorted in memory at once before spilling a run to disk
+RUN_ENTRIES = 1 << 20
+
+
+def pack_position(position):
+    squares = [PIECE_CODES[piece] for row in position.board for piece in row]
+    board = bytes(squares[sq] | squares[sq + 1] << 4 for sq in range(0, 64, 2))
+
+    flags = 1 if position.turn == "black" else 0
+    for bit, right in enumerate(CASTLING_FLAGS):
+        if right in position.castling:
+            flags |= 2 << bit
+    en_passant = 0 if position.en_passant == EMPTY_POSITION else position.en_passant[0] + 1
+
+    return POSITION_RECORD.pack(
+        board,
+        flags,
+        en_passant,
+        min(position.halfmove_clock, 255),
+        position.fullmove_number,
+    )
+
+
+def unpack_position(data, offset=0):
+    board_bytes, flags, en_passant, halfmove_clock, fullmove_number = (
+        POSITION_RECORD.unpack_from(data, offset)
+    )
+
+    squares = []
+    for byte in board_bytes:
+        squares.append(PIECES[byte & 0xF])
+        squares.append(PIECES[byte >> 4])
+    board = [squares[y * 8 : y * 8 + 8] for y in range(8)]
+
+    position = Position(board, "black" if flags & 1 else "white")
+    position.castling = "".join(
+        right for bit, right in enumerate(CASTLING_FLAGS) if flags & (2 << bit)
+    )
+    if en_passant:
+        # The double-pushed pawn belongs to the side that just moved
+        if position.turn == "white":
+            position.set_en_passant(en_passant - 1, 2, 3, "b")
+        else:
+            position.set_en_passant(en_passant - 1, 5, 4, "w")
+    position.halfmove_clock = halfmove_clock
+    position.fullmove_number = fullmove_number
+    position.hash = hash_position(position)
+    return position
+
+
+def pack_tags(headers):
+    return "\0".join(f"{name}\0{value}" for name, value in headers.items()).encode("utf-8")
+
+
+def unpack_tags(data):
+    fields = data.decode("utf-8").split("\0") if data else []
+    return dict(zip(fields[0::2], fields[1::2]))
+
+
+def _write_run(entries, directory):
+    entries.sort()
+    run = tempfile.TemporaryFile(dir=directory)
+    for key, game, ply in entries:
+        run.write(INDEX_ENTRY.pack(key, game, ply))
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    while True:
+        data = run.read(INDEX_ENTRY.size * 4096)
+        if not data:
+            return
+        yield from INDEX_ENTRY.iter_unpack(data)
+
+
+def build(pgn_path, prefix, log=None):
+    # Imports every game of a PGN file and writes the sorted index. Entries are
+    # sorted in runs of RUN_ENTRIES and merged, so memory stays bounded.
+    directory = os.path.dirname(os.path.abspath(prefix))
+    offsets = array("Q")
+    runs = []
+    entries = []
+    skipped = 0
+
+    with open(pgn_path, encoding="utf-8", errors="replace") as pgn, open(
+        prefix + ".games", "wb"
+    ) as games:
+        games.write(GAMES_MAGIC)
+        for game_number, game in enumerate(read_games(pgn)):
+            fen = game.headers.get("FEN", STARTING_FEN)
+            try:
+                position = Position.from_fen(fen)
+            except ValueError:
+                skipped += 1
+                continue
+
+            start = pack_position(position)
+            entries.append((position.hash, len(offsets), 0))
+            codes = array("H")
+            for san in game.moves:
+                try:
+                    move = parse_san(position, san)
+                except ValueError as error:
+                    # Keep the game up to the first move we can't follow
+                    if log:
+                        log(f"game {game_number + 1}: {error}")
+                    break
+                position.make_move(*move)
+                codes.append(encode_move(move))
+                entries.append((position.hash, len(offsets), len(codes)))
+
+            tags = pack_tags(game.headers)
+            offsets.append(games.tell())
+            games.write(GAME_HEADER.pack(len(codes), len(tags), RESULT_CODES.get(game.result, 0)))
+            games.write(start)
+            games.write(tags)
+            games.write(codes.tobytes())
+
+            if len(entries) >= RUN_ENTRIES:
+                runs.append(_write_run(entries, directory))
+                entries = []
+
+    runs.append(_write_run(entries, directory))
+
+    with open(prefix + ".offsets", "wb") as offsets_file:
+        offsets.tofile(offsets_file)
+
+    count = 0
+    with open(prefix + ".index", "wb") as index:
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, 0))
+        for entry in heapq.merge(*(_read_run(run) for run in runs)):
+            index.write(INDEX_ENTRY.pack(*entry))
+            count += 1
+        index.seek(0)
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, count))
+
+    for run in runs:
+        run.close()
+    return len(offsets), count, skipped
+
+
+class GameDatabase:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.files = []
+        self.games = self._map(prefix + ".games")
+        self.index = self._map(prefix + ".index")
+
+        if self.games[: len(GAMES_MAGIC)] != GAMES_MAGIC:
+            raise ValueError(f"{prefix}.games is not a game file")
+        magic, self.entries = INDEX_HEADER.unpack_from(self.index)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{prefix}.index is not an index file")
+
+        self.offsets = array("Q")
+        with open(prefix + ".offsets", "rb") as offsets:
+            self.offsets.frombytes(offsets.read())
+
+        # Entries are two uint64 words: the hash, then game | ply << 32
+        self.words = memoryview(self.index)[INDEX_HEADER.size :].cast("Q")
+
+    def _map(self, path):
+        handle = open(path, "rb")
+        self.files.append(handle)
+        if os.fstat(handle.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.words.release()
+        for mapped in (self.games, self.index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for handle in self.files:
+            handle.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def lower_bound(self, key):
+        # First entry whose hash is not below key
+        words = self.words
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if words[2 * middle] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, key):
+        # (game, ply) for every indexed position with this hash
+        words = self.words
+        matches = []
+        entry = self.lower_bound(key)
+        while entry < self.entries and words[2 * entry] == key:
+            location = words[2 * entry + 1]
+            matches.append((location & 0xFFFFFFFF, (location >> 32) & 0xFFFF))
+            entry += 1
+        return matches
+
+    def find_position(self, position):
+        return self.find(position.hash)
+
+    def read_game(self, game):
+        # (start position, tags, result, move codes)
+        offset = self.offsets[game]
+        count, tag_bytes, result = GAME_HEADER.unpack_from(self.games, offset)
+        offset += GAME_HEADER.size
+        start = unpack_position(self.games, offset)
+        offset += POSITION_RECORD.size
+        tags = unpack_tags(self.games[offset : offset + tag_bytes])
+        offset += tag_bytes
+        codes = array("H", self.games[offset : offset + 2 * count])
+        return start, tags, RESULTS[result], codes
+
+    def replay(self, game, ply=None):
+        # The position after ply moves of game, its final position by default
+        position, _, _, codes = self.read_game(game)
+        for code in codes[:ply]:
+            position.make_move(*decode_move(code))
+        return position
+
+    def pgn_game(self, game):
+        position, tags, result, codes = self.read_game(game)
+        # play_move records the SAN of each move in move_history
+        for code in codes:
+            position.play_move(*decode_move(code))
+        return PgnGame(tags, position.move_history, result)
+
+
+def check(prefix, replay=False):
+    # List of problems with the index, empty when it is consistent
+    problems = []
+    with GameDatabase(prefix) as database:
+        lengths = []
+        for game in range(len(database)):
+            count, _, _ = GAME_HEADER.unpack_from(database.games, database.offsets[game])
+            lengths.append(count)
+
+        expected = sum(length + 1 for length in lengths)
+        if expected != database.entries:
+            problems.append(
+                f"index has {database.entries} entries, games have {expected} positions"
+            )
+
+        words = database.words
+        previous = 0
+        seen = set()
+        for entry in range(database.entries):
+            key = words[2 * entry]
+            location = words[2 * entry + 1]
+            game, ply = location & 0xFFFFFFFF, (location >> 32) & 0xFFFF
+            if key < previous:
+                problems.append(f"entry {entry} is out of order")
+            previous = key
+            if game >= len(lengths) or ply > lengths[game]:
+                problems.append(f"entry {entry} points past the games: game {game} ply {ply}")
+                continue
+            if (game, ply) in seen:
+                problems.append(f"entry {entry} duplicates game {game} ply {ply}")
+            seen.add((game, ply))
+
+        if replay:
+            # Every position has to hash to the key it is filed under
+            for game, length in enumerate(lengths):
+                position, _, _, codes = database.read_game(game)
+                for ply in range(length + 1):
+                    if ply:
+                        position.make_move(*decode_move(codes[ply - 1]))
+                    if (game, ply) not in database.find(position.hash):
+                        problems.append(f"game {game} ply {ply} is missing from the index")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Binary game database with a position index")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="build a database from a PGN file")
+    import_parser.add_argument("pgn")
+    import_parser.add_argument("prefix")
+
+    find_parser = commands.add_parser("find", help="list the games reaching a position")
+    find_parser.add_argument("prefix")
+    find_parser.add_argument("--fen", default=STARTING_FEN)
+    find_parser.add_argument("--limit", type=int, default=20)
+
+    show_parser = commands.add_parser("show", help="print a game as PGN")
+    show_parser.add_argument("prefix")
+    show_parser.add_argument("game", type=int)
+
+    check_parser = commands.add_parser("check", help="check the index for consistency")
+    check_parser.add_argument("prefix")
+    check_parser.add_argument("--replay", action="store_true", help="replay every game too")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        started = time.perf_counter()
+        games, entries, skipped = build(
+            args.pgn, args.prefix, log=lambda message: print(message, file=sys.stderr)
+        )
+        print(
+            f"{games} games, {entries} positions indexed in "
+            f"{time.perf_counter() - started:.2f}s ({skipped} skipped)"
+        )
+        return 0
+
+    if args.command == "check":
+        problems = check(args.prefix, args.replay)
+        for problem in problems:
+            print(problem)
+        print("index ok" if not problems else f"{len(problems)} problems")
+        return 1 if problems else 0
+
+    with GameDatabase(args.prefix) as database:
+        if args.command == "show":
+            PgnWriter(sys.stdout).write_game(database.pgn_game(args.game))
+            return 0
+
+        started = time.perf_counter()
+        matches = database.find_position(Position.from_fen(args.fen))
+        elapsed = time.perf_counter() - started
+        for game, ply in matches[: args.limit]:
+            _, tags, result, _ = database.read_game(game)
+            players = f"{tags.get('White', '?')} - {tags.get('Black', '?')}"
+            print(f"game {game} ply {ply}: {players} {result}")
+        print(f"{len(matches)} matches in {elapsed * 1000:.3f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,21 @@
-import copy
+import argparse
+import io
 import sys
+import time
 
 import pygame
 
-from colors import LIGHT_BROWN, RED, WHITE, YELLOW, with_alpha, GREEN, BLACK, GRAY
-from utils import Button, generate_pgn
+from book import OpeningBook
+from colors import LIGHT_BROWN, WHITE, with_alpha, GREEN, BLACK, GRAY
+from engine_worker import ENGINE_MOVE, EngineWorker
+from render_cache import RenderCache
+from pgn import PgnGame, PgnWriter
+from profiler import Profiler
+from rules import EMPTY_POSITION, EMPTY_SQUARE, STARTING_FEN, Position
+from search import Search
+from tablebase import Tablebase
+from transposition import TranspositionTable
+from utils import Button
 
 pygame.init()
 
@@ -16,17 +27,29 @@ SCREEN_WIDTH = 600
 SCREEN_HEIGHT = 600
 FPS = 60
 SQUARE_SIZE = SCREEN_WIDTH // 8
-EMPTY_SQUARE = "--"
-EMPTY_POSITION = (None, None)
+# F3 shows the profiler HUD, F4 writes what it recorded as a Chrome trace
+HUD_KEY = pygame.K_F3
+TRACE_KEY = pygame.K_F4
+TRACE_PATH = "profile-trace.json"
+HUD_LINES = 8
+HUD_REFRESH_MS = 500
 # side_bar_h = WINDOW_HEIGHT
 # side_bar_w = WINDOW_WIDTH - SCREEN_WIDTH
 
 
 class Game:
-    def __init__(self):
+    def __init__(
+        self,
+        engine_color=None,
+        movetime=1.0,
+        book=None,
+        tablebase=None,
+        pgn_output=None,
+        profile=False,
+        fen=STARTING_FEN,
+    ):
         # Game Screen Props
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        self.game_screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("uChess")
         self.clock = pygame.time.Clock()
         self.winner_font = pygame.font.SysFont("Comic sans", 32, True)
@@ -36,50 +59,54 @@ class Game:
         # Game State
         self.selected_pos = (None, None)
         self.selected_piece = None
-        self.turn = "white"
         self.valid_moves = []
         self.target_square = (None, None)
         self.checked_king = EMPTY_POSITION
-        self.game_over = False
-        self.winner = None
+        self.render_cache = RenderCache()
+        self.assets = None
         self.images = {}
-        self.move_history = []
-        self.captured_pieces = []
-        self.chess_squares = {}
-
-        self.generate_chess_moves()
-
-        # Game Board
-        self.board = [
-            ["br", "bn", "bb", "bq", "bk", "bb", "bn", "br"],
-            ["bp"] * 8,
-            [EMPTY_SQUARE] * 8,
-            [EMPTY_SQUARE] * 8,
-            [EMPTY_SQUARE] * 8,
-            [EMPTY_SQUARE] * 8,
-            ["wp"] * 8,
-            ["wr", "wn", "wb", "wq", "wk", "wb", "wn", "wr"],
-        ]
+
+        # What each square showed when last drawn, so a frame only redraws
+        # the squares that changed
+        self.drawn_squares = [None] * 64
+        self.drawn_game_over = False
+        self.full_redraw = True
+
+        # Game Board and rules state, a new game starts again from start_fen
+        self.start_fen = fen
+        self.position = Position.from_fen(fen)
+        self.update_checked_king()
+
+        # Computer player, if any
+        self.engine_color = engine_color
+        self.movetime = movetime
+        self.engine = Search(TranspositionTable(), tablebase) if engine_color else None
+        self.book = book
+        # Searches run on this thread, the answer arrives as an ENGINE_MOVE
+        # event for engine_request
+        self.engine_worker = EngineWorker(self.engine) if engine_color else None
+        self.engine_request = None
+
+        # Finished games go to this file path or callable, if any
+        self.pgn_output = pgn_output
 
         # Utils
         self.replay_button = None
+        self.end_screen = None
+
+        # Timing of the methods in PROFILE_TARGETS, off unless asked for
+        self.profiler = Profiler(PROFILE_TARGETS)
+        self.show_hud = profile
+        self.hud_font = None
+        self.hud_panel = None
+        if profile:
+            self.profiler.enable()
 
     def draw_board(self):
         # Draw chess board
-        board_image = "assets/board.png"
-        board = pygame.image.load(board_image)
-        board = pygame.transform.scale(board, (SCREEN_WIDTH, SCREEN_HEIGHT))
-
-        # Draw the game onto the main window
-        self.screen.blit(self.game_screen, (0, 0))
-        self.game_screen.blit(board, (0, 0))
-
-    def generate_chess_moves(self):
-        files = ["a", "b", "c", "d", "e", "f", "g", "h"]
-        ranks = [i for i in range(1, 9)]
-        for row in range(8):
-            for col in range(8):
-                self.chess_squares[(row, col)] = f"{files[col]}{ranks[::-1][row]}"
+        for y in range(8):
+            for x in range(8):
+                self.draw_square(x, y, self.square_state(x, y))
 
     def draw_side_bar(self):
 
@@ -88,42 +115,36 @@ class Game:
         self.screen.blit(self.side_bar, (SCREEN_WIDTH, 0))
 
     def load_images(self):
+        # Decoded once, every frame after this reuses the same surfaces
+        self.assets = self.render_cache.for_size(SQUARE_SIZE)
+        self.images = self.assets.pieces
+
+    def square_state(self, x, y):
+        # Everything that decides how a square looks
+        piece = self.position.board[y][x]
+        return (
+            piece,
+            (x, y) == self.checked_king,
+            (x, y) == self.selected_pos and piece != EMPTY_SQUARE,
+            (x, y) in self.valid_moves
+            and self.selected_piece is not None
+            and self.selected_piece[0] == self.position.turn[0],
+        )
 
-        pieces = [
-            "wp",
-            "wr",
-            "wb",
-            "wn",
-            "wq",
-            "wk",
-            "bp",
-            "br",
-            "bb",
-            "bn",
-            "bq",
-            "bk",
-        ]
-
-        for piece in pieces:
-            self.images[piece] = pygame.image.load(f"assets/{piece}.png")
-            self.images[piece] = pygame.transform.scale(
-                self.images[piece], (SQUARE_SIZE, SQUARE_SIZE)
-            )
-
-    def draw_pieces(self):
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece != EMPTY_SQUARE:
-                    self.game_screen.blit(
-                        self.images[piece],
-                        pygame.Rect(
-                            col * SQUARE_SIZE,
-                            row * SQUARE_SIZE,
-                            SQUARE_SIZE,
-                            SQUARE_SIZE,
-                        ),
-                    )
+    def draw_square(self, x, y, state):
+        piece, checked, selected, valid_move = state
+        rect = self.assets.square_rects[y * 8 + x]
+
+        self.screen.blit(self.assets.board, rect, rect)
+        if checked:
+            self.highlight_check((x, y))
+        if selected:
+            self.screen.blit(self.assets.selection, rect)
+        if piece != EMPTY_SQUARE:
+            self.screen.blit(self.images[piece], rect)
+        if valid_move:
+            self.draw_valid_move((x, y))
+        return rect
 
     def handle_click(self):
         x, y = (
@@ -134,6 +155,9 @@ class Game:
         if (x < 0 or x > 7) or (y < 0 or y > 7):
             return
 
+        if self.is_engine_turn():
+            return
+
         if self.selected_pos == (x, y):
             self.selected_pos = (None, None)
             self.selected_piece = EMPTY_SQUARE
@@ -143,515 +167,84 @@ class Game:
             self.capture(start=self.selected_pos, end=self.target_square)
         else:
             self.selected_pos = (x, y)
-            self.selected_piece = self.board[y][x]
+            self.selected_piece = self.position.board[y][x]
             self.generate_moves()
 
-    def capture(self, start, end):
-        # If not player's turn do nothing
-        if self.board[start[1]][start[0]][0] != self.turn[0]:
-            return False
-
-        piece = self.board[start[1]][start[0]]
-        captured_piece = self.board[end[1]][end[0]]
-
-        # try capturing the piece or free square
-        self.board[end[1]][end[0]] = piece
-        self.board[start[1]][start[0]] = EMPTY_SQUARE
+    def is_engine_turn(self):
+        return (
+            self.engine is not None
+            and self.position.turn == self.engine_color
+            and not self.position.game_over
+        )
 
-        # If it causes check, revert it
-        if self.is_in_check(self.turn[0]):
-            self.board[start[1]][start[0]] = piece
-            self.board[end[1]][end[0]] = captured_piece
-            self.checked_king = EMPTY_POSITION
-            # return False
+    def play_engine_move(self):
+        # Book moves are played straight away, anything else is searched in
+        # the background while the window keeps running
+        if self.engine_request is not None:
+            return
+        move = self.book.choose(self.position) if self.book is not None else None
+        if move is not None:
+            self.capture(*move)
         else:
-            capturing_piece = piece[1]
-
-            if capturing_piece == "p":
-                next_turn_color = "w" if self.turn == "black" else "b"
-
-                if captured_piece != EMPTY_SQUARE:
-                    move = self.chess_squares[(end[1], end[0])]
-                    move = (
-                        self.chess_squares[(start[1], start[0])][0]
-                        + "x"
-                        + move
-                        + ("+" if self.is_in_check(next_turn_color) else "")
-                    )
-                    self.move_history.append(move)
-                else:
-                    move = self.chess_squares[(end[1], end[0])]
-                    move = move + ("+" if self.is_in_check(next_turn_color) else "")
-                    self.move_history.append(move)
-
-            if capturing_piece != "p":
-                if captured_piece != EMPTY_SQUARE:
-                    next_turn_color = "w" if self.turn == "black" else "b"
-                    move = self.chess_squares[(end[1], end[0])]
-                    move = (
-                        piece[1]
-                        + "x"
-                        + move
-                        + ("+" if self.is_in_check(next_turn_color) else "")
-                    )
-                    self.move_history.append(move)
-                else:
-                    next_turn_color = "w" if self.turn == "black" else "b"
-                    move = self.chess_squares[(end[1], end[0])]
-                    move = (
-                        piece[1]
-                        + move
-                        + ("+" if self.is_in_check(next_turn_color) else "")
-                    )
-                    self.move_history.append(move)
-
-            if captured_piece != EMPTY_SQUARE:
-                self.captured_pieces.append(captured_piece)
-
-        self.swap_turns()
-
-        is_check = self.is_in_check(self.turn[0])
-        is_mate = self.is_checkmate(self.turn[0])
-
-        if is_mate and self.move_history:
-            print("Mate found")
-            self.move_history[-1] = self.move_history[-1].replace("+", "#")
-
-        elif is_check and self.move_history:
-            if not "+" in self.move_history[-1]:
-                self.move_history[-1] = self.move_history[-1] + "+"
-
-        print(self.move_history)
-
-        is_mate = self.is_checkmate(self.turn[0])
-
-        if is_mate:
-            self.game_over = True
-            self.winner = "white" if self.turn == "black" else "black"
-        return True
-
-    def swap_turns(self):
-        color = "white" if self.turn == "black" else "black"
-        self.turn = color
-
-    def generate_moves(self):
-        x, y = self.selected_pos
-        self.valid_moves.clear()
-        selected_piece = self.selected_piece[1].lower()
-
-        if self.selected_piece != EMPTY_SQUARE:
-            if selected_piece == "p":
-                direction = -1 if self.turn == "white" else 1
-
-                if (self.turn == "white" and y == 6) or (
-                    self.turn == "black" and y == 1
-                ):
-                    if self.board[y + (direction * 2)][x] == EMPTY_SQUARE:
-                        self.valid_moves.append((x, y + (direction * 2)))
-
-                if self.board[y + direction][x] == EMPTY_SQUARE:
-                    self.valid_moves.append((x, y + direction))
-
-                if x + 1 <= 7:
-                    target_square = self.board[y + direction][x + 1]
-                    if (
-                        target_square != EMPTY_SQUARE
-                        and target_square[0] != self.turn[0]
-                    ):
-                        self.valid_moves.append((x + 1, y + direction))
-
-                if x - 1 >= 0:
-                    target_square = self.board[y + direction][x - 1]
-                    if (
-                        target_square != EMPTY_SQUARE
-                        and target_square[0] != self.turn[0]
-                    ):
-                        self.valid_moves.append((x - 1, y + direction))
-
-            if selected_piece == "n":
-                knight_moves = (
-                    (x + 2, y + 1),
-                    (x + 2, y - 1),
-                    (x - 2, y + 1),
-                    (x - 2, y - 1),
-                    (x + 1, y + 2),
-                    (x + 1, y - 2),
-                    (x - 1, y + 2),
-                    (x - 1, y - 2),
-                )
-
-                for move in knight_moves:
-                    if (move[0] < 0) or (move[0] > 7) or (move[1] < 0) or (move[1] > 7):
-                        continue
-                    if (
-                        self.board[move[1]][move[0]] == EMPTY_SQUARE
-                        or self.board[move[1]][move[0]][0] != self.turn[0]
-                    ):
-                        self.valid_moves.append(move)
-
-            if selected_piece == "r":
-                rook_directions = ((1, 0), (-1, 0), (0, 1), (0, -1))
-
-                for rook_x, rook_y in rook_directions:
-                    current_x = x
-                    current_y = y
-
-                    while True:
-                        current_y += rook_y
-                        current_x += rook_x
-
-                        if (
-                            (current_x < 0)
-                            or (current_x > 7)
-                            or (current_y < 0)
-                            or (current_y > 7)
-                        ):
-                            break
-
-                        square = self.board[current_y][current_x]
-
-                        if square == EMPTY_SQUARE:
-                            self.valid_moves.append((current_x, current_y))
-                            continue
-
-                        if square[0] != self.turn[0]:
-                            self.valid_moves.append((current_x, current_y))
-                            break
-
-                        if square[0] == self.turn[0]:
-                            break
-
-            if selected_piece == "b":
-                bishop_directions = ((1, 1), (1, -1), (-1, 1), (-1, -1))
-
-                for dx, dy in bishop_directions:
-                    current_x = x
-                    current_y = y
-
-                    while True:
-                        current_y += dy
-                        current_x += dx
-
-                        if (
-                            (current_x < 0)
-                            or (current_x > 7)
-                            or (current_y < 0)
-                            or (current_y > 7)
-                        ):
-                            break
-
-                        square = self.board[current_y][current_x]
-
-                        if square == EMPTY_SQUARE:
-                            self.valid_moves.append((current_x, current_y))
-                            continue
-
-                        if square[0] != self.turn[0]:
-                            self.valid_moves.append((current_x, current_y))
-                            break
-
-                        if square[0] == self.turn[0]:
-                            break
-
-            if selected_piece == "k":
-                king_moves = (
-                    (x, y + 1),
-                    (x, y - 1),
-                    (x - 1, y),
-                    (x + 1, y),
-                    (x + 1, y + 1),
-                    (x + 1, y - 1),
-                    (x - 1, y + 1),
-                    (x - 1, y - 1),
-                )
-
-                for move in king_moves:
-                    if (move[0] < 0) or (move[0] > 7) or (move[1] < 0) or (move[1] > 7):
-                        continue
-                    if (
-                        self.board[move[1]][move[0]] == EMPTY_SQUARE
-                        or self.board[move[1]][move[0]][0] != self.turn[0]
-                    ):
-                        self.valid_moves.append(move)
-
-            if selected_piece == "q":
-                queen_directions = (
-                    (1, 1),
-                    (1, -1),
-                    (-1, 1),
-                    (-1, -1),
-                    (1, 0),
-                    (-1, 0),
-                    (0, 1),
-                    (0, -1),
-                )
-
-                for dx, dy in queen_directions:
-                    current_x = x
-                    current_y = y
-
-                    while True:
-                        current_y += dy
-                        current_x += dx
-
-                        if (
-                            (current_x < 0)
-                            or (current_x > 7)
-                            or (current_y < 0)
-                            or (current_y > 7)
-                        ):
-                            break
-
-                        square = self.board[current_y][current_x]
-
-                        if square == EMPTY_SQUARE:
-                            self.valid_moves.append((current_x, current_y))
-                            continue
-
-                        if square[0] != self.turn[0]:
-                            self.valid_moves.append((current_x, current_y))
-                            break
-
-                        if square[0] == self.turn[0]:
-                            break
-
-        self.filter_illegal_moves()
-
-    def draw_valid_moves(self):
-        for move in self.valid_moves:
-            move_highlight = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-            move_highlight.fill(with_alpha(WHITE, 0))
-
-            if self.selected_piece[0] != self.turn[0]:
-                return
-
-            pygame.draw.circle(
-                move_highlight,
-                with_alpha(RED, 100),
-                (SQUARE_SIZE // 2, SQUARE_SIZE // 2),
-                10,
-            )
-            self.game_screen.blit(
-                move_highlight, (move[0] * SQUARE_SIZE, move[1] * SQUARE_SIZE)
-            )
-
-    def get_rook_attacks(self, x, y, board=[]):
-        rook_directions = ((1, 0), (-1, 0), (0, 1), (0, -1))
-        board = self.board if board == [] else board
-        attacks = []
-        color = board[y][x][0]
-
-        for dx, dy in rook_directions:
-            cx, cy = x + dx, y + dy
-            while 0 <= cx < 8 and 0 <= cy < 8:
-                target = board[cy][cx]
-                if target == EMPTY_SQUARE:
-                    attacks.append((cx, cy))
-                else:
-                    if target[0] != color:
-                        attacks.append((cx, cy))
-                    break
-                cx += dx
-                cy += dy
-        return attacks
-
-    def get_knight_attacks(self, x, y):
-        moves = [(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)]
-        attacks = []
-
-        for dx, dy in moves:
-            cx, cy = x + dx, y + dy
-            if 0 <= cx <= 7 and 0 <= cy <= 7:
-                attacks.append((cx, cy))
-
-        return attacks
-
-    def get_bishop_attacks(self, x, y, board=[]):
-        board = self.board if board == [] else board
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        attacks = []
-        color = board[y][x][0]
-
-        for dx, dy in directions:
-            cx, cy = x, y
-            while True:
-                cx += dx
-                cy += dy
-                if cx < 0 or cx > 7 or cy < 0 or cy > 7:
-                    break
-
-                square = board[cy][cx]
-
-                if square == EMPTY_SQUARE:
-                    attacks.append((cx, cy))
-                    continue
+            self.engine_request = self.engine_worker.submit(self.position, self.movetime)
 
-                elif square[0] != color:
-                    attacks.append((cx, cy))
-                    break
-
-        return attacks
-
-    def get_queen_attacks(self, x, y):
-        return self.get_rook_attacks(x, y) + self.get_bishop_attacks(x, y)
-
-    def get_king_attacks(self, x, y, board=[]):
-
-        directions = [
-            (1, 0),
-            (-1, 0),
-            (0, 1),
-            (0, -1),
-            (1, 1),
-            (1, -1),
-            (-1, 1),
-            (-1, -1),
-        ]
-        attacks = []
-
-        for dx, dy in directions:
-            cx, cy = x + dx, y + dy
-            if 0 <= cx <= 7 and 0 <= cy <= 7:
-                attacks.append((cx, cy))
-
-        return attacks
-
-    def get_pawn_attacks(self, x, y, board=[]):
-        attacks = []
-        board = self.board if board == [] else board
-        color = board[y][x][0]
-        direction = -1 if color == "w" else 1
-
-        for dx in [-1, 1]:
-            cx, cy = x + dx, y + direction
-
-            if 0 <= cx < 8 and 0 <= cy < 8:
-                attacks.append((cx, cy))
-
-        return attacks
-
-    def is_in_check(self, color, board=[]):
-        king_position = EMPTY_POSITION
-        board = self.board if board == [] else board
-        king_piece = color + "k"
-        opp_color = "b" if color == "w" else "w"
-        opp_attacks = []
-
-        for x in range(8):
-            for y in range(8):
-                if board[y][x] == king_piece:
-                    king_position = (x, y)
-
-                if board[y][x][0] == opp_color:
-                    if board[y][x][1] == "r":
-                        opp_attacks.append(self.get_rook_attacks(x, y))
-
-                    if board[y][x][1] == "q":
-                        opp_attacks.append(self.get_queen_attacks(x, y))
+    def engine_finished(self, event):
+        # Answers to searches cancelled by a reset are ignored
+        if event.request != self.engine_request:
+            return
+        self.engine_request = None
+        if event.move is not None and self.is_engine_turn():
+            self.capture(*event.move)
 
-                    if board[y][x][1] == "p":
-                        opp_attacks.append(self.get_pawn_attacks(x, y))
+    def capture(self, start, end, promotion=None):
+        moved = self.position.play_move(start, end, promotion)
 
-                    if board[y][x][1] == "b":
-                        opp_attacks.append(self.get_bishop_attacks(x, y))
-                    if board[y][x][1] == "n":
-                        opp_attacks.append(self.get_knight_attacks(x, y))
+        if moved:
+            self.update_checked_king()
 
-        opp_attacks = [pos for sublist in opp_attacks for pos in sublist]
+            if self.position.game_over:
+                self.finish_game()
 
-        is_checked = king_position in opp_attacks
+        return moved
 
-        if is_checked:
-            self.checked_king = king_position
+    def update_checked_king(self):
+        turn = self.position.turn[0]
+        if self.position.is_in_check(turn):
+            self.checked_king = self.position.kings[turn]
         else:
             self.checked_king = EMPTY_POSITION
 
-        return is_checked
-
-    def highlight_check(self, pos):
-
-        if pos == EMPTY_POSITION:
-            return
-
-        highlight_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-        highlight_surface.fill(
-            with_alpha(RED, 150),
-        )
-
-        self.game_screen.blit(
-            highlight_surface, (pos[0] * SQUARE_SIZE, pos[1] * SQUARE_SIZE)
-        )
-
-    def filter_illegal_moves(self):
+    def generate_moves(self):
         if self.selected_piece == EMPTY_SQUARE or self.selected_pos == EMPTY_POSITION:
+            self.valid_moves = []
             return
 
-        legal_moves = []
-        original_board = copy.deepcopy(self.board)
-        sx, sy = self.selected_pos
-
-        for mx, my in self.valid_moves:
-            self.board[my][mx] = self.board[sy][sx]
-            self.board[sy][sx] = EMPTY_SQUARE
-
-            if not self.is_in_check(self.turn[0]):
-                legal_moves.append((mx, my))
-
-            self.board = copy.deepcopy(original_board)
-
-        self.valid_moves = legal_moves
-        return legal_moves
-
-    def is_checkmate(self, color):
-        if not self.is_in_check(color):
-            return False
-
-        # Save original state
-        original_selected_pos = self.selected_pos
-        original_selected_piece = self.selected_piece
-        original_valid_moves = copy.deepcopy(self.valid_moves)
-
-        # Try each piece of the current player to see if any can make a legal move
-        for x in range(8):
-            for y in range(8):
-                piece = self.board[y][x]
-
-                # Skip empty squares and opponent pieces
-                if piece == EMPTY_SQUARE or piece[0] != color:
-                    continue
+        self.valid_moves = self.position.generate_moves(self.selected_pos)
 
-                # Generate and test moves for this piece
-                self.selected_pos = (x, y)
-                self.selected_piece = piece
-                self.valid_moves = []
+    def draw_valid_move(self, move):
+        self.screen.blit(self.assets.move_dot, self.assets.square_rects[move[1] * 8 + move[0]])
 
-                # Generate all possible moves for this piece
-                self.generate_moves()  # This also filters illegal moves
-
-                # If this piece has any legal moves, it's not checkmate
-                if self.valid_moves:
-                    # Restore original state
-                    self.selected_pos = original_selected_pos
-                    self.selected_piece = original_selected_piece
-                    self.valid_moves = original_valid_moves
-                    return False
+    def highlight_check(self, pos):
 
-        # Restore original state
-        self.selected_pos = original_selected_pos
-        self.selected_piece = original_selected_piece
-        self.valid_moves = original_valid_moves
+        if pos == EMPTY_POSITION:
+            return
 
-        # If we get here, no piece has any legal moves
-        return True
+        self.screen.blit(self.assets.check, self.assets.square_rects[pos[1] * 8 + pos[0]])
 
     def draw_captured_pieces(self):
         pass
 
-    def show_winner_screen(self):
+    def finish_game(self):
+        # Runs once when the result is decided: builds the end screen and
+        # exports the game, show_winner_screen then only blits the result
         winner_screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        winner_screen.fill(with_alpha(BLACK, 70))
+        winner_screen.blit(self.assets.dim, (0, 0))
 
-        winner_text = self.winner_font.render(f"{self.winner.title()} wins!", 1, WHITE)
+        if self.position.winner:
+            result = f"{self.position.winner.title()} wins!"
+        else:
+            result = "Stalemate!"
+        winner_text = self.winner_font.render(result, 1, WHITE)
 
         text_rect = winner_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
         winner_screen.blit(winner_text, text_rect)
@@ -672,85 +265,217 @@ class Game:
         )
 
         self.replay_button.render()
+        self.end_screen = winner_screen
 
-        self.game_screen.blit(winner_screen, (0, 0))
+        self.export_pgn()
+
+    def export_pgn(self):
+        if self.pgn_output is None:
+            return
+
+        if self.position.winner == "white":
+            result = "1-0"
+        elif self.position.winner == "black":
+            result = "0-1"
+        else:
+            result = "1/2-1/2"
+        players = {
+            color: "Computer" if color == self.engine_color else "Player"
+            for color in ("white", "black")
+        }
+        headers = {
+            "Event": "uChess",
+            "Date": time.strftime("%Y.%m.%d"),
+            "White": players["white"],
+            "Black": players["black"],
+        }
+        if self.start_fen != STARTING_FEN:
+            headers["SetUp"] = "1"
+            headers["FEN"] = self.start_fen
+        game = PgnGame(headers, self.position.move_history, result)
+
+        if callable(self.pgn_output):
+            output = io.StringIO()
+            PgnWriter(output).write_game(game)
+            self.pgn_output(output.getvalue())
+        else:
+            with open(self.pgn_output, "a") as pgn_file:
+                PgnWriter(pgn_file).write_game(game)
 
-        pgn = generate_pgn(self.move_history)
-        print(pgn)
+    def show_winner_screen(self):
+        self.screen.blit(self.end_screen, (0, 0))
 
     def reset_board(self):
         self.selected_pos = (None, None)
         self.selected_piece = None
-        self.turn = "white"
         self.valid_moves = []
         self.target_square = (None, None)
-        self.checked_king = EMPTY_POSITION
-        self.game_over = False
-        self.winner = None
-        self.move_history = []
-        self.captured_pieces = []
-
-        self.board = [
-            ["br", "bn", "bb", "bq", "bk", "bb", "bn", "br"],
-            ["bp"] * 8,
-            [EMPTY_SQUARE] * 8,
-            [EMPTY_SQUARE] * 8,
-            [EMPTY_SQUARE] * 8,
-            [EMPTY_SQUARE] * 8,
-            ["wp"] * 8,
-            ["wr", "wn", "wb", "wq", "wk", "wb", "wn", "wr"],
-        ]
-        self.replay_button = None
-
-    def run(self):
-        self.load_images()
 
-        running = True
-        while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    self.handle_click()
+        self.position = Position.from_fen(self.start_fen)
+        self.update_checked_king()
+        if self.engine is not None:
+            self.engine_worker.cancel()
+            self.engine_request = None
+            self.engine.tt.clear()
+        self.replay_button = None
+        self.end_screen = None
+        self.full_redraw = True
+
+    def render(self):
+        # Redraw only the squares that look different from the last frame and
+        # update just those rects, the whole window after a reset or game over
+        states = [self.square_state(sq % 8, sq // 8) for sq in range(64)]
+        game_over = self.position.game_over
+        full_redraw = self.full_redraw or game_over != self.drawn_game_over
+        self.full_redraw = False
+
+        if full_redraw:
             self.draw_board()
-            # self.draw_side_bar()
+            if game_over:
+                self.show_winner_screen()
+            rects = []
+        else:
+            rects = [
+                self.draw_square(sq % 8, sq // 8, states[sq])
+                for sq in range(64)
+                if states[sq] != self.drawn_squares[sq]
+            ]
 
-            self.draw_captured_pieces()
+        if self.show_hud:
+            rects.append(self.draw_hud(states))
 
-            if not self.checked_king == EMPTY_POSITION:
-                self.highlight_check(self.checked_king)
+        if full_redraw:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+
+        self.drawn_squares = states
+        self.drawn_game_over = game_over
+
+    def draw_hud(self, states):
+        if self.hud_font is None:
+            self.hud_font = pygame.font.SysFont("monospace", 12)
+            line_height = self.hud_font.get_linesize()
+            self.hud_panel = pygame.Surface(
+                (SCREEN_WIDTH, line_height * (HUD_LINES + 1) + 8), pygame.SRCALPHA
+            )
+            self.hud_panel.fill(with_alpha(BLACK, 170))
+
+        line_height = self.hud_font.get_linesize()
+        lines = [f"{'':<28}{'calls':>7}{'total ms':>10}{'p50 ms':>9}{'p99 ms':>9}"]
+        for label, calls, total, p50, p99 in self.profiler.summary()[:HUD_LINES]:
+            lines.append(
+                f"{label[:27]:<28}{calls:>7}{total * 1000:>10.0f}"
+                f"{p50 * 1000:>9.2f}{p99 * 1000:>9.2f}"
+            )
 
-            if (
-                self.selected_pos != (None, None)
-                and self.board[self.selected_pos[1]][self.selected_pos[0]]
-                != EMPTY_SQUARE
-            ):
-                x, y = self.selected_pos
-                highlight_surface = pygame.Surface(
-                    (SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA
-                )
-                highlight_surface.fill(with_alpha(YELLOW, alpha=50))
-                self.game_screen.blit(
-                    highlight_surface, (x * SQUARE_SIZE, y * SQUARE_SIZE)
-                )
+        rect = self.screen.blit(self.hud_panel, (0, 0))
+        for index, line in enumerate(lines):
+            text = self.hud_font.render(line, True, WHITE)
+            self.screen.blit(text, (4, 4 + index * line_height))
+
+        # The panel covers these squares, so draw them again next frame
+        if self.position.game_over:
+            self.full_redraw = True
+        for sq in range(64):
+            if self.assets.square_rects[sq].colliderect(rect):
+                states[sq] = None
+        return rect
+
+    def handle_key(self, key):
+        if key == HUD_KEY:
+            self.show_hud = self.profiler.toggle()
+            self.full_redraw = True
+        elif key == TRACE_KEY and self.profiler.events:
+            count = self.profiler.dump_trace(TRACE_PATH)
+            print(f"Wrote {count} trace events to {TRACE_PATH}")
 
-            self.draw_pieces()
+    def run(self):
+        self.load_images()
+        # Pointer movement changes nothing on screen, so it shouldn't wake us
+        pygame.event.set_blocked(pygame.MOUSEMOTION)
 
-            self.draw_valid_moves()
+        running = True
+        while running:
+            if self.is_engine_turn() and self.engine_request is None:
+                events = pygame.event.get()
+            elif self.show_hud:
+                # Wake up now and then so the HUD numbers stay current
+                events = [pygame.event.wait(HUD_REFRESH_MS)] + pygame.event.get()
+            else:
+                # Nothing changes until the user does something or the
+                # engine answers, so sleep until an event arrives instead of
+                # redrawing at FPS
+                events = [pygame.event.wait()] + pygame.event.get()
+
+            with self.profiler.section("Game.run frame"):
+                for event in events:
+                    if event.type == pygame.QUIT:
+                        running = False
+                    elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                        self.full_redraw = True
+                    elif event.type == ENGINE_MOVE:
+                        self.engine_finished(event)
+                    elif event.type == pygame.KEYDOWN:
+                        self.handle_key(event.key)
+                    elif event.type == pygame.MOUSEBUTTONDOWN:
+                        if self.replay_button is not None:
+                            self.replay_button.is_pressed(event)
+                        else:
+                            self.handle_click()
+
+                if not running:
+                    break
 
-            if self.game_over:
-                self.show_winner_screen()
+                self.render()
 
-            if self.replay_button != None and hasattr(self, "replay_button"):
-                self.replay_button.is_pressed(event)
+                if self.is_engine_turn():
+                    self.play_engine_move()
 
-            pygame.display.flip()
             self.clock.tick(FPS)
 
+        if self.profiler.calls:
+            print(self.profiler.report())
+        self.profiler.disable()
+        if self.engine_worker is not None:
+            self.engine_worker.close()
         pygame.quit()
         sys.exit()
 
 
+# Methods the profiler times while it is enabled
+PROFILE_TARGETS = [
+    (Game, "handle_click"),
+    (Game, "render"),
+    (Game, "play_engine_move"),
+    (Game, "engine_finished"),
+    (Position, "play_move"),
+    (Position, "generate_moves"),
+    (Position, "filter_illegal_moves"),
+    (Position, "is_in_check"),
+    (Position, "is_checkmate"),
+    (Position, "legal_moves"),
+    (Search, "search"),
+]
+
+
 if __name__ == "__main__":
-    game = Game()
+    parser = argparse.ArgumentParser(description="Play chess")
+    parser.add_argument("--engine", choices=["white", "black"], help="side the computer plays")
+    parser.add_argument("--movetime", type=float, default=1.0, help="engine seconds per move")
+    parser.add_argument("--book", help="opening book file for the engine")
+    parser.add_argument("--tablebase", help="directory of endgame tables for the engine")
+    parser.add_argument("--pgn", default="games.pgn", help="file finished games are added to")
+    parser.add_argument("--profile", action="store_true", help="start with the profiler HUD on")
+    parser.add_argument("--fen", default=STARTING_FEN, help="position to start from")
+    args = parser.parse_args()
+
+    try:
+        Position.from_fen(args.fen)
+    except ValueError as error:
+        parser.error(str(error))
+
+    book = OpeningBook(args.book) if args.book else None
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+    game = Game(args.engine, args.movetime, book, tablebase, args.pgn, args.profile, args.fen)
     game.run()
@@ -0,0 +1,160 @@
+import re
+
+# Standard algebraic notation for the rules module's (start, end, promotion)
+# moves. Nothing here imports rules, so rules can use it for play_move.
+
+FILES = "abcdefgh"
+RANKS = "87654321"
+CASTLING = {"O-O": 2, "0-0": 2, "O-O-O": -2, "0-0-0": -2}
+# piece, from file, from rank, capture, destination, promotion
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([QRBNqrbn]))?$")
+
+
+def square_name(square):
+    # (4, 4) -> "e4"
+    return FILES[square[0]] + RANKS[square[1]]
+
+
+def parse_square(name):
+    # "e4" -> (4, 4)
+    return FILES.index(name[0]), RANKS.index(name[1])
+
+
+def san_body(board, move, legal):
+    # SAN for a move about to be played on board, without the check suffix.
+    # legal is the side's legal move list, which tells apart two pieces that
+    # can reach the same square.
+    start, end, promotion = move
+    piece = board[start[1]][start[0]]
+    kind = piece[1]
+
+    if kind == "k" and abs(end[0] - start[0]) == 2:
+        return "O-O" if end[0] > start[0] else "O-O-O"
+
+    target = square_name(end)
+    if kind == "p":
+        # Pawns change file only when capturing, en passant included
+        if start[0] != end[0]:
+            target = FILES[start[0]] + "x" + target
+        return target + ("=" + promotion.upper() if promotion else "")
+
+    capture = "x" if board[end[1]][end[0]][1] != "-" else ""
+    rivals = [
+        other
+        for other, other_end, _ in legal
+        if other_end == end and other != start and board[other[1]][other[0]] == piece
+    ]
+    hint = ""
+    if rivals:
+        if all(other[0] != start[0] for other in rivals):
+            hint = FILES[start[0]]
+        elif all(other[1] != start[1] for other in rivals):
+            hint = RANKS[start[1]]
+        else:
+            hint = square_name(start)
+    return kind.upper() + hint + capture + target
+
+
+def check_suffix(in_check, has_legal_moves):
+    # What goes after the move once it has been played
+    if not in_check:
+        return ""
+    return "+" if has_legal_moves else "#"
+
+
+def move_to_san(position, move, legal=None):
+    # Full SAN including "+" or "#", plays and takes back the move to find it
+    if legal is None:
+        legal = position.legal_moves()
+    body = san_body(position.board, move, legal)
+    position.make_move(*move)
+    suffix = check_suffix(position.is_in_check(position.turn[0]), position.has_legal_moves())
+    position.unmake_move()
+    return body + suffix
+
+
+def parse_san(position, san, legal=None):
+    # "Nbd7", "exd5", "O-O", "e8=Q+" -> the legal (start, end, promotion).
+    # Given the position's legal moves it only matches against them, otherwise
+    # just the pieces that fit the SAN have their moves generated.
+    text = san.rstrip("+#!?")
+    color = position.turn[0]
+
+    if text in CASTLING:
+        king = position.kings[color]
+        candidates = [(king, (king[0] + CASTLING[text], king[1]), None)]
+    else:
+        match = SAN_PATTERN.match(text)
+        if match is None:
+            raise ValueError(f"Invalid move: {san!r}")
+        kind, from_file, from_rank, _, target, promotion = match.groups()
+        kind = kind.lower() if kind else "p"
+        end = parse_square(target)
+        promotion = promotion.lower() if promotion else None
+
+        if legal is None:
+            candidates = piece_candidates(position, color + kind, end, from_file, from_rank)
+        else:
+            board = position.board
+            candidates = [
+                move
+                for move in legal
+                if move[1] == end
+                and board[move[0][1]][move[0][0]] == color + kind
+                and (from_file is None or FILES[move[0][0]] == from_file)
+                and (from_rank is None or RANKS[move[0][1]] == from_rank)
+            ]
+        candidates = [move for move in candidates if move[2] == promotion]
+
+    if legal is None:
+        matches = [
+            move for move in candidates if move[1] in position.generate_moves(move[0])
+        ]
+    else:
+        matches = [move for move in candidates if move in legal]
+
+    if len(matches) != 1:
+        problem = "Ambiguous" if matches else "Illegal"
+        raise ValueError(f"{problem} move: {san!r}")
+    return matches[0]
+
+
+def piece_candidates(position, piece, end, from_file, from_rank):
+    # (start, end, promotion) for every piece of this kind the SAN could mean,
+    # legality still to be checked
+    files = range(8) if from_file is None else (FILES.index(from_file),)
+    ranks = range(8) if from_rank is None else (RANKS.index(from_rank),)
+    if piece[1] == "p" and from_file is None:
+        # A pawn without a file in front of it is a push along its own file
+        files = (end[0],)
+
+    promotions = (None,)
+    if piece[1] == "p" and end[1] in (0, 7):
+        promotions = ("q", "r", "b", "n")
+
+    board = position.board
+    return [
+        ((x, y), end, promotion)
+        for y in ranks
+        for x in files
+        if board[y][x] == piece and in_reach(piece[1], (x, y), end)
+        for promotion in promotions
+    ]
+
+
+def in_reach(kind, start, end):
+    # Whether the piece's move shape joins the squares, ignoring blockers, so
+    # only pieces that might make the move have their moves generated
+    dx = abs(end[0] - start[0])
+    dy = abs(end[1] - start[1])
+    if kind == "n":
+        return (dx, dy) in ((1, 2), (2, 1))
+    if kind == "b":
+        return dx == dy
+    if kind == "r":
+        return dx == 0 or dy == 0
+    if kind == "q":
+        return dx == dy or dx == 0 or dy == 0
+    if kind == "k":
+        return dx <= 2 and dy <= 1
+    return dx <= 1 and 0 < dy <= 2
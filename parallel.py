@@ -0,0 +1,187 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from rules import STARTING_FEN, Position, decode_move, encode_move, move_to_uci
+from search import (
+    CHECK_INTERVAL,
+    MATE_SCORE,
+    Search,
+    SearchResult,
+    SearchStopped,
+    format_info,
+)
+from transposition import TranspositionTable
+
+# Per-process state, set up once by _init_worker
+_search = None
+_stop_event = None
+
+
+class WorkerSearch(Search):
+    # Also stops when the parent sets the shared event
+    def count_node(self):
+        if self.nodes % CHECK_INTERVAL == 0 and _stop_event.is_set():
+            raise SearchStopped
+        super().count_node()
+
+
+def _init_worker(hash_mb, stop_event):
+    global _search, _stop_event
+    _search = WorkerSearch(TranspositionTable(hash_mb))
+    _stop_event = stop_event
+
+
+def pack_position(position):
+    # FEN at the last capture or pawn move plus the move codes played since,
+    # so a worker sees the same repetition history as the caller
+    count = min(position.halfmove_clock, len(position.undo_stack))
+    records = position.undo_stack[len(position.undo_stack) - count :]
+    # None of these can be promotions, a pawn move would have reset the clock
+    moves = [(record[0], record[1], None) for record in records]
+
+    for _ in moves:
+        position.unmake_move()
+    fen = position.to_fen()
+    for move in moves:
+        position.make_move(*move)
+
+    return fen, [encode_move(move) for move in moves]
+
+
+def unpack_position(fen, move_codes):
+    position = Position.from_fen(fen)
+    for code in move_codes:
+        position.make_move(*decode_move(code))
+    return position
+
+
+def _search_root_moves(fen, move_codes, root_codes, depth, movetime, nodes):
+    # (score, pv codes) for every depth this worker finished, and its node count
+    position = unpack_position(fen, move_codes)
+    root_moves = [decode_move(code) for code in root_codes]
+    completed = []
+    result = _search.search(
+        position,
+        depth=depth,
+        movetime=movetime,
+        nodes=nodes,
+        root_moves=root_moves,
+        info=lambda result: completed.append(
+            (result.score, [encode_move(move) for move in result.pv])
+        ),
+    )
+    return completed, result.nodes
+
+
+class ParallelSearch:
+    # Splits the root moves between worker processes and keeps the best reply
+    def __init__(self, workers=None, hash_mb=16):
+        self.workers = workers or os.cpu_count() or 1
+        self.stop_event = multiprocessing.Event()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(hash_mb, self.stop_event),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.stop_event.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def search(self, position, depth=None, movetime=None, nodes=None):
+        started = time.perf_counter()
+        self.stop_event.clear()
+
+        moves = position.legal_moves()
+        if not moves:
+            result = SearchResult()
+            if position.is_in_check(position.turn[0]):
+                result.score = -MATE_SCORE
+            return result
+
+        if len(moves) == 1:
+            return SearchResult(moves[0], 0, 0, [moves[0]])
+
+        fen, move_codes = pack_position(position)
+        codes = [encode_move(move) for move in moves]
+        # Deal the moves round-robin so every worker gets a mix
+        shares = [codes[index :: self.workers] for index in range(self.workers)]
+        shares = [share for share in shares if share]
+        worker_nodes = nodes // len(shares) if nodes else None
+
+        futures = [
+            self.executor.submit(
+                _search_root_moves, fen, move_codes, share, depth, movetime, worker_nodes
+            )
+            for share in shares
+        ]
+        results = [future.result() for future in futures]
+
+        # Workers reach different depths under a time limit, so only compare
+        # their answers at the deepest depth every one of them finished
+        common = min(len(completed) for completed, _ in results)
+        searched = sum(count for _, count in results)
+        if not common:
+            return SearchResult(moves[0], 0, 0, [moves[0]], searched, time.perf_counter() - started)
+
+        score, pv = max((completed[common - 1] for completed, _ in results), key=lambda r: r[0])
+        return SearchResult(
+            decode_move(pv[0]),
+            score,
+            common,
+            [decode_move(code) for code in pv],
+            searched,
+            time.perf_counter() - started,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a position on several processes")
+    parser.add_argument("--fen", default=STARTING_FEN)
+    parser.add_argument("--depth", type=int)
+    parser.add_argument("--movetime", type=float, default=5.0, help="seconds to search")
+    parser.add_argument("--nodes", type=int)
+    parser.add_argument("--workers", type=int, help="worker processes, default one per core")
+    parser.add_argument("--hash", type=int, default=16, help="MB of transposition table per worker")
+    parser.add_argument(
+        "--scaling", action="store_true", help="compare nps from 1 worker up to --workers"
+    )
+    args = parser.parse_args(argv)
+
+    if args.scaling:
+        position = Position.from_fen(args.fen)
+        workers = args.workers or os.cpu_count() or 1
+        base = None
+        for count in range(1, workers + 1):
+            with ParallelSearch(count, args.hash) as search:
+                result = search.search(position, depth=args.depth, movetime=args.movetime)
+            base = base or result.nps or 1
+            print(f"{count} workers: {result.nps} nps, {result.nps / base:.2f}x")
+        return
+
+    with ParallelSearch(args.workers, args.hash) as search:
+        result = search.search(
+            Position.from_fen(args.fen),
+            depth=args.depth,
+            movetime=args.movetime,
+            nodes=args.nodes,
+        )
+
+    print(format_info(result))
+    print(f"bestmove {move_to_uci(result.move) if result.move else '(none)'}")
+
+
+if __name__ == "__main__":
+    main()
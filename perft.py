@@ -0,0 +1,132 @@
+import argparse
+import json
+import sys
+import time
+
+from bitboard import BitboardPosition
+from rules import STARTING_FEN, Position, move_to_uci
+
+BACKENDS = {
+    "rules": Position.from_fen,
+    "bitboard": BitboardPosition.from_fen,
+}
+
+
+def perft(position, depth):
+    moves = position.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+
+    nodes = 0
+    for move in moves:
+        position.make_move(*move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def divide(position, depth):
+    counts = {}
+    for move in position.legal_moves():
+        position.make_move(*move)
+        counts[move_to_uci(move)] = perft(position, depth - 1)
+        position.unmake_move()
+    return counts
+
+
+def run(fen, depth, backend="rules", split=False):
+    position = BACKENDS[backend](fen)
+
+    started = time.perf_counter()
+    if split:
+        counts = divide(position, depth)
+        nodes = sum(counts.values())
+    else:
+        counts = None
+        nodes = perft(position, depth)
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "fen": fen,
+        "depth": depth,
+        "backend": backend,
+        "nodes": nodes,
+        "seconds": round(elapsed, 6),
+        "nps": int(nodes / elapsed) if elapsed else 0,
+    }
+    if counts is not None:
+        result["divide"] = counts
+    return result
+
+
+def read_suite(path):
+    # EPD lines: "<fen> ;D1 20 ;D2 400 ..."
+    with open(path) as suite:
+        for line in suite:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            fields = line.split(";")
+            expected = {}
+            for field in fields[1:]:
+                name, count = field.split()
+                expected[int(name[1:])] = int(count)
+            yield fields[0].strip(), expected
+
+
+def run_suite(path, max_depth, backend, emit):
+    failures = 0
+    for fen, expected in read_suite(path):
+        for depth in sorted(expected):
+            if depth > max_depth:
+                break
+            result = run(fen, depth, backend)
+            result["expected"] = expected[depth]
+            result["passed"] = result["nodes"] == expected[depth]
+            failures += not result["passed"]
+            emit(result)
+    return failures
+
+
+def print_text(result):
+    for move, count in sorted(result.get("divide", {}).items()):
+        print(f"{move}: {count}")
+
+    status = ""
+    if "passed" in result:
+        status = " ok" if result["passed"] else f" FAIL (expected {result['expected']})"
+
+    print(
+        f"{result['fen']} depth {result['depth']}: {result['nodes']} nodes "
+        f"in {result['seconds']:.3f}s ({result['nps']} nps){status}"
+    )
+
+
+def print_json(result):
+    print(json.dumps(result), flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count move generator leaf nodes")
+    parser.add_argument("--fen", default=STARTING_FEN)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="show counts per root move")
+    parser.add_argument("--suite", help="EPD file of positions with ;D<n> <count> fields")
+    parser.add_argument("--max-depth", type=int, default=3, help="deepest suite depth to run")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="rules")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per result")
+    args = parser.parse_args(argv)
+
+    emit = print_json if args.json else print_text
+
+    if args.suite:
+        failures = run_suite(args.suite, args.max_depth, args.backend, emit)
+        return 1 if failures else 0
+
+    emit(run(args.fen, args.depth, args.backend, args.divide))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+import argparse
+import re
+import sys
+
+# The seven tags every PGN game carries, in the order they are written
+SEVEN_TAG_ROSTER = (
+    ("Event", "?"),
+    ("Site", "?"),
+    ("Date", "????.??.??"),
+    ("Round", "?"),
+    ("White", "?"),
+    ("Black", "?"),
+    ("Result", "*"),
+)
+# Move suffixes and the NAGs they stand for
+SUFFIX_NAGS = {"!": 1, "?": 2, "!!": 3, "??": 4, "!?": 5, "?!": 6}
+LINE_WIDTH = 80
+
+TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<comment>\{[^}]*\}|;[^\n]*)
+    |(?P<open>\()
+    |(?P<close>\))
+    |(?P<nag>\$\d+)
+    |(?P<result>1-0|0-1|1/2-1/2|\*)
+    |(?P<number>\d+\.+)
+    |(?P<move>[^\s{}();$]+)
+    """,
+    re.VERBOSE,
+)
+
+
+class PgnGame:
+    def __init__(self, headers=None, moves=None, result="*"):
+        self.headers = headers if headers is not None else {}
+        self.moves = moves if moves is not None else []
+        self.result = result
+        # Annotations keyed by the number of mainline moves played before them
+        self.comments = {}
+        self.nags = {}
+        self.variations = {}
+
+    def __repr__(self):
+        return (
+            f"PgnGame({self.headers.get('White', '?')} - {self.headers.get('Black', '?')}, "
+            f"{len(self.moves)} moves, {self.result})"
+        )
+
+
+def parse_movetext(text, game):
+    # Fills game with the mainline moves of text, comments, NAGs and the raw
+    # text of each variation, nested ones included
+    depth = 0
+    variation = []
+
+    for match in TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        token = match.group()
+
+        if depth:
+            if kind == "open":
+                depth += 1
+            elif kind == "close":
+                depth -= 1
+            if depth:
+                variation.append(token)
+            else:
+                # Variations replace the last mainline move
+                ply = len(game.moves) - 1
+                text = " ".join(variation).replace("( ", "(").replace(" )", ")")
+                game.variations.setdefault(ply, []).append(text)
+                variation = []
+            continue
+
+        if kind == "open":
+            depth = 1
+        elif kind == "comment":
+            body = token[1:-1] if token[0] == "{" else token[1:]
+            ply = len(game.moves)
+            if ply in game.comments:
+                game.comments[ply] += " " + body.strip()
+            else:
+                game.comments[ply] = body.strip()
+        elif kind == "nag":
+            game.nags.setdefault(len(game.moves), []).append(int(token[1:]))
+        elif kind == "result":
+            game.result = token
+        elif kind == "move":
+            move = token.rstrip("!?")
+            suffix = token[len(move) :]
+            if move:
+                game.moves.append(move)
+            if suffix in SUFFIX_NAGS:
+                game.nags.setdefault(len(game.moves), []).append(SUFFIX_NAGS[suffix])
+
+    return game
+
+
+def read_games(handle, headers_only=False):
+    # Yields a PgnGame per game in handle, reading one line at a time. With
+    # headers_only the movetext is skipped without being tokenized.
+    headers = {}
+    movetext = []
+    in_movetext = False
+    in_comment = False
+
+    def finish():
+        game = PgnGame(headers, result=headers.get("Result", "*"))
+        if not headers_only:
+            parse_movetext("".join(movetext), game)
+        return game
+
+    for line in handle:
+        if line.startswith("%"):
+            # Escaped line, ignored by every reader
+            continue
+        stripped = line.strip()
+
+        if not in_comment and stripped.startswith("["):
+            if in_movetext:
+                yield finish()
+                headers = {}
+                movetext = []
+                in_movetext = False
+            match = TAG_PATTERN.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+            continue
+
+        if not stripped:
+            continue
+
+        in_movetext = True
+        # Only brace comments can hide a line that looks like a tag pair
+        if in_comment or "{" in line:
+            in_comment = _ends_in_comment(line, in_comment)
+        if not headers_only:
+            movetext.append(line)
+
+    if in_movetext or headers:
+        yield finish()
+
+
+def _ends_in_comment(line, in_comment):
+    for char in line:
+        if in_comment:
+            in_comment = char != "}"
+        elif char == "{":
+            in_comment = True
+        elif char == ";":
+            break
+    return in_comment
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class PgnWriter:
+    # Writes games to handle as they are played: headers first, then moves one
+    # at a time wrapped at LINE_WIDTH, then the result
+    def __init__(self, handle):
+        self.handle = handle
+        self.line = ""
+        self.ply = 0
+
+    def write_headers(self, headers):
+        tags = dict(SEVEN_TAG_ROSTER)
+        tags.update(headers)
+        roster = [name for name, _ in SEVEN_TAG_ROSTER]
+        for name in roster + [name for name in tags if name not in roster]:
+            self.handle.write(f'[{name} "{_escape(tags[name])}"]\n')
+        self.handle.write("\n")
+        self.line = ""
+        self.ply = 0
+
+    def write_token(self, token):
+        if self.line and len(self.line) + 1 + len(token) > LINE_WIDTH:
+            self.handle.write(self.line + "\n")
+            self.line = token
+        else:
+            self.line = f"{self.line} {token}" if self.line else token
+
+    def write_move(self, san, comment=None, nags=()):
+        if self.ply % 2 == 0:
+            self.write_token(f"{self.ply // 2 + 1}.")
+        self.write_token(san)
+        for nag in nags:
+            self.write_token(f"${nag}")
+        if comment:
+            for word in f"{{{comment.replace('}', '')}}}".split():
+                self.write_token(word)
+        self.ply += 1
+
+    def finish(self, result="*"):
+        self.write_token(result)
+        self.handle.write(self.line + "\n\n")
+        self.line = ""
+        self.handle.flush()
+
+    def write_game(self, game):
+        headers = dict(game.headers)
+        headers["Result"] = game.result
+        self.write_headers(headers)
+        if 0 in game.comments:
+            self.write_token(f"{{{game.comments[0]}}}")
+        for ply, san in enumerate(game.moves, 1):
+            self.write_move(san, game.comments.get(ply), game.nags.get(ply, ()))
+            interrupted = ply in game.comments
+            for variation in game.variations.get(ply - 1, ()):
+                for token in f"({variation})".split():
+                    self.write_token(token)
+                interrupted = True
+            if interrupted and ply % 2 == 1 and ply < len(game.moves):
+                # Black's move needs its number again after a comment or variation
+                self.write_token(f"{ply // 2 + 1}...")
+        self.finish(game.result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List or copy the games in a PGN file")
+    parser.add_argument("path", help="PGN file to read, - for stdin")
+    parser.add_argument("--headers", action="store_true", help="only read the tag pairs")
+    parser.add_argument("--rewrite", action="store_true", help="write the games back out as PGN")
+    args = parser.parse_args(argv)
+
+    handle = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8", errors="replace")
+    writer = PgnWriter(sys.stdout)
+    count = 0
+    with handle:
+        for game in read_games(handle, headers_only=args.headers and not args.rewrite):
+            count += 1
+            if args.rewrite:
+                writer.write_game(game)
+            else:
+                print(f"{count}: {game!r}")
+
+    print(f"{count} games", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
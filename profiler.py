@@ -0,0 +1,131 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Durations kept per label for the percentiles, and events kept for the trace
+SAMPLES = 10000
+TRACE_EVENTS = 200000
+
+
+class Profiler:
+    # Times the (owner, method name) targets while enabled. The timing wrappers
+    # are only installed by enable() and removed again by disable(), so a
+    # disabled profiler leaves the original methods in place and costs nothing.
+    def __init__(self, targets=()):
+        self.targets = list(targets)
+        self.enabled = False
+        self.originals = {}
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.totals = {}
+        self.samples = {}
+        self.events = deque(maxlen=TRACE_EVENTS)
+        self.origin = time.perf_counter()
+
+    def enable(self):
+        if self.enabled:
+            return
+        for owner, name in self.targets:
+            original = owner.__dict__[name]
+            self.originals[(owner, name)] = original
+            setattr(owner, name, self.wrap(f"{owner.__name__}.{name}", original))
+        self.enabled = True
+
+    def disable(self):
+        for (owner, name), original in self.originals.items():
+            setattr(owner, name, original)
+        self.originals = {}
+        self.enabled = False
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    def wrap(self, label, function):
+        record = self.record
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(label, started, time.perf_counter())
+
+        return timed
+
+    @contextlib.contextmanager
+    def section(self, label):
+        # Times a block of code, only while the profiler is enabled
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(label, started, time.perf_counter())
+
+    def record(self, label, started, stopped):
+        duration = stopped - started
+        with self.lock:
+            self.calls[label] = self.calls.get(label, 0) + 1
+            self.totals[label] = self.totals.get(label, 0.0) + duration
+            if label not in self.samples:
+                self.samples[label] = deque(maxlen=SAMPLES)
+            self.samples[label].append(duration)
+            self.events.append((label, started, duration, threading.get_ident()))
+
+    def summary(self):
+        # [(label, calls, total, p50, p99)] in seconds, most total time first
+        rows = []
+        with self.lock:
+            for label, calls in self.calls.items():
+                durations = sorted(self.samples[label])
+                p50 = durations[len(durations) // 2]
+                p99 = durations[min(len(durations) - 1, len(durations) * 99 // 100)]
+                rows.append((label, calls, self.totals[label], p50, p99))
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows
+
+    def report(self):
+        lines = [f"{'name':<32} {'calls':>8} {'total ms':>10} {'p50 ms':>8} {'p99 ms':>8}"]
+        for label, calls, total, p50, p99 in self.summary():
+            lines.append(
+                f"{label:<32} {calls:>8} {total * 1000:>10.1f} "
+                f"{p50 * 1000:>8.3f} {p99 * 1000:>8.3f}"
+            )
+        return "\n".join(lines)
+
+    def dump_trace(self, path):
+        # Chrome trace event format, opens in chrome://tracing or Perfetto
+        with self.lock:
+            events = list(self.events)
+        pid = os.getpid()
+        trace = {
+            "traceEvents": [
+                {
+                    "name": label,
+                    "ph": "X",
+                    "ts": (started - self.origin) * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": pid,
+                    "tid": thread,
+                }
+                for label, started, duration, thread in events
+            ],
+            "displayTimeUnit": "ms",
+        }
+        with open(path, "w") as trace_file:
+            json.dump(trace, trace_file)
+        return len(events)
@@ -0,0 +1,66 @@
+import pygame
+
+from colors import BLACK, RED, YELLOW, with_alpha
+
+PIECES = ["wp", "wn", "wb", "wr", "wq", "wk", "bp", "bn", "bb", "br", "bq", "bk"]
+
+
+class RenderCache:
+    # Everything the board renderer blits, decoded and converted once. Scaled
+    # variants are kept per square size so a resize doesn't touch the disk.
+    def __init__(self, asset_dir="assets"):
+        self.asset_dir = asset_dir
+        self.sources = {}
+        self.sizes = {}
+
+    def source(self, name):
+        # Decoded PNG, converted to the display's pixel format on first use
+        if name not in self.sources:
+            image = pygame.image.load(f"{self.asset_dir}/{name}.png")
+            self.sources[name] = image.convert_alpha()
+        return self.sources[name]
+
+    def for_size(self, square_size):
+        if square_size not in self.sizes:
+            self.sizes[square_size] = SizedAssets(self, square_size)
+        return self.sizes[square_size]
+
+
+class SizedAssets:
+    def __init__(self, cache, square_size):
+        self.square_size = square_size
+        board_size = square_size * 8
+
+        self.board = pygame.transform.scale(cache.source("board"), (board_size, board_size))
+
+        # All pieces in one atlas surface, each piece a subsurface of it
+        atlas = pygame.Surface((square_size * len(PIECES), square_size), pygame.SRCALPHA)
+        rects = []
+        for index, piece in enumerate(PIECES):
+            image = pygame.transform.scale(cache.source(piece), (square_size, square_size))
+            rects.append(pygame.Rect(index * square_size, 0, square_size, square_size))
+            atlas.blit(image, rects[-1])
+        self.atlas = atlas.convert_alpha()
+        self.pieces = {piece: self.atlas.subsurface(rect) for piece, rect in zip(PIECES, rects)}
+
+        self.selection = self.square_overlay(with_alpha(YELLOW, 50))
+        self.check = self.square_overlay(with_alpha(RED, 150))
+        self.move_dot = self.square_overlay(with_alpha(BLACK, 0))
+        pygame.draw.circle(
+            self.move_dot,
+            with_alpha(RED, 100),
+            (square_size // 2, square_size // 2),
+            10,
+        )
+        self.dim = pygame.Surface((board_size, board_size), pygame.SRCALPHA)
+        self.dim.fill(with_alpha(BLACK, 70))
+
+        self.square_rects = [
+            pygame.Rect((sq % 8) * square_size, (sq // 8) * square_size, square_size, square_size)
+            for sq in range(64)
+        ]
+
+    def square_overlay(self, color):
+        overlay = pygame.Surface((self.square_size, self.square_size), pygame.SRCALPHA)
+        overlay.fill(color)
+        return overlay
@@ -0,0 +1,773 @@
+from notation import check_suffix, san_body
+from zobrist import BLACK_TO_MOVE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS, PIECE_KEYS, hash_position
+
+EMPTY_SQUARE = "--"
+EMPTY_POSITION = (None, None)
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+STARTING_BOARD = (
+    ("br", "bn", "bb", "bq", "bk", "bb", "bn", "br"),
+    ("bp",) * 8,
+    (EMPTY_SQUARE,) * 8,
+    (EMPTY_SQUARE,) * 8,
+    (EMPTY_SQUARE,) * 8,
+    (EMPTY_SQUARE,) * 8,
+    ("wp",) * 8,
+    ("wr", "wn", "wb", "wq", "wk", "wb", "wn", "wr"),
+)
+
+FILES = ["a", "b", "c", "d", "e", "f", "g", "h"]
+RANKS = [i for i in range(1, 9)]
+
+# (row, col) -> "e4"
+CHESS_SQUARES = {
+    (row, col): f"{FILES[col]}{RANKS[::-1][row]}" for row in range(8) for col in range(8)
+}
+
+KNIGHT_OFFSETS = ((2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1))
+KING_OFFSETS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+PROMOTIONS = "qrbn"
+PROMOTION_PIECES = [None, "n", "b", "r", "q"]
+PROMOTION_CODES = {piece: code for code, piece in enumerate(PROMOTION_PIECES)}
+
+
+def _step_targets(x, y, offsets):
+    return tuple(
+        (x + dx, y + dy) for dx, dy in offsets if 0 <= x + dx <= 7 and 0 <= y + dy <= 7
+    )
+
+
+def _rays(x, y, directions):
+    rays = []
+    for dx, dy in directions:
+        ray = []
+        cx, cy = x + dx, y + dy
+        while 0 <= cx <= 7 and 0 <= cy <= 7:
+            ray.append((cx, cy))
+            cx += dx
+            cy += dy
+        if ray:
+            rays.append(tuple(ray))
+    return tuple(rays)
+
+
+# Precomputed target squares and rays for every (x, y) square
+KNIGHT_TARGETS = {(x, y): _step_targets(x, y, KNIGHT_OFFSETS) for x in range(8) for y in range(8)}
+KING_TARGETS = {(x, y): _step_targets(x, y, KING_OFFSETS) for x in range(8) for y in range(8)}
+ROOK_RAYS = {(x, y): _rays(x, y, ROOK_DIRECTIONS) for x in range(8) for y in range(8)}
+BISHOP_RAYS = {(x, y): _rays(x, y, BISHOP_DIRECTIONS) for x in range(8) for y in range(8)}
+
+# Castling rights lost when a piece moves from or to these squares
+CASTLING_RIGHTS = {
+    (4, 7): "KQ",
+    (7, 7): "K",
+    (0, 7): "Q",
+    (4, 0): "kq",
+    (7, 0): "k",
+    (0, 0): "q",
+}
+
+
+# Castling right -> (king square, rook square) it needs
+CASTLING_HOME = {
+    "K": ((4, 7), (7, 7)),
+    "Q": ((4, 7), (0, 7)),
+    "k": ((4, 0), (7, 0)),
+    "q": ((4, 0), (0, 0)),
+}
+
+
+# FEN letter -> piece, "P" -> "wp"
+FEN_PIECES = {char: "w" + char.lower() for char in "PNBRQK"}
+FEN_PIECES.update({char: "b" + char for char in "pnbrqk"})
+
+
+def _parse_placement(placement, fen):
+    rows = placement.split("/")
+    if len(rows) != 8:
+        raise ValueError(f"Invalid FEN, expected 8 ranks: {fen!r}")
+
+    board = []
+    for row in rows:
+        squares = []
+        for char in row:
+            if char in FEN_PIECES:
+                squares.append(FEN_PIECES[char])
+            elif char in "12345678":
+                squares.extend([EMPTY_SQUARE] * int(char))
+            else:
+                raise ValueError(f"Invalid FEN piece {char!r}: {fen!r}")
+        if len(squares) != 8:
+            raise ValueError(f"Invalid FEN, rank {row!r} is not 8 squares: {fen!r}")
+        board.append(squares)
+    return board
+
+
+def parse_fen(fen):
+    # (board, turn, castling, en passant, halfmove clock, fullmove number).
+    # Raises ValueError for anything that isn't a legal chess position, apart
+    # from the side not to move being in check, which the position classes
+    # test once they are built. Castling rights without the king and rook at
+    # home are dropped, and so is an en passant square no pawn can take on.
+    fields = fen.split()
+    if len(fields) not in (4, 6):
+        raise ValueError(f"Invalid FEN: {fen!r}")
+
+    board = _parse_placement(fields[0], fen)
+    if fields[1] not in ("w", "b"):
+        raise ValueError(f"Invalid FEN, side to move must be w or b: {fen!r}")
+    turn = "white" if fields[1] == "w" else "black"
+
+    for color, king in (("w", "K"), ("b", "k")):
+        kings = fields[0].count(king)
+        if kings != 1:
+            raise ValueError(f"Invalid FEN, {kings} {color} kings: {fen!r}")
+    if any(piece[1] == "p" for piece in board[0] + board[7]):
+        raise ValueError(f"Invalid FEN, pawn on the first or last rank: {fen!r}")
+
+    rights = fields[2]
+    if rights != "-" and (
+        any(char not in "KQkq" for char in rights) or len(set(rights)) != len(rights)
+    ):
+        raise ValueError(f"Invalid FEN castling rights: {fen!r}")
+    castling = ""
+    for right, (king, rook) in CASTLING_HOME.items():
+        color = "w" if right.isupper() else "b"
+        if (
+            right in rights
+            and board[king[1]][king[0]] == color + "k"
+            and board[rook[1]][rook[0]] == color + "r"
+        ):
+            castling += right
+
+    en_passant = EMPTY_POSITION
+    if fields[3] != "-":
+        ep_rank = "6" if turn == "white" else "3"
+        if len(fields[3]) != 2 or fields[3][0] not in FILES or fields[3][1] != ep_rank:
+            raise ValueError(f"Invalid FEN en passant square: {fen!r}")
+        x = FILES.index(fields[3][0])
+        y = 8 - int(fields[3][1])
+        # The pawn that just double-pushed belongs to the side not to move,
+        # and went from the square behind the ep square to the one in front
+        pawn_y = y + 1 if turn == "white" else y - 1
+        origin_y = 2 * y - pawn_y
+        mover = "b" if turn == "white" else "w"
+        if (
+            board[pawn_y][x] != mover + "p"
+            or board[y][x] != EMPTY_SQUARE
+            or board[origin_y][x] != EMPTY_SQUARE
+        ):
+            raise ValueError(f"Invalid FEN en passant square: {fen!r}")
+        # Only recorded when a pawn of the side to move can take
+        if any(
+            0 <= x + dx <= 7 and board[pawn_y][x + dx] == fields[1] + "p" for dx in (-1, 1)
+        ):
+            en_passant = (x, y)
+
+    halfmove_clock, fullmove_number = 0, 1
+    if len(fields) == 6:
+        if not fields[4].isdigit() or not fields[5].isdigit():
+            raise ValueError(f"Invalid FEN move counters: {fen!r}")
+        halfmove_clock = int(fields[4])
+        fullmove_number = max(1, int(fields[5]))
+
+    return board, turn, castling, en_passant, halfmove_clock, fullmove_number
+
+
+def starting_board():
+    return [list(row) for row in STARTING_BOARD]
+
+
+def opposite(turn):
+    return "white" if turn == "black" else "black"
+
+
+class Position:
+    def __init__(self, board=None, turn="white"):
+        self.board = starting_board() if board is None else board
+        self.turn = turn
+        self.castling = "KQkq"
+        self.en_passant = EMPTY_POSITION
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.undo_stack = []
+        self.kings = self.find_kings()
+        self.hash = hash_position(self)
+        self.game_over = False
+        self.winner = None
+        self.move_history = []
+        self.captured_pieces = []
+
+    @classmethod
+    def from_fen(cls, fen):
+        board, turn, castling, en_passant, halfmove_clock, fullmove_number = parse_fen(fen)
+        position = cls(board, turn)
+        if position.is_in_check("b" if turn == "white" else "w"):
+            raise ValueError(f"Invalid FEN, the side not to move is in check: {fen!r}")
+
+        position.castling = castling
+        position.en_passant = en_passant
+        position.halfmove_clock = halfmove_clock
+        position.fullmove_number = fullmove_number
+        position.hash = hash_position(position)
+        return position
+
+    def to_fen(self):
+        rows = []
+        for row in self.board:
+            fen_row = ""
+            empty = 0
+            for piece in row:
+                if piece == EMPTY_SQUARE:
+                    empty += 1
+                    continue
+                if empty:
+                    fen_row += str(empty)
+                    empty = 0
+                fen_row += piece[1].upper() if piece[0] == "w" else piece[1]
+            if empty:
+                fen_row += str(empty)
+            rows.append(fen_row)
+
+        if self.en_passant == EMPTY_POSITION:
+            en_passant = "-"
+        else:
+            en_passant = CHESS_SQUARES[(self.en_passant[1], self.en_passant[0])]
+
+        return " ".join(
+            (
+                "/".join(rows),
+                self.turn[0],
+                self.castling or "-",
+                en_passant,
+                str(self.halfmove_clock),
+                str(self.fullmove_number),
+            )
+        )
+
+    def find_kings(self):
+        kings = {"w": EMPTY_POSITION, "b": EMPTY_POSITION}
+        for y in range(8):
+            for x in range(8):
+                if self.board[y][x][1] == "k":
+                    kings[self.board[y][x][0]] = (x, y)
+        return kings
+
+    def play_move(self, start, end, promotion=None):
+        # If not player's turn do nothing
+        piece = self.board[start[1]][start[0]]
+        if piece[0] != self.turn[0]:
+            return False
+
+        if piece[1] == "p" and end[1] in (0, 7):
+            promotion = promotion or "q"
+        else:
+            promotion = None
+
+        # One move list both checks the move and disambiguates its SAN
+        legal = self.legal_moves()
+        move = (start, end, promotion)
+        if move not in legal:
+            return False
+
+        san = san_body(self.board, move, legal)
+        self.make_move(start, end, promotion)
+        captured_piece = self.undo_stack[-1][3]
+
+        if captured_piece != EMPTY_SQUARE:
+            self.captured_pieces.append(captured_piece)
+
+        is_check = self.is_in_check(self.turn[0])
+        has_legal_moves = self.has_legal_moves()
+
+        if not has_legal_moves:
+            self.game_over = True
+            if is_check:
+                self.winner = opposite(self.turn)
+
+        self.move_history.append(san + check_suffix(is_check, has_legal_moves))
+        return True
+
+    def make_move(self, start, end, promotion=None):
+        sx, sy = start
+        ex, ey = end
+        board = self.board
+        piece = board[sy][sx]
+        capture_square = end
+
+        if piece[1] == "p" and end == self.en_passant:
+            # En passant, the captured pawn sits beside the start square
+            capture_square = (ex, sy)
+
+        captured = board[capture_square[1]][capture_square[0]]
+        key = self.hash
+
+        self.undo_stack.append(
+            (
+                start,
+                end,
+                piece,
+                captured,
+                capture_square,
+                self.castling,
+                self.en_passant,
+                self.halfmove_clock,
+                key,
+            )
+        )
+
+        key ^= PIECE_KEYS[piece][sy * 8 + sx]
+        board[sy][sx] = EMPTY_SQUARE
+
+        if captured != EMPTY_SQUARE:
+            key ^= PIECE_KEYS[captured][capture_square[1] * 8 + capture_square[0]]
+            board[capture_square[1]][capture_square[0]] = EMPTY_SQUARE
+
+        if self.en_passant != EMPTY_POSITION:
+            key ^= EN_PASSANT_KEYS[self.en_passant[0]]
+            self.en_passant = EMPTY_POSITION
+
+        placed = piece
+
+        if piece[1] == "p":
+            if abs(ey - sy) == 2:
+                self.set_en_passant(ex, (sy + ey) // 2, ey, piece[0])
+                if self.en_passant != EMPTY_POSITION:
+                    key ^= EN_PASSANT_KEYS[ex]
+            elif ey == 0 or ey == 7:
+                placed = piece[0] + (promotion or "q")
+
+        elif piece[1] == "k":
+            self.kings[piece[0]] = end
+
+            if abs(ex - sx) == 2:
+                rook_from, rook_to = (7, 5) if ex > sx else (0, 3)
+                rook = board[sy][rook_from]
+                key ^= PIECE_KEYS[rook][sy * 8 + rook_from] ^ PIECE_KEYS[rook][sy * 8 + rook_to]
+                board[sy][rook_to] = rook
+                board[sy][rook_from] = EMPTY_SQUARE
+
+        key ^= PIECE_KEYS[placed][ey * 8 + ex]
+        board[ey][ex] = placed
+
+        if self.castling:
+            for square in (start, end):
+                if square in CASTLING_RIGHTS:
+                    for right in CASTLING_RIGHTS[square]:
+                        if right in self.castling:
+                            key ^= CASTLING_KEYS[right]
+                            self.castling = self.castling.replace(right, "")
+
+        if piece[1] == "p" or captured != EMPTY_SQUARE:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+
+        if self.turn == "black":
+            self.fullmove_number += 1
+        self.turn = opposite(self.turn)
+        self.hash = key ^ BLACK_TO_MOVE_KEY
+
+    def set_en_passant(self, x, y, pawn_y, color):
+        # Only record the square when an enemy pawn can actually take
+        enemy_pawn = ("b" if color == "w" else "w") + "p"
+        for dx in (-1, 1):
+            if 0 <= x + dx <= 7 and self.board[pawn_y][x + dx] == enemy_pawn:
+                self.en_passant = (x, y)
+                return
+
+    def unmake_move(self):
+        (
+            start,
+            end,
+            piece,
+            captured,
+            capture_square,
+            castling,
+            en_passant,
+            halfmove_clock,
+            key,
+        ) = self.undo_stack.pop()
+        sx, sy = start
+        ex, ey = end
+        board = self.board
+
+        self.turn = opposite(self.turn)
+        if self.turn == "black":
+            self.fullmove_number -= 1
+
+        board[ey][ex] = EMPTY_SQUARE
+        board[capture_square[1]][capture_square[0]] = captured
+        board[sy][sx] = piece
+
+        if piece[1] == "k":
+            self.kings[piece[0]] = start
+
+            if abs(ex - sx) == 2:
+                rook_from, rook_to = (7, 5) if ex > sx else (0, 3)
+                board[sy][rook_from] = board[sy][rook_to]
+                board[sy][rook_to] = EMPTY_SQUARE
+
+        self.castling = castling
+        self.en_passant = en_passant
+        self.halfmove_clock = halfmove_clock
+        self.hash = key
+
+    def generate_moves(self, pos):
+        return self.filter_illegal_moves(pos, self.piece_moves(pos))
+
+    def piece_moves(self, pos):
+        # Pseudo-legal destinations for the piece on pos
+        x, y = pos
+        piece = self.board[y][x]
+        moves = []
+
+        if piece == EMPTY_SQUARE:
+            return moves
+
+        color = piece[0]
+        kind = piece[1]
+
+        if kind == "p":
+            direction = -1 if color == "w" else 1
+
+            if not 0 <= y + direction <= 7:
+                return moves
+
+            if (color == "w" and y == 6) or (color == "b" and y == 1):
+                if (
+                    self.board[y + direction][x] == EMPTY_SQUARE
+                    and self.board[y + (direction * 2)][x] == EMPTY_SQUARE
+                ):
+                    moves.append((x, y + (direction * 2)))
+
+            if self.board[y + direction][x] == EMPTY_SQUARE:
+                moves.append((x, y + direction))
+
+            for dx in (1, -1):
+                if 0 <= x + dx <= 7:
+                    target_square = self.board[y + direction][x + dx]
+                    if target_square != EMPTY_SQUARE and target_square[0] != color:
+                        moves.append((x + dx, y + direction))
+                    elif (x + dx, y + direction) == self.en_passant and color == self.turn[0]:
+                        moves.append((x + dx, y + direction))
+
+        if kind == "n" or kind == "k":
+            offsets = KNIGHT_OFFSETS if kind == "n" else KING_OFFSETS
+
+            for dx, dy in offsets:
+                mx, my = x + dx, y + dy
+                if (mx < 0) or (mx > 7) or (my < 0) or (my > 7):
+                    continue
+                if (
+                    self.board[my][mx] == EMPTY_SQUARE
+                    or self.board[my][mx][0] != color
+                ):
+                    moves.append((mx, my))
+
+            if kind == "k":
+                moves.extend(self.castling_moves(color))
+
+        if kind == "r" or kind == "b" or kind == "q":
+            if kind == "r":
+                directions = ROOK_DIRECTIONS
+            elif kind == "b":
+                directions = BISHOP_DIRECTIONS
+            else:
+                directions = QUEEN_DIRECTIONS
+
+            for dx, dy in directions:
+                current_x = x
+                current_y = y
+
+                while True:
+                    current_y += dy
+                    current_x += dx
+
+                    if (
+                        (current_x < 0)
+                        or (current_x > 7)
+                        or (current_y < 0)
+                        or (current_y > 7)
+                    ):
+                        break
+
+                    square = self.board[current_y][current_x]
+
+                    if square == EMPTY_SQUARE:
+                        moves.append((current_x, current_y))
+                        continue
+
+                    if square[0] != color:
+                        moves.append((current_x, current_y))
+
+                    break
+
+        return moves
+
+    def castling_moves(self, color):
+        rights = "KQ" if color == "w" else "kq"
+        row = 7 if color == "w" else 0
+        moves = []
+
+        if not (rights[0] in self.castling or rights[1] in self.castling):
+            return moves
+
+        if self.board[row][4] != color + "k":
+            return moves
+
+        opp_color = "b" if color == "w" else "w"
+        if self.is_square_attacked((4, row), opp_color):
+            return moves
+
+        # (right, rook file, squares that must be empty, squares the king crosses)
+        for right, rook_x, empty, path in (
+            (rights[0], 7, (5, 6), (5, 6)),
+            (rights[1], 0, (1, 2, 3), (3, 2)),
+        ):
+            if right not in self.castling or self.board[row][rook_x] != color + "r":
+                continue
+            if any(self.board[row][x] != EMPTY_SQUARE for x in empty):
+                continue
+            if any(self.is_square_attacked((x, row), opp_color) for x in path):
+                continue
+            moves.append((path[-1], row))
+
+        return moves
+
+    def filter_illegal_moves(self, pos, moves):
+        legal_moves = []
+        sx, sy = pos
+        color = self.board[sy][sx][0]
+
+        for move in moves:
+            self.make_move(pos, move)
+
+            if not self.is_in_check(color):
+                legal_moves.append(move)
+
+            self.unmake_move()
+
+        return legal_moves
+
+    def is_square_attacked(self, square, by_color):
+        # Look outward from the square for anything of by_color hitting it
+        board = self.board
+        x, y = square
+
+        pawn_y = y + 1 if by_color == "w" else y - 1
+        if 0 <= pawn_y <= 7:
+            pawn = by_color + "p"
+            if x > 0 and board[pawn_y][x - 1] == pawn:
+                return True
+            if x < 7 and board[pawn_y][x + 1] == pawn:
+                return True
+
+        knight = by_color + "n"
+        for tx, ty in KNIGHT_TARGETS[square]:
+            if board[ty][tx] == knight:
+                return True
+
+        king = by_color + "k"
+        for tx, ty in KING_TARGETS[square]:
+            if board[ty][tx] == king:
+                return True
+
+        for sliders, rays in (("rq", ROOK_RAYS[square]), ("bq", BISHOP_RAYS[square])):
+            for ray in rays:
+                for tx, ty in ray:
+                    target = board[ty][tx]
+                    if target == EMPTY_SQUARE:
+                        continue
+                    if target[0] == by_color and target[1] in sliders:
+                        return True
+                    break
+
+        return False
+
+    def is_in_check(self, color):
+        king_position = self.kings[color]
+        if king_position == EMPTY_POSITION:
+            return False
+
+        return self.is_square_attacked(king_position, "b" if color == "w" else "w")
+
+    def repetitions(self):
+        # Earlier occurrences of this position, using the hashes kept in the
+        # undo records back to the last capture or pawn move
+        stack = self.undo_stack
+        limit = min(self.halfmove_clock, len(stack))
+        count = 0
+        for back in range(4, limit + 1, 2):
+            if stack[-back][8] == self.hash:
+                count += 1
+        return count
+
+    def checks_and_pins(self, color):
+        # Squares a piece may move to in order to resolve each check, and
+        # the line each pinned piece is confined to, looking out from the king
+        board = self.board
+        king = self.kings[color]
+        kx, ky = king
+        opp_color = "b" if color == "w" else "w"
+        checks = []
+        pins = {}
+
+        pawn_y = ky - 1 if color == "w" else ky + 1
+        if 0 <= pawn_y <= 7:
+            for px in (kx - 1, kx + 1):
+                if 0 <= px <= 7 and board[pawn_y][px] == opp_color + "p":
+                    checks.append({(px, pawn_y)})
+
+        for tx, ty in KNIGHT_TARGETS[king]:
+            if board[ty][tx] == opp_color + "n":
+                checks.append({(tx, ty)})
+
+        for sliders, rays in (("rq", ROOK_RAYS[king]), ("bq", BISHOP_RAYS[king])):
+            for ray in rays:
+                blocker = EMPTY_POSITION
+                for index, (tx, ty) in enumerate(ray):
+                    target = board[ty][tx]
+                    if target == EMPTY_SQUARE:
+                        continue
+                    if target[0] == color:
+                        if blocker != EMPTY_POSITION:
+                            break
+                        blocker = (tx, ty)
+                        continue
+                    if target[1] in sliders:
+                        line = set(ray[: index + 1])
+                        if blocker == EMPTY_POSITION:
+                            checks.append(line)
+                        else:
+                            pins[blocker] = line
+                    break
+
+        return checks, pins
+
+    def legal_moves(self, color=None):
+        return list(self.iter_legal_moves(color))
+
+    def has_legal_moves(self, color=None):
+        for _ in self.iter_legal_moves(color):
+            return True
+        return False
+
+    def iter_legal_moves(self, color=None):
+        # Yields (start, end, promotion) for every legal move of color, the
+        # side to move by default
+        color = color or self.turn[0]
+        opp_color = "b" if color == "w" else "w"
+        board = self.board
+        king = self.kings[color]
+        kx, ky = king
+        checks, pins = self.checks_and_pins(color)
+
+        # The king can't hide from a slider by stepping along its ray
+        board[ky][kx] = EMPTY_SQUARE
+        for tx, ty in KING_TARGETS[king]:
+            if board[ty][tx][0] == color:
+                continue
+            if not self.is_square_attacked((tx, ty), opp_color):
+                board[ky][kx] = color + "k"
+                yield king, (tx, ty), None
+                board[ky][kx] = EMPTY_SQUARE
+        board[ky][kx] = color + "k"
+
+        if len(checks) > 1:
+            return
+
+        if not checks:
+            for end in self.castling_moves(color):
+                yield king, end, None
+
+        evasions = checks[0] if checks else None
+        last_rank = 0 if color == "w" else 7
+        # The en passant square only belongs to the side to move
+        en_passant = self.en_passant if color == self.turn[0] else EMPTY_POSITION
+
+        for y in range(8):
+            for x in range(8):
+                piece = board[y][x]
+                if piece[0] != color or piece[1] == "k":
+                    continue
+
+                start = (x, y)
+                pin = pins.get(start)
+
+                for end in self.piece_moves(start):
+                    if piece[1] == "p" and end == en_passant:
+                        # En passant can uncover the king along the rank, so test it directly
+                        self.make_move(start, end)
+                        in_check = self.is_in_check(color)
+                        self.unmake_move()
+                        if not in_check:
+                            yield start, end, None
+                        continue
+
+                    if evasions is not None and end not in evasions:
+                        continue
+                    if pin is not None and end not in pin:
+                        continue
+
+                    if piece[1] == "p" and end[1] == last_rank:
+                        for promotion in PROMOTIONS:
+                            yield start, end, promotion
+                    else:
+                        yield start, end, None
+
+    def is_checkmate(self, color):
+        return self.is_in_check(color) and not self.has_legal_moves(color)
+
+    def is_stalemate(self, color):
+        return not self.is_in_check(color) and not self.has_legal_moves(color)
+
+
+def move_to_uci(move):
+    # ((4, 6), (4, 4), None) -> "e2e4"
+    start, end, promotion = move
+    return (
+        CHESS_SQUARES[(start[1], start[0])]
+        + CHESS_SQUARES[(end[1], end[0])]
+        + (promotion or "")
+    )
+
+
+def move_from_uci(text):
+    # "e7e8q" -> ((4, 1), (4, 0), "q")
+    if len(text) not in (4, 5) or text[0] not in FILES or text[2] not in FILES:
+        raise ValueError(f"Invalid move: {text!r}")
+    if text[1] not in "12345678" or text[3] not in "12345678":
+        raise ValueError(f"Invalid move: {text!r}")
+    if len(text) == 5 and text[4] not in PROMOTIONS:
+        raise ValueError(f"Invalid move: {text!r}")
+
+    return (
+        (FILES.index(text[0]), 8 - int(text[1])),
+        (FILES.index(text[2]), 8 - int(text[3])),
+        text[4] if len(text) == 5 else None,
+    )
+
+
+def encode_move(move):
+    # 16-bit code: from square | to square << 6 | promotion << 12, squares y * 8 + x
+    start, end, promotion = move
+    return (
+        (start[1] * 8 + start[0])
+        | ((end[1] * 8 + end[0]) << 6)
+        | (PROMOTION_CODES[promotion] << 12)
+    )
+
+
+def decode_move(code):
+    from_sq = code & 0x3F
+    to_sq = (code >> 6) & 0x3F
+    return (
+        (from_sq % 8, from_sq // 8),
+        (to_sq % 8, to_sq // 8),
+        PROMOTION_PIECES[code >> 12],
+    )
@@ -0,0 +1,354 @@
+import argparse
+import time
+
+from evaluation import PIECE_VALUES, evaluate
+from rules import EMPTY_SQUARE, STARTING_FEN, Position, decode_move, encode_move, move_to_uci
+from tablebase import Tablebase
+from transposition import EXACT, LOWER_BOUND, UPPER_BOUND, TranspositionTable
+
+MATE_SCORE = 100000
+# Scores beyond this are mates, with the distance in plies encoded below MATE_SCORE
+MATE_THRESHOLD = MATE_SCORE - 1000
+INFINITY = 1000000
+MAX_PLY = 64
+# How many nodes to search between clock checks
+CHECK_INTERVAL = 1024
+
+
+class SearchStopped(Exception):
+    pass
+
+
+class SearchResult:
+    def __init__(self, move=None, score=0, depth=0, pv=None, nodes=0, seconds=0.0):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.pv = pv or []
+        self.nodes = nodes
+        self.seconds = seconds
+
+    @property
+    def nps(self):
+        return int(self.nodes / self.seconds) if self.seconds else 0
+
+    @property
+    def mate_in(self):
+        # Moves to mate, negative when we are getting mated, None if no mate found
+        if abs(self.score) < MATE_THRESHOLD:
+            return None
+        plies = MATE_SCORE - abs(self.score)
+        moves = (plies + 1) // 2
+        return moves if self.score > 0 else -moves
+
+
+def tablebase_score(value):
+    # Tablebase value (n > 0 mates in n plies, n < 0 mated in -n - 1) as a score
+    if value > 0:
+        return MATE_SCORE - value
+    if value < 0:
+        return -(MATE_SCORE + value + 1)
+    return 0
+
+
+def score_to_table(score, ply):
+    # Mate scores are stored relative to the node rather than the root
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+class Search:
+    def __init__(self, tt=None, tablebase=None):
+        # Pass the same table to several searches to keep what they learned
+        self.tt = tt if tt is not None else TranspositionTable()
+        # Endgames the tablebase covers are answered without searching
+        self.tablebase = tablebase
+        self.nodes = 0
+        self.stop_requested = False
+        self.deadline = None
+        self.node_limit = None
+        self.pv = [[] for _ in range(MAX_PLY + 1)]
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.history = {}
+
+    def stop(self):
+        # Safe to call from another thread. A stop that arrives before the
+        # search has started still applies to it, and is cleared when it returns.
+        self.stop_requested = True
+
+    def search(
+        self, position, depth=None, movetime=None, nodes=None, info=None, root_moves=None
+    ):
+        try:
+            return self.iterate(position, depth, movetime, nodes, info, root_moves)
+        finally:
+            self.stop_requested = False
+
+    def iterate(self, position, depth, movetime, nodes, info, root_moves):
+        # Iterative deepening until depth, movetime (seconds) or nodes runs out,
+        # or stop() is called. info(result) is called after every finished depth.
+        started = time.perf_counter()
+        self.deadline = started + movetime if movetime else None
+        self.node_limit = nodes
+        self.nodes = 0
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.history = {}
+        self.tt.new_search()
+
+        if self.tablebase is not None and not root_moves:
+            found = self.tablebase.best_move(position)
+            if found is not None and found[0] is not None:
+                move, value = found
+                return SearchResult(
+                    move, tablebase_score(value), 0, [move], 0, time.perf_counter() - started
+                )
+
+        moves = list(root_moves) if root_moves else position.legal_moves()
+        result = SearchResult()
+
+        if not moves:
+            if position.is_in_check(position.turn[0]):
+                result.score = -MATE_SCORE
+            return result
+
+        result.move = moves[0]
+        undo_depth = len(position.undo_stack)
+        max_depth = min(depth or MAX_PLY, MAX_PLY)
+
+        for current_depth in range(1, max_depth + 1):
+            try:
+                score, pv = self.search_root(position, moves, current_depth)
+            except SearchStopped:
+                # Unwind whatever the interrupted iteration left on the board
+                while len(position.undo_stack) > undo_depth:
+                    position.unmake_move()
+                break
+
+            result = SearchResult(
+                pv[0], score, current_depth, pv, self.nodes, time.perf_counter() - started
+            )
+            if info:
+                info(result)
+
+            # Search the best move first next iteration
+            moves.remove(pv[0])
+            moves.insert(0, pv[0])
+
+            # A subset of the root moves keeps deepening even after a mate
+            # score, the caller compares it with the other subsets by depth
+            if root_moves:
+                continue
+            if abs(score) >= MATE_THRESHOLD or len(moves) == 1:
+                break
+
+        result.nodes = self.nodes
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def search_root(self, position, moves, depth):
+        alpha = -INFINITY
+        beta = INFINITY
+        best_pv = [moves[0]]
+
+        for move in moves:
+            position.make_move(*move)
+            score = -self.negamax(position, depth - 1, -beta, -alpha, 1)
+            position.unmake_move()
+
+            if score > alpha:
+                alpha = score
+                best_pv = [move] + self.pv[1]
+
+        return alpha, best_pv
+
+    def count_node(self):
+        self.nodes += 1
+
+        if self.stop_requested:
+            raise SearchStopped
+        if self.nodes % CHECK_INTERVAL == 0:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchStopped
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchStopped
+
+    def negamax(self, position, depth, alpha, beta, ply):
+        self.pv[ply] = []
+
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(position, alpha, beta, ply)
+
+        self.count_node()
+
+        if position.halfmove_clock >= 100 or position.repetitions():
+            return 0
+
+        key = position.hash
+        entry = self.tt.probe(key)
+        tt_move = None
+
+        if entry is not None:
+            entry_depth, entry_score, bound, move_code = entry
+            if move_code:
+                tt_move = decode_move(move_code)
+            if entry_depth >= depth:
+                score = score_from_table(entry_score, ply)
+                if (
+                    bound == EXACT
+                    or (bound == LOWER_BOUND and score >= beta)
+                    or (bound == UPPER_BOUND and score <= alpha)
+                ):
+                    return score
+
+        color = position.turn[0]
+        in_check = position.is_in_check(color)
+        moves = position.legal_moves()
+
+        if not moves:
+            return -MATE_SCORE + ply if in_check else 0
+
+        if in_check:
+            depth += 1
+
+        original_alpha = alpha
+        best = -INFINITY
+        best_move = None
+        for move in self.order_moves(position, moves, ply, tt_move):
+            position.make_move(*move)
+            score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move()
+
+            if score > best:
+                best = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+            if alpha >= beta:
+                if not self.is_capture(position, move):
+                    self.store_cutoff(move, depth, ply)
+                break
+
+        if best <= original_alpha:
+            bound = UPPER_BOUND
+        elif best >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.tt.store(key, depth, score_to_table(best, ply), bound, encode_move(best_move))
+
+        return best
+
+    def quiescence(self, position, alpha, beta, ply):
+        self.count_node()
+
+        stand_pat = evaluate(position)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        captures = [
+            move for move in position.legal_moves() if self.is_capture(position, move)
+        ]
+
+        for move in self.order_moves(position, captures, ply):
+            position.make_move(*move)
+            score = -self.quiescence(position, -beta, -alpha, ply + 1)
+            position.unmake_move()
+
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+
+        return alpha
+
+    def is_capture(self, position, move):
+        start, end, promotion = move
+        if promotion or position.board[end[1]][end[0]] != EMPTY_SQUARE:
+            return True
+        return end == position.en_passant and position.board[start[1]][start[0]][1] == "p"
+
+    def store_cutoff(self, move, depth, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        key = (move[0], move[1])
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+    def order_moves(self, position, moves, ply, best_move=None):
+        board = position.board
+        killers = self.killers[ply]
+        history = self.history
+
+        def score(move):
+            if move == best_move:
+                return 10000000
+            start, end, promotion = move
+            victim = board[end[1]][end[0]]
+            if victim != EMPTY_SQUARE:
+                # Most valuable victim, least valuable attacker
+                attacker = board[start[1]][start[0]][1]
+                return 1000000 + 10 * PIECE_VALUES[victim[1]] - PIECE_VALUES[attacker]
+            if promotion:
+                return 900000 + PIECE_VALUES[promotion]
+            if move == killers[0]:
+                return 800000
+            if move == killers[1]:
+                return 700000
+            return history.get((start, end), 0)
+
+        return sorted(moves, key=score, reverse=True)
+
+
+def format_info(result):
+    if result.mate_in is not None:
+        score = f"mate {result.mate_in}"
+    else:
+        score = f"cp {result.score}"
+
+    return (
+        f"depth {result.depth} score {score} nodes {result.nodes} "
+        f"nps {result.nps} time {int(result.seconds * 1000)} "
+        f"pv {' '.join(move_to_uci(move) for move in result.pv)}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a position for the best move")
+    parser.add_argument("--fen", default=STARTING_FEN)
+    parser.add_argument("--depth", type=int)
+    parser.add_argument("--movetime", type=float, default=5.0, help="seconds to search")
+    parser.add_argument("--nodes", type=int)
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB")
+    parser.add_argument("--tablebase", help="directory of endgame tables")
+    args = parser.parse_args(argv)
+
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+    search = Search(TranspositionTable(args.hash), tablebase)
+    result = search.search(
+        Position.from_fen(args.fen),
+        depth=args.depth,
+        movetime=args.movetime,
+        nodes=args.nodes,
+        info=lambda result: print(format_info(result), flush=True),
+    )
+    print(f"bestmove {move_to_uci(result.move) if result.move else '(none)'}")
+    print(f"hash {search.tt.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+
+from book import OpeningBook
+from pgn import PgnGame, PgnWriter
+from rules import Position, move_from_uci
+from search import Search
+from transposition import TranspositionTable
+
+PLAYERS = ("random", "engine", "script")
+
+# Per-process state, set up once by _init_worker
+_config = None
+_search = None
+_book = None
+
+
+def _init_worker(config):
+    global _config, _search, _book
+    _config = config
+    if "engine" in (config["white"], config["black"]):
+        _search = Search(TranspositionTable(config["hash"]))
+        if config["book"]:
+            _book = OpeningBook(config["book"])
+
+
+def game_result(position, plies, max_plies):
+    # (PGN result, termination) once the game is over, otherwise None
+    if position.game_over:
+        if position.winner == "white":
+            return "1-0", "checkmate"
+        if position.winner == "black":
+            return "0-1", "checkmate"
+        return "1/2-1/2", "stalemate"
+    if position.halfmove_clock >= 100:
+        return "1/2-1/2", "fifty-move rule"
+    if position.repetitions() >= 2:
+        return "1/2-1/2", "threefold repetition"
+    if bare_kings(position):
+        return "1/2-1/2", "insufficient material"
+    if plies >= max_plies:
+        return "*", "ply limit"
+    return None
+
+
+def bare_kings(position):
+    # Only the two kings left, the one material draw random games reach often
+    # (promotions can bring pieces back, so count the board)
+    return sum(square[1] != "-" for row in position.board for square in row) == 2
+
+
+def choose_move(position, player, rng):
+    if player == "engine":
+        move = _book.choose(position, rng) if _book is not None else None
+        if move is not None:
+            return move
+        result = _search.search(
+            position,
+            depth=_config["depth"],
+            movetime=_config["movetime"],
+            nodes=_config["nodes"],
+        )
+        return result.move
+
+    return rng.choice(position.legal_moves())
+
+
+def play_game(task):
+    index, script = task
+    rng = random.Random(_config["seed"] + index)
+    script = list(script)
+    if _search is not None:
+        _search.tt.clear()
+
+    position = Position()
+    plies = 0
+    result = None
+
+    while result is None:
+        player = _config[position.turn]
+        if player == "script":
+            # Scripted games stop where their line runs out, and a malformed
+            # line ends this game only, the rest keep going
+            try:
+                move = move_from_uci(script.pop(0)) if script else None
+            except ValueError:
+                result = ("*", "illegal scripted move")
+                break
+        else:
+            move = choose_move(position, player, rng)
+        if move is None:
+            result = ("*", "end of script")
+            break
+        # Moves go through play_move just as they do from the board
+        if not position.play_move(*move):
+            if player != "script":
+                raise ValueError(f"Game {index + 1}: illegal move {move} for {position.turn}")
+            result = ("*", "illegal scripted move")
+            break
+        plies += 1
+        result = game_result(position, plies, _config["max_plies"])
+
+    return index, position.move_history, result[0], result[1]
+
+
+def game_record(index, moves, result, termination, white, black):
+    headers = {
+        "Event": "Self-play",
+        "Round": str(index + 1),
+        "White": white,
+        "Black": black,
+        "Termination": termination,
+    }
+    return PgnGame(headers, moves, result)
+
+
+def read_scripts(path):
+    # One game per line, moves in coordinate notation: "e2e4 e7e5 g1f3"
+    with open(path) as scripts:
+        return [line.split() for line in scripts if line.strip() and not line.startswith("#")]
+
+
+def run(games, config, output, workers=None, scripts=None):
+    # Plays the games on a pool of processes and writes each one to output as
+    # soon as it finishes, returns a summary of the run
+    scripts = scripts or [[]]
+    tasks = ((index, scripts[index % len(scripts)]) for index in range(games))
+    writer = PgnWriter(output)
+    results = {}
+    plies = 0
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers, _init_worker, (config,)) as pool:
+        for index, moves, result, termination in pool.imap_unordered(play_game, tasks):
+            writer.write_game(
+                game_record(index, moves, result, termination, config["white"], config["black"])
+            )
+            plies += len(moves)
+            results[result] = results.get(result, 0) + 1
+    elapsed = time.perf_counter() - started
+
+    return {
+        "games": games,
+        "plies": plies,
+        "seconds": elapsed,
+        "games_per_second": games / elapsed if elapsed else 0.0,
+        "plies_per_second": plies / elapsed if elapsed else 0.0,
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play games between computer players")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--white", choices=PLAYERS, default="random")
+    parser.add_argument("--black", choices=PLAYERS, default="random")
+    parser.add_argument("--script", help="file of games in coordinate notation, one per line")
+    parser.add_argument("--workers", type=int, help="worker processes, default one per core")
+    parser.add_argument("--output", default="-", help="PGN file to write, - for stdout")
+    parser.add_argument("--max-plies", type=int, default=300, help="stop unfinished games here")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random players")
+    parser.add_argument("--depth", type=int, help="engine search depth")
+    parser.add_argument("--movetime", type=float, help="engine seconds per move")
+    parser.add_argument("--nodes", type=int, help="engine nodes per move")
+    parser.add_argument("--hash", type=int, default=16, help="MB of transposition table per worker")
+    parser.add_argument("--book", help="opening book for engine players")
+    args = parser.parse_args(argv)
+
+    if "script" in (args.white, args.black) and not args.script:
+        parser.error("script players need --script")
+
+    config = {
+        "white": args.white,
+        "black": args.black,
+        "max_plies": args.max_plies,
+        "seed": args.seed,
+        "depth": args.depth,
+        "movetime": args.movetime,
+        # Keep engine games quick unless a limit was asked for
+        "nodes": args.nodes if args.nodes or args.depth or args.movetime else 5000,
+        "hash": args.hash,
+        "book": args.book,
+    }
+    scripts = read_scripts(args.script) if args.script else None
+
+    if args.output == "-":
+        summary = run(args.games, config, sys.stdout, args.workers, scripts)
+    else:
+        with open(args.output, "w") as output:
+            summary = run(args.games, config, output, args.workers, scripts)
+
+    results = ", ".join(f"{result} {count}" for result, count in sorted(summary["results"].items()))
+    print(
+        f"{summary['games']} games, {summary['plies']} plies in {summary['seconds']:.2f}s: "
+        f"{summary['games_per_second']:.2f} games/s, {summary['plies_per_second']:.1f} plies/s "
+        f"({results})",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from parallel import pack_position, unpack_position
+from rules import STARTING_FEN, Position, decode_move, encode_move, move_from_uci, move_to_uci
+from search import Search
+from selfplay import game_result
+from transposition import TranspositionTable
+
+# One JSON object per line in both directions. Requests carry an "op" and an
+# optional "id" that is echoed in the reply:
+#   {"op": "new", "engine": "black", "fen": ..., "movetime": 0.1} -> game state
+#   {"op": "move", "game": "7", "move": "e2e4"}                     -> game state
+#   {"op": "state" | "subscribe" | "unsubscribe", "game": "7"}
+# Replies are {"id": ..., "ok": true, ...} or {"id": ..., "ok": false,
+# "error": ...}, and every move is pushed to the game's subscribers as
+# {"event": "update", ...state}. Creating a game subscribes to it, and a game
+# is dropped once nobody is subscribed any more.
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_PLIES = 1000
+# Longest engine search a client may ask for, in seconds
+MAX_MOVETIME = 60
+# Subscribers that stop reading are disconnected past this much unsent data
+MAX_BUFFER = 1 << 20
+
+# Per-process engine, set up once by _init_worker
+_search = None
+
+
+def _init_worker(hash_mb):
+    global _search
+    _search = Search(TranspositionTable(hash_mb))
+
+
+def _engine_move(fen, move_codes, movetime, nodes):
+    position = unpack_position(fen, move_codes)
+    result = _search.search(position, movetime=movetime, nodes=nodes)
+    return encode_move(result.move) if result.move else 0
+
+
+class Session:
+    def __init__(self, game_id, position, engine_color=None, movetime=0.1, nodes=None):
+        self.id = game_id
+        self.position = position
+        # "w", "b" or None for a game between two people
+        self.engine_color = engine_color
+        self.movetime = movetime
+        self.nodes = nodes
+        self.subscribers = set()
+        self.plies = 0
+        self.last_move = None
+        self.result = None
+        self.thinking = False
+
+    def engine_to_move(self):
+        return self.result is None and self.position.turn[0] == self.engine_color
+
+    def play(self, move):
+        self.position.play_move(*move)
+        self.plies += 1
+        self.last_move = move
+        self.result = game_result(self.position, self.plies, MAX_PLIES)
+
+    def state(self):
+        position = self.position
+        return {
+            "game": self.id,
+            "fen": position.to_fen(),
+            "turn": position.turn,
+            "last": move_to_uci(self.last_move) if self.last_move else None,
+            "san": position.move_history[-1] if self.last_move else None,
+            "result": self.result[0] if self.result else None,
+            "termination": self.result[1] if self.result else None,
+            "legal": [] if self.result else [move_to_uci(move) for move in position.legal_moves()],
+        }
+
+
+class Connection:
+    def __init__(self, writer):
+        self.writer = writer
+        self.games = set()
+        self.closed = False
+
+    def send(self, message):
+        self.send_line(json.dumps(message).encode() + b"\n")
+
+    def send_line(self, line):
+        if self.closed:
+            return
+        self.writer.write(line)
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            self.closed = True
+            self.writer.close()
+
+
+class GameServer:
+    def __init__(self, workers=None, hash_mb=16):
+        self.games = {}
+        self.ids = itertools.count(1)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count() or 1,
+            initializer=_init_worker,
+            initargs=(hash_mb,),
+        )
+        self.moves = 0
+        self.started = time.perf_counter()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def handle_connection(self, reader, writer):
+        connection = Connection(writer)
+        try:
+            while not connection.closed:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                connection.send(self.handle_line(connection, line))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for game_id in list(connection.games):
+                self.unsubscribe(connection, game_id)
+            connection.closed = True
+            writer.close()
+
+    def handle_line(self, connection, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            request_id = request.get("id")
+            reply = self.handle_request(connection, request)
+        except (ValueError, KeyError, TypeError) as error:
+            return {"id": request_id, "ok": False, "error": str(error)}
+        reply.update(id=request_id, ok=True)
+        return reply
+
+    def handle_request(self, connection, request):
+        op = request.get("op")
+
+        if op == "new":
+            return self.new_game(connection, request)
+
+        session = self.games.get(str(request.get("game")))
+        if session is None:
+            raise ValueError(f"no such game: {request.get('game')!r}")
+
+        if op == "move":
+            return self.human_move(session, request["move"])
+        elif op == "subscribe":
+            session.subscribers.add(connection)
+            connection.games.add(session.id)
+        elif op == "unsubscribe":
+            self.unsubscribe(connection, session.id)
+            return {"game": session.id}
+        elif op != "state":
+            raise ValueError(f"unknown op: {op!r}")
+        return session.state()
+
+    def new_game(self, connection, request):
+        engine = request.get("engine")
+        if engine not in (None, "white", "black"):
+            raise ValueError(f"engine must be white or black, not {engine!r}")
+
+        # A movetime of 0 would search without any limit
+        movetime = request.get("movetime", 0.1)
+        if isinstance(movetime, bool) or not isinstance(movetime, (int, float)):
+            raise ValueError(f"movetime must be a number, not {movetime!r}")
+        if not 0 < movetime <= MAX_MOVETIME:
+            raise ValueError(f"movetime must be above 0 and at most {MAX_MOVETIME}")
+        nodes = request.get("nodes")
+        if nodes is not None and (
+            isinstance(nodes, bool) or not isinstance(nodes, int) or nodes <= 0
+        ):
+            raise ValueError(f"nodes must be a positive integer, not {nodes!r}")
+
+        fen = request.get("fen") or STARTING_FEN
+        if not isinstance(fen, str):
+            raise ValueError(f"fen must be a string, not {fen!r}")
+        position = Position.from_fen(fen)
+        session = Session(
+            str(next(self.ids)),
+            position,
+            engine[0] if engine else None,
+            movetime,
+            nodes,
+        )
+        self.games[session.id] = session
+        session.subscribers.add(connection)
+        connection.games.add(session.id)
+
+        if session.engine_to_move():
+            self.start_engine(session)
+        return session.state()
+
+    def unsubscribe(self, connection, game_id):
+        connection.games.discard(game_id)
+        session = self.games.get(game_id)
+        if session is None:
+            return
+        session.subscribers.discard(connection)
+        if not session.subscribers:
+            del self.games[game_id]
+
+    def human_move(self, session, text):
+        if session.result is not None:
+            raise ValueError(f"game is over: {session.result[0]}")
+        if session.engine_to_move():
+            raise ValueError("engine to move")
+
+        move = move_from_uci(text)
+        if move not in session.position.legal_moves():
+            raise ValueError(f"illegal move: {text}")
+
+        session.play(move)
+        self.moves += 1
+        # The same state goes to the subscribers and back to the mover
+        state = session.state()
+        self.publish(session, state)
+        if session.engine_to_move():
+            self.start_engine(session)
+        return dict(state)
+
+    def start_engine(self, session):
+        # The search runs in a worker process, the session is left alone until
+        # its answer is played by engine_done
+        session.thinking = True
+        fen, move_codes = pack_position(session.position)
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, _engine_move, fen, move_codes, session.movetime, session.nodes
+        )
+        future.add_done_callback(lambda future: self.engine_done(session, future))
+
+    def engine_done(self, session, future):
+        session.thinking = False
+        # Nobody is watching any more
+        if self.games.get(session.id) is not session or future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            # End the game rather than leave it waiting on the engine forever
+            session.result = ("*", "engine error")
+            self.publish(session, dict(session.state(), error=f"engine failed: {error!r}"))
+            return
+        code = future.result()
+        if code:
+            session.play(decode_move(code))
+            self.moves += 1
+        self.publish(session, session.state())
+
+    def publish(self, session, state):
+        if not session.subscribers:
+            return
+        line = json.dumps(dict(state, event="update")).encode() + b"\n"
+        for subscriber in list(session.subscribers):
+            subscriber.send_line(line)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        return f"{len(self.games)} games, {self.moves} moves, {self.moves / elapsed:.0f} moves/s"
+
+
+async def serve(args):
+    server = GameServer(args.workers, args.hash)
+    if args.unix:
+        listener = await asyncio.start_unix_server(server.handle_connection, args.unix)
+        where = args.unix
+    else:
+        listener = await asyncio.start_server(server.handle_connection, args.host, args.port)
+        where = f"{args.host}:{args.port}"
+    print(f"Serving on {where}", file=sys.stderr)
+
+    try:
+        async with listener:
+            while True:
+                await asyncio.sleep(args.stats or 3600)
+                if args.stats:
+                    print(server.stats(), file=sys.stderr)
+    finally:
+        server.close()
+
+
+async def open_connection(args):
+    if args.unix:
+        return await asyncio.open_unix_connection(args.unix)
+    return await asyncio.open_connection(args.host, args.port)
+
+
+async def bench_client(args, deadline, latencies, rng):
+    # Plays random moves in one game after another until the deadline,
+    # timing every request from send to reply
+    reader, writer = await open_connection(args)
+    request_ids = itertools.count()
+    games = moves = 0
+
+    async def call(request):
+        request["id"] = next(request_ids)
+        started = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        while True:
+            reply = json.loads(await reader.readline())
+            # Pushed updates can arrive ahead of the reply
+            if reply.get("id") == request["id"]:
+                latencies.append(time.perf_counter() - started)
+                if not reply["ok"]:
+                    raise RuntimeError(reply["error"])
+                return reply
+
+    async def engine_reply(game_id):
+        while True:
+            message = json.loads(await reader.readline())
+            if message.get("event") == "update" and message["game"] == game_id:
+                if message["turn"][0] != args.engine[0] or message["result"]:
+                    return message
+
+    while time.perf_counter() < deadline:
+        request = {"op": "new", "movetime": args.movetime}
+        if args.engine:
+            request["engine"] = args.engine
+        state = await call(request)
+        if args.engine and state["turn"][0] == args.engine[0]:
+            state = await engine_reply(state["game"])
+        games += 1
+
+        while state["legal"] and time.perf_counter() < deadline:
+            state = await call(
+                {"op": "move", "game": state["game"], "move": rng.choice(state["legal"])}
+            )
+            moves += 1
+            if args.engine and state["legal"]:
+                state = await engine_reply(state["game"])
+                moves += 1
+
+        await call({"op": "unsubscribe", "game": state["game"]})
+
+    writer.close()
+    return games, moves
+
+
+async def bench(args):
+    rng = random.Random(args.seed)
+    latencies = []
+    started = time.perf_counter()
+    deadline = started + args.seconds
+    counts = await asyncio.gather(
+        *(
+            bench_client(args, deadline, latencies, random.Random(rng.random()))
+            for _ in range(args.clients)
+        )
+    )
+    elapsed = time.perf_counter() - started
+
+    games = sum(count[0] for count in counts)
+    moves = sum(count[1] for count in counts)
+    latencies.sort()
+    count = len(latencies)
+    print(f"{args.clients} clients, {games} games, {count} requests in {elapsed:.1f}s")
+    print(f"{moves / elapsed:.0f} moves/s, {count / elapsed:.0f} requests/s")
+    if count:
+        percentiles = " ".join(
+            f"p{p} {latencies[min(count - 1, count * p // 100)] * 1000:.2f}ms"
+            for p in (50, 90, 99)
+        )
+        print(f"latency {percentiles} max {latencies[-1] * 1000:.2f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host chess games over a JSON-lines socket")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", help="listen on or connect to this unix socket instead")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the game server")
+    serve_parser.add_argument("--workers", type=int, help="engine processes, default one per core")
+    serve_parser.add_argument("--hash", type=int, default=16, help="MB of hash per engine")
+    serve_parser.add_argument("--stats", type=float, help="print stats every this many seconds")
+
+    bench_parser = commands.add_parser("bench", help="load-test a running server")
+    bench_parser.add_argument("--clients", type=int, default=100)
+    bench_parser.add_argument("--seconds", type=float, default=10.0)
+    bench_parser.add_argument("--engine", choices=["white", "black"], help="play the engine")
+    bench_parser.add_argument("--movetime", type=float, default=0.05)
+    bench_parser.add_argument("--seed", type=int)
+
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args) if args.command == "serve" else bench(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,441 @@
+import argparse
+import mmap
+import os
+import pickle
+import sys
+import time
+from array import array
+from multiprocessing import Pool
+
+from rules import EMPTY_SQUARE, STARTING_FEN, Position, move_to_uci, opposite
+
+# White always holds the extra piece, black-strong positions are probed with
+# the colors swapped. Pieces are listed in the order they appear in the index.
+TABLES = {
+    "KQK": ("wk", "wq", "bk"),
+    "KRK": ("wk", "wr", "bk"),
+    "KPK": ("wk", "wp", "bk"),
+}
+# Tables a pawn can promote into, generated first
+DEPENDENCIES = {"KPK": ("KQK", "KRK")}
+PROMOTION_TABLES = {"q": "KQK", "r": "KRK"}
+
+MAGIC = b"CHTB0001"
+# Values are signed bytes from the side to move's view: n > 0 mates in n plies,
+# n < 0 is mated in -n - 1 plies, 0 is a draw
+DRAW = 0
+ILLEGAL = -128
+CHUNK_SIZE = 8192
+
+# Status of each position after expansion
+INVALID = 0
+NORMAL = 1
+CHECKMATE = 2
+STALEMATE = 3
+
+
+def table_size(name):
+    return 2 * 64 ** len(TABLES[name])
+
+
+def table_path(directory, name):
+    return os.path.join(directory, f"{name}.tb")
+
+
+def encode_index(squares, black_to_move):
+    index = 1 if black_to_move else 0
+    for sq in squares:
+        index = index * 64 + sq
+    return index
+
+
+def decode_index(index, count):
+    squares = []
+    for _ in range(count):
+        squares.append(index % 64)
+        index //= 64
+    return index == 1, squares[::-1]
+
+
+def signature(board):
+    # (table name, flipped) for the material on board, None if no table has it
+    pieces = sorted(piece for row in board for piece in row if piece != EMPTY_SQUARE)
+    for name, table_pieces in TABLES.items():
+        if pieces == sorted(table_pieces):
+            return name, False
+        swapped = sorted(("b" if piece[0] == "w" else "w") + piece[1] for piece in table_pieces)
+        if pieces == swapped:
+            return name, True
+    return None
+
+
+def position_index(position, name, flipped):
+    # Index of position in table name, colors swapped and board mirrored when
+    # black holds the extra piece
+    squares = []
+    for piece in TABLES[name]:
+        color = piece[0]
+        if flipped:
+            color = "b" if color == "w" else "w"
+        for y in range(8):
+            for x in range(8):
+                if position.board[y][x] == color + piece[1]:
+                    squares.append(((7 - y) if flipped else y) * 8 + x)
+    black_to_move = (position.turn == "black") != flipped
+    return encode_index(squares, black_to_move)
+
+
+class Tablebase:
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = []
+        self.tables = {}
+        for name in TABLES:
+            path = table_path(directory, name)
+            if os.path.exists(path):
+                handle = open(path, "rb")
+                self.files.append(handle)
+                data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+                if data[: len(MAGIC)] != MAGIC or len(data) != len(MAGIC) + table_size(name):
+                    raise ValueError(f"{path} is not a {name} table")
+                self.tables[name] = data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for data in self.tables.values():
+            data.close()
+        for handle in self.files:
+            handle.close()
+        self.tables = {}
+
+    def value_at(self, name, index):
+        byte = self.tables[name][len(MAGIC) + index]
+        return byte - 256 if byte > 127 else byte
+
+    def probe(self, position):
+        # Signed value for position, None when no loaded table covers it
+        found = signature(position.board)
+        if found is None or found[0] not in self.tables:
+            return None
+        name, flipped = found
+        value = self.value_at(name, position_index(position, name, flipped))
+        return None if value == ILLEGAL else value
+
+    def best_move(self, position):
+        # (move, value) keeping the best result with the quickest mate, or
+        # None if the position isn't in the tables
+        value = self.probe(position)
+        if value is None:
+            return None
+
+        best = None
+        best_key = None
+        for move in position.legal_moves():
+            position.make_move(*move)
+            reply = self.probe(position)
+            position.unmake_move()
+            if reply is None:
+                # Captured down to two kings
+                reply = DRAW
+            # Smaller is better for us: quick wins, then draws, then slow losses
+            if reply < 0:
+                key = (0, -reply)
+            elif reply == 0:
+                key = (1, 0)
+            else:
+                key = (2, -reply)
+            if best_key is None or key < best_key:
+                best, best_key = move, key
+        return best, value
+
+
+# Tables a worker has read for promotions, loaded once per process
+_subtables = {}
+
+
+def _load_tables(directory, names):
+    tables = {}
+    for name in names:
+        if name not in _subtables:
+            with open(table_path(directory, name), "rb") as table:
+                _subtables[name] = table.read()[len(MAGIC) :]
+        tables[name] = _subtables[name]
+    return tables
+
+
+def _expand_chunk(task):
+    # Forward pass over one chunk: the status of every position and its
+    # children, in-table children as indexes and the rest as -1 - (value + 128)
+    name, directory, chunk = task
+    pieces = TABLES[name]
+    count = len(pieces)
+    start = chunk * CHUNK_SIZE
+    stop = min(start + CHUNK_SIZE, table_size(name))
+    subtables = _load_tables(directory, DEPENDENCIES.get(name, ()))
+
+    status = bytearray(stop - start)
+    offsets = array("I", [0])
+    children = array("i")
+
+    for index in range(start, stop):
+        black_to_move, squares = decode_index(index, count)
+        if len(set(squares)) == count and _pawns_on_board(pieces, squares):
+            status[index - start] = _expand_position(
+                pieces, squares, black_to_move, subtables, children
+            )
+        offsets.append(len(children))
+
+    return chunk, bytes(status), offsets, children
+
+
+def _pawns_on_board(pieces, squares):
+    return all(piece[1] != "p" or 8 <= sq < 56 for piece, sq in zip(pieces, squares))
+
+
+def _expand_position(pieces, squares, black_to_move, subtables, children):
+    board = [[EMPTY_SQUARE] * 8 for _ in range(8)]
+    for piece, sq in zip(pieces, squares):
+        board[sq // 8][sq % 8] = piece
+    position = Position(board, "black" if black_to_move else "white")
+    position.castling = ""
+
+    # The side that just moved can't have left its king in check
+    if position.is_in_check(opposite(position.turn)[0]):
+        return INVALID
+
+    moves = position.legal_moves()
+    if not moves:
+        return CHECKMATE if position.is_in_check(position.turn[0]) else STALEMATE
+
+    for start, end, promotion in moves:
+        from_sq = start[1] * 8 + start[0]
+        to_sq = end[1] * 8 + end[0]
+        if to_sq in squares:
+            # A capture leaves two kings
+            children.append(-1 - (DRAW + 128))
+            continue
+
+        child = [to_sq if sq == from_sq else sq for sq in squares]
+        if promotion:
+            table = PROMOTION_TABLES.get(promotion)
+            if table is None:
+                # King and minor piece against king is a draw
+                value = DRAW
+            else:
+                byte = subtables[table][encode_index(child, not black_to_move)]
+                value = byte - 256 if byte > 127 else byte
+            children.append(-1 - (value + 128))
+        else:
+            children.append(encode_index(child, not black_to_move))
+    return NORMAL
+
+
+def _chunk_path(directory, name, chunk):
+    return os.path.join(directory, f"{name}.chunk{chunk:05d}")
+
+
+def _save_chunk(directory, name, result):
+    chunk = result[0]
+    path = _chunk_path(directory, name, chunk)
+    # Written under another name and renamed so a killed run never leaves a
+    # half-written chunk behind
+    with open(path + ".tmp", "wb") as partial:
+        pickle.dump(result, partial, pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+def _load_chunk(directory, name, chunk):
+    with open(_chunk_path(directory, name, chunk), "rb") as saved:
+        return pickle.load(saved)
+
+
+def expand(name, directory, workers=None, log=print):
+    # Runs the forward pass on a process pool, skipping chunks a previous run
+    # already saved
+    chunks = (table_size(name) + CHUNK_SIZE - 1) // CHUNK_SIZE
+    pending = [
+        chunk
+        for chunk in range(chunks)
+        if not os.path.exists(_chunk_path(directory, name, chunk))
+    ]
+    if len(pending) < chunks:
+        log(f"{name}: {chunks - len(pending)} of {chunks} chunks already expanded")
+
+    with Pool(workers) as pool:
+        tasks = [(name, directory, chunk) for chunk in pending]
+        for done, result in enumerate(pool.imap_unordered(_expand_chunk, tasks), 1):
+            _save_chunk(directory, name, result)
+            if done % 16 == 0 or done == len(pending):
+                log(f"{name}: expanded {done}/{len(pending)} chunks")
+    return chunks
+
+
+def solve(name, directory, chunks, log=print):
+    # Retrograde pass: walk back from the mates through each position's
+    # parents in order of distance, a parent of a loss is a win one ply
+    # further, and a position whose children are all wins for the opponent
+    # is lost at one more than its slowest loss
+    size = table_size(name)
+    status = bytearray()
+    offsets = array("Q", [0])
+    children = array("i")
+
+    for chunk in range(chunks):
+        _, chunk_status, chunk_offsets, chunk_children = _load_chunk(directory, name, chunk)
+        base = len(children)
+        status += chunk_status
+        offsets.extend(base + offset for offset in chunk_offsets[1:])
+        children.extend(chunk_children)
+
+    # Parents of every position, as a compressed sparse row
+    parent_counts = array("I", bytes(4 * (size + 1)))
+    for child in children:
+        if child >= 0:
+            parent_counts[child + 1] += 1
+    for index in range(size):
+        parent_counts[index + 1] += parent_counts[index]
+    parent_offsets = parent_counts
+    fill = array("I", parent_offsets[:size])
+    parents = array("I", bytes(4 * parent_offsets[size]))
+    for index in range(size):
+        for edge in range(offsets[index], offsets[index + 1]):
+            child = children[edge]
+            if child >= 0:
+                parents[fill[child]] = index
+                fill[child] += 1
+    del fill
+
+    values = array("b", [ILLEGAL]) * size
+    unresolved = array("H", bytes(2 * size))
+    # Ply count a loss would take, kept up to date as wins come in
+    slowest = array("B", bytes(size))
+    escapes = bytearray(size)
+    buckets = {}
+
+    def push(depth, index, win):
+        buckets.setdefault(depth, []).append((index, win))
+
+    for index in range(size):
+        state = status[index]
+        if state == INVALID:
+            continue
+        values[index] = DRAW
+        if state == CHECKMATE:
+            push(0, index, False)
+            continue
+        if state == STALEMATE:
+            continue
+
+        remaining = 0
+        for edge in range(offsets[index], offsets[index + 1]):
+            child = children[edge]
+            if child >= 0:
+                remaining += 1
+                continue
+            value = -1 - child - 128
+            if value < 0:
+                # The move leaves the opponent lost, in -value - 1 plies
+                push(-value, index, True)
+            elif value > 0:
+                slowest[index] = max(slowest[index], value + 1)
+            else:
+                escapes[index] = 1
+        unresolved[index] = remaining
+        if not remaining and not escapes[index]:
+            # Every move leaves the table and wins for the opponent
+            push(slowest[index], index, False)
+
+    resolved = bytearray(size)
+    depth = 0
+    while buckets:
+        for index, win in buckets.pop(depth, ()):
+            if resolved[index]:
+                continue
+            resolved[index] = 1
+            values[index] = depth if win else -depth - 1
+
+            for edge in range(parent_offsets[index], parent_offsets[index + 1]):
+                parent = parents[edge]
+                if resolved[parent]:
+                    continue
+                if not win:
+                    push(depth + 1, parent, True)
+                    continue
+                unresolved[parent] -= 1
+                slowest[parent] = max(slowest[parent], depth + 1)
+                if not unresolved[parent] and not escapes[parent]:
+                    push(slowest[parent], parent, False)
+        depth += 1
+        if depth > 126:
+            raise ValueError(f"{name}: distance to mate does not fit a byte")
+
+    with open(table_path(directory, name) + ".tmp", "wb") as table:
+        table.write(MAGIC)
+        values.tofile(table)
+    os.replace(table_path(directory, name) + ".tmp", table_path(directory, name))
+
+    for chunk in range(chunks):
+        os.remove(_chunk_path(directory, name, chunk))
+
+    wins = sum(1 for value in values if 0 < value != ILLEGAL)
+    losses = sum(1 for value in values if value < 0 and value != ILLEGAL)
+    draws = sum(1 for value in values if value == DRAW)
+    log(f"{name}: {wins} wins, {losses} losses, {draws} draws, longest mate {depth - 1} plies")
+
+
+def generate(name, directory, workers=None, log=print):
+    for dependency in DEPENDENCIES.get(name, ()):
+        if not os.path.exists(table_path(directory, dependency)):
+            generate(dependency, directory, workers, log)
+
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    chunks = expand(name, directory, workers, log)
+    solve(name, directory, chunks, log)
+    log(f"{name}: done in {time.perf_counter() - started:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="build tables, resuming if interrupted")
+    generate_parser.add_argument("tables", nargs="+", choices=sorted(TABLES))
+    generate_parser.add_argument("--dir", default="tablebases")
+    generate_parser.add_argument("--workers", type=int, help="worker processes, default one per core")
+
+    probe_parser = commands.add_parser("probe", help="look up a position")
+    probe_parser.add_argument("--fen", default=STARTING_FEN)
+    probe_parser.add_argument("--dir", default="tablebases")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        for name in args.tables:
+            generate(name, args.dir, args.workers)
+        return 0
+
+    with Tablebase(args.dir) as tablebase:
+        position = Position.from_fen(args.fen)
+        found = tablebase.best_move(position)
+        if found is None:
+            print("not in the tables")
+            return 1
+        move, value = found
+        if value > 0:
+            result = f"win, mate in {value} plies"
+        elif value < 0:
+            result = f"loss, mated in {-value - 1} plies"
+        else:
+            result = "draw"
+        print(f"{result}, best move {move_to_uci(move) if move else '(none)'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+from analyze import analyze_fen, read_fens
+
+
+def test_read_fens_strips_epd_operations():
+    lines = [
+        '2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - bm Qg6; id "WAC.001";\n',
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 ;D1 20 ;D2 400\n",
+        "\n",
+        "# comment\n",
+        "4k3/8/8/8/8/8/8/4K3 b - - 3 40\n",
+    ]
+    assert list(read_fens(lines)) == [
+        "2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - -",
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        "4k3/8/8/8/8/8/8/4K3 b - - 3 40",
+    ]
+
+
+def test_epd_line_is_analyzed():
+    (fen,) = read_fens(['2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - bm Qg6;'])
+    assert analyze_fen(fen)[2] == "ok"
+
+
+def test_status():
+    assert analyze_fen("k7/2Q5/1K6/8/8/8/8/8 b - - 0 1")[2] == "stalemate"
+    assert analyze_fen("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1")[2] == "checkmate"
+    assert analyze_fen("4k3/8/4Q3/8/8/8/8/4K3 b - - 0 1")[1:3] == (2, "check")
+    assert analyze_fen("not a fen")[2] == "invalid"
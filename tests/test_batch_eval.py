@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from evaluation import SQUARE_SCORES, evaluate, evaluate_full
+from rules import EMPTY_SQUARE, Position
+
+batch_eval = pytest.importorskip("batch_eval")
+pytest.importorskip("numpy")
+
+
+def random_positions(count, seed=1):
+    rng = random.Random(seed)
+    positions = []
+    position = Position()
+    while len(positions) < count:
+        moves = position.legal_moves()
+        if not moves or len(position.undo_stack) > 120:
+            position = Position()
+            continue
+        position.make_move(*rng.choice(moves))
+        positions.append(Position.from_fen(position.to_fen()))
+    return positions
+
+
+def test_batch_matches_full_scalar_evaluation():
+    positions = random_positions(300)
+    scores = batch_eval.evaluate_positions(positions)
+    assert list(scores) == [evaluate_full(position) for position in positions]
+
+
+def test_search_evaluation_is_material_and_placement_only():
+    # Mobility and pawn structure are left to evaluate_full
+    for position in random_positions(50, seed=2):
+        expected = sum(
+            SQUARE_SCORES[piece][y * 8 + x]
+            for y, row in enumerate(position.board)
+            for x, piece in enumerate(row)
+            if piece != EMPTY_SQUARE
+        )
+        sign = 1 if position.turn == "white" else -1
+        assert evaluate(position) == expected * sign
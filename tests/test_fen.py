@@ -0,0 +1,70 @@
+import pytest
+
+from rules import STARTING_FEN, Position
+
+ROUND_TRIP = [
+    STARTING_FEN,
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+    "4k3/8/8/8/2Pp4/8/8/4K3 b - c3 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+]
+
+INVALID = [
+    "",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/7/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkqK - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - a 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0",
+    "8/8/8/8/8/8/8/4K3 w - - 0 1",
+    "4k3/8/8/8/8/8/8/4KK2 w - - 0 1",
+    "4k3/8/8/8/8/8/8/P3K3 w - - 0 1",
+    "4k3/4R3/8/8/8/8/8/4K3 w - - 0 1",
+]
+
+BAD_EN_PASSANT = [
+    # wrong rank for the side to move
+    "4k3/8/8/8/2Pp4/8/8/4K3 w - c3 0 1",
+    # the square is taken
+    "4k3/8/2n5/1Pp5/8/8/8/4K3 w - c6 0 1",
+    # no pawn in front of it
+    "4k3/8/8/1P6/8/8/8/4K3 w - c6 0 1",
+    # the pawn in front belongs to the side to move
+    "4k3/8/8/1PP5/8/8/8/4K3 w - c6 0 1",
+    # the pawn's start square is taken
+    "4k3/2n5/8/1Pp5/8/8/8/4K3 w - c6 0 1",
+    "4k3/8/8/8/2Pp4/8/2N5/4K3 b - c3 0 1",
+]
+
+
+@pytest.mark.parametrize("fen", ROUND_TRIP)
+def test_round_trip(fen):
+    assert Position.from_fen(fen).to_fen() == fen
+
+
+@pytest.mark.parametrize("fen", INVALID + BAD_EN_PASSANT)
+def test_invalid_fen_raises(fen):
+    with pytest.raises(ValueError):
+        Position.from_fen(fen)
+
+
+def test_castling_rights_need_king_and_rook_at_home():
+    position = Position.from_fen("4k3/8/8/8/8/8/8/4K2R w KQkq - 0 1")
+    assert position.castling == "K"
+
+
+def test_four_field_fen_gets_default_counters():
+    position = Position.from_fen("4k3/8/8/8/8/8/8/4K3 b - -")
+    assert position.turn == "black"
+    assert position.halfmove_clock == 0
+    assert position.fullmove_number == 1
+
+
+def test_en_passant_capture_is_generated():
+    position = Position.from_fen("4k3/8/8/1Pp5/8/8/8/4K3 w - c6 0 1")
+    assert ((1, 3), (2, 2), None) in position.legal_moves()
+    position.make_move((1, 3), (2, 2))
+    assert position.board[3][2] == "--"
@@ -0,0 +1,59 @@
+import os
+import random
+
+import pytest
+
+from bitboard import BitboardPosition
+from rules import Position
+
+SUITE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perft_suite.epd")
+
+# White to move with an en passant square that only white may use
+FEN = "4k3/1p6/8/2pP4/8/8/8/4K3 w - c6 0 2"
+
+
+def test_en_passant_is_only_for_the_side_to_move():
+    position = Position.from_fen(FEN)
+    black_moves = position.legal_moves("b")
+    assert ((1, 1), (2, 2), None) not in black_moves
+    assert ((3, 3), (2, 2), None) in position.legal_moves()
+
+
+def test_bitboard_en_passant_is_only_for_the_side_to_move():
+    position = BitboardPosition.from_position(Position.from_fen(FEN))
+    assert sorted(position.legal_moves("b")) == sorted(Position.from_fen(FEN).legal_moves("b"))
+    assert ((3, 3), (2, 2), None) in position.legal_moves()
+
+
+def test_bitboard_matches_rules_over_random_games():
+    # Random playouts from positions with pins, promotions, castling and
+    # en passant, comparing every legal move list and hash along the way
+    rng = random.Random(4)
+    with open(SUITE) as suite:
+        fens = [line.split(";")[0].strip() for line in suite if line.strip()]
+    for fen in fens:
+        for _ in range(4):
+            position = Position.from_fen(fen)
+            bitboard = BitboardPosition.from_fen(fen)
+            for _ in range(60):
+                moves = position.legal_moves()
+                assert sorted(bitboard.legal_moves()) == sorted(moves)
+                assert bitboard.hash == position.hash
+                if not moves:
+                    break
+                move = rng.choice(moves)
+                position.make_move(*move)
+                bitboard.make_move(*move)
+
+
+def test_bitboard_from_fen_rejects_what_rules_rejects():
+    invalid = (
+        "8/8/8/8 w - -",
+        "4k3/8/8/8/8/8/8/4K2R w K e6 0 1",
+        "4k3/4Q3/8/8/8/8/8/4K3 w - - 0 1",
+    )
+    for fen in invalid:
+        with pytest.raises(ValueError):
+            Position.from_fen(fen)
+        with pytest.raises(ValueError):
+            BitboardPosition.from_fen(fen)
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from notation import move_to_san, parse_san
+from rules import Position, move_from_uci
+
+# White knights on b1 and f3 and rooks on a1 and a5 share targets, the pawn
+# on g7 can promote straight or by taking on h8, and black can castle long
+# into check on d1
+FEN = "r3k2r/6P1/8/R7/8/5N2/8/RN2K3 w q - 0 1"
+
+
+def san(fen, uci):
+    return move_to_san(Position.from_fen(fen), move_from_uci(uci))
+
+
+@pytest.mark.parametrize(
+    "fen, uci, expected",
+    [
+        # Same file, told apart by rank
+        (FEN, "a1a3", "R1a3"),
+        (FEN, "a5a3", "R5a3"),
+        # Different files, told apart by file
+        (FEN, "b1d2", "Nbd2"),
+        (FEN, "f3d2", "Nfd2"),
+        # Three queens on one target need the full square
+        ("4k3/8/8/8/8/Q1Q5/8/Q3K3 w - - 0 1", "a3b2", "Qa3b2"),
+        ("4k3/8/8/8/8/Q1Q5/8/Q3K3 w - - 0 1", "c3b2", "Qcb2"),
+        ("4k3/8/8/8/8/Q1Q5/8/Q3K3 w - - 0 1", "a1b2", "Q1b2"),
+        # Promotion, straight and with capture
+        (FEN, "g7g8q", "g8=Q+"),
+        (FEN, "g7h8n", "gxh8=N"),
+        (FEN, "g7h8q", "gxh8=Q+"),
+        # Castling, long with check
+        ("r3k3/8/8/8/8/8/8/3K4 b q - 0 1", "e8c8", "O-O-O+"),
+        ("4k3/8/8/8/8/8/8/4K2R w K - 0 1", "e1g1", "O-O"),
+        # En passant
+        ("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2", "e5d6", "exd6"),
+        # Mate
+        ("k7/8/1K6/8/8/8/8/7R w - - 0 1", "h1h8", "Rh8#"),
+    ],
+)
+def test_move_to_san(fen, uci, expected):
+    assert san(fen, uci) == expected
+    position = Position.from_fen(fen)
+    assert parse_san(position, expected) == move_from_uci(uci)
+    assert parse_san(position, expected, position.legal_moves()) == move_from_uci(uci)
+
+
+@pytest.mark.parametrize("text", ["Nd2", "Ra3", "g8", "Kd2d3", "Bb5", "O-O"])
+def test_ambiguous_or_illegal_san_is_rejected(text):
+    position = Position.from_fen(FEN)
+    with pytest.raises(ValueError):
+        parse_san(position, text)
+    with pytest.raises(ValueError):
+        parse_san(position, text, position.legal_moves())
+
+
+def test_san_round_trip_over_random_games():
+    rng = random.Random(25)
+    for _ in range(8):
+        position = Position()
+        for _ in range(100):
+            legal = position.legal_moves()
+            if not legal:
+                break
+            for move in legal:
+                text = move_to_san(position, move, legal)
+                assert parse_san(position, text) == move
+                assert parse_san(position, text, legal) == move
+            position.make_move(*rng.choice(legal))
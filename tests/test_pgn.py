@@ -0,0 +1,27 @@
+import io
+
+from pgn import PgnWriter, read_games
+
+PGN = """[Event "Test"]
+[Result "1-0"]
+
+1. e4 {opening
+[not a tag] comment} e5 ; rest of line
+2. Nf3 Nc6 1-0
+"""
+
+
+def test_multi_line_comment_keeps_its_line_breaks():
+    (game,) = read_games(io.StringIO(PGN))
+    assert game.moves == ["e4", "e5", "Nf3", "Nc6"]
+    assert game.comments[1] == "opening\n[not a tag] comment"
+    assert game.result == "1-0"
+
+
+def test_round_trip():
+    (game,) = read_games(io.StringIO(PGN))
+    output = io.StringIO()
+    PgnWriter(output).write_game(game)
+    (again,) = read_games(io.StringIO(output.getvalue()))
+    assert again.moves == game.moves
+    assert again.headers["Event"] == "Test"
@@ -0,0 +1,30 @@
+from rules import Position, move_from_uci
+from search import MATE_THRESHOLD, Search
+
+
+def play(*moves):
+    position = Position()
+    for text in moves:
+        position.make_move(*move_from_uci(text))
+    return position
+
+
+def test_root_move_subset_keeps_deepening_after_mate():
+    # g4 allows Qh4#, a worker holding only that move must still report the
+    # deeper depths the other workers reach
+    position = play("f2f3", "e7e5")
+    depths = []
+    root_moves = [move_from_uci("g2g4")]
+    result = Search().search(
+        position, depth=4, root_moves=root_moves, info=lambda r: depths.append(r.depth)
+    )
+    assert depths == [1, 2, 3, 4]
+    assert result.score <= -MATE_THRESHOLD
+
+
+def test_full_search_stops_at_mate():
+    position = play("f2f3", "e7e5", "g2g4")
+    depths = []
+    result = Search().search(position, depth=4, info=lambda r: depths.append(r.depth))
+    assert result.move == move_from_uci("d8h4")
+    assert depths[-1] < 4
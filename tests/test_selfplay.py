@@ -0,0 +1,35 @@
+import pytest
+
+import selfplay
+
+
+def config(white, black):
+    return {
+        "white": white,
+        "black": black,
+        "seed": 1,
+        "max_plies": 40,
+        "hash": 1,
+        "book": None,
+        "depth": None,
+        "movetime": None,
+        "nodes": 200,
+    }
+
+
+def test_bad_script_line_ends_only_that_game():
+    selfplay._init_worker(config("script", "script"))
+    assert selfplay.play_game((0, ["e2e4", "e7e5", "zz"]))[2:] == ("*", "illegal scripted move")
+    assert selfplay.play_game((1, ["e2e4", "e7e5", "e1e3"]))[2:] == ("*", "illegal scripted move")
+    assert selfplay.play_game((2, ["e2e4", "e7e5"]))[2:] == ("*", "end of script")
+
+
+def test_errors_from_other_players_are_not_hidden(monkeypatch):
+    selfplay._init_worker(config("random", "script"))
+
+    def broken(position, player, rng):
+        raise ValueError("bug in the random player")
+
+    monkeypatch.setattr(selfplay, "choose_move", broken)
+    with pytest.raises(ValueError, match="bug in the random player"):
+        selfplay.play_game((0, ["e7e5"]))
@@ -0,0 +1,20 @@
+import json
+
+from server import Connection, GameServer
+
+
+def test_bad_new_game_requests_get_an_error_reply():
+    server = GameServer(workers=1)
+    try:
+        connection = Connection(None)
+        for request in (
+            {"op": "new", "fen": 123},
+            {"op": "new", "fen": "8/8/8/8 w - -"},
+            {"op": "new", "movetime": 0},
+            {"op": "new", "nodes": -1},
+        ):
+            reply = server.handle_line(connection, json.dumps(dict(request, id=1)))
+            assert reply["ok"] is False and reply["id"] == 1
+        assert not server.games and not connection.games
+    finally:
+        server.close()
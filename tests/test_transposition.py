@@ -0,0 +1,52 @@
+from transposition import EXACT, LOWER_BOUND, TranspositionTable
+
+
+def bucket_keys(tt, count):
+    # Distinct keys that all index the same two-slot bucket
+    return [0x1234 + n * tt.entries for n in range(1, count + 1)]
+
+
+def test_probe_returns_what_was_stored():
+    tt = TranspositionTable(1)
+    (key,) = bucket_keys(tt, 1)
+    assert tt.probe(key) is None
+    tt.store(key, 5, -37, EXACT, 321)
+    assert tt.probe(key) == (5, -37, EXACT, 321)
+
+
+def test_store_reuses_the_positions_own_slot():
+    tt = TranspositionTable(1)
+    first, second = bucket_keys(tt, 2)
+    tt.store(first, 3, 10, EXACT, 11)
+    tt.store(second, 2, 20, EXACT, 22)
+
+    # A new entry for second replaces its own slot, not first's, and keeps
+    # the move when it has none of its own
+    tt.store(second, 6, 25, LOWER_BOUND)
+    assert tt.probe(first) == (3, 10, EXACT, 11)
+    assert tt.probe(second) == (6, 25, LOWER_BOUND, 22)
+    assert tt.overwrites == 0
+
+
+def test_full_bucket_evicts_the_shallower_entry():
+    tt = TranspositionTable(1)
+    deep, shallow, new = bucket_keys(tt, 3)
+    tt.store(deep, 8, 0, EXACT)
+    tt.store(shallow, 2, 0, EXACT)
+    tt.store(new, 1, 0, EXACT)
+    assert tt.probe(deep) is not None
+    assert tt.probe(shallow) is None
+    assert tt.probe(new) is not None
+    assert tt.overwrites == 1
+
+
+def test_full_bucket_evicts_an_older_search_first():
+    tt = TranspositionTable(1)
+    old, current, new = bucket_keys(tt, 3)
+    tt.store(old, 9, 0, EXACT)
+    tt.new_search()
+    tt.store(current, 1, 0, EXACT)
+    tt.store(new, 1, 0, EXACT)
+    assert tt.probe(old) is None
+    assert tt.probe(current) is not None
+    assert tt.probe(new) is not None
@@ -0,0 +1,36 @@
+import io
+
+from uci import UciEngine, think_time
+
+
+def run(engine, *lines):
+    for line in lines:
+        assert engine.handle(line)
+    engine.stop()
+    return engine.output.getvalue().splitlines()
+
+
+def test_movetime_zero_still_has_a_limit():
+    assert think_time({"movetime": 0}, "white") == 0.001
+    engine = UciEngine(output=io.StringIO())
+    engine.handle("go movetime 0")
+    engine.thread.join(5)
+    assert not engine.thread.is_alive()
+    assert run(engine)[-1].startswith("bestmove ")
+
+
+def test_bad_numbers_are_reported_not_raised():
+    engine = UciEngine(output=io.StringIO())
+    lines = run(engine, "setoption name Hash value big", "go depth", "go depth x", "isready")
+    assert sum(line.startswith("info string") for line in lines) == 3
+    assert lines[-1] == "readyok"
+
+
+def test_go_depth():
+    engine = UciEngine(output=io.StringIO())
+    engine.handle("position startpos moves e2e4")
+    engine.handle("go depth 2")
+    engine.thread.join(5)
+    lines = run(engine)
+    assert lines[-2].startswith("info depth 2")
+    assert lines[-1].startswith("bestmove ")
@@ -0,0 +1,39 @@
+import random
+
+from rules import Position
+from zobrist import hash_position
+
+# Castling, en passant and promotions all come up from here
+FEN = "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1"
+
+
+def test_incremental_hash_matches_full_hash():
+    rng = random.Random(7)
+    for fen in (FEN, "r3k2r/8/8/2pP4/8/8/8/R3K2R w KQkq c6 0 1"):
+        for _ in range(10):
+            position = Position.from_fen(fen)
+            hashes = [position.hash]
+            for _ in range(40):
+                moves = position.legal_moves()
+                if not moves:
+                    break
+                position.make_move(*rng.choice(moves))
+                assert position.hash == hash_position(position)
+                hashes.append(position.hash)
+
+            # Taking the moves back restores every earlier key
+            while position.undo_stack:
+                assert position.hash == hashes.pop()
+                position.unmake_move()
+                assert position.hash == hash_position(position)
+            assert position.hash == hashes.pop()
+
+
+def test_hash_depends_on_side_castling_and_en_passant():
+    base = Position.from_fen("r3k2r/8/8/2pP4/8/8/8/R3K2R w KQkq c6 0 1").hash
+    others = [
+        "r3k2r/8/8/2pP4/8/8/8/R3K2R w KQkq - 0 1",
+        "r3k2r/8/8/2pP4/8/8/8/R3K2R w Kkq c6 0 1",
+        "r3k2r/8/8/2pP4/8/8/8/R3K2R b KQkq - 0 1",
+    ]
+    assert len({base} | {Position.from_fen(fen).hash for fen in others}) == 4
@@ -0,0 +1,136 @@
+from array import array
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Each entry is two unsigned 64-bit words: the full position key, and a packed
+# data word laid out as | age 8 | move 16 | bound 2 | depth 8 | score 20 |
+ENTRY_BYTES = 16
+SCORE_BITS = 20
+SCORE_OFFSET = 1 << (SCORE_BITS - 1)
+SCORE_MASK = (1 << SCORE_BITS) - 1
+DEPTH_SHIFT = SCORE_BITS
+BOUND_SHIFT = DEPTH_SHIFT + 8
+MOVE_SHIFT = BOUND_SHIFT + 2
+AGE_SHIFT = MOVE_SHIFT + 16
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        # Round down to a power of two so the index is a mask, and keep buckets of two
+        entries = max(2, size_mb * 1024 * 1024 // ENTRY_BYTES)
+        entries = 1 << (entries.bit_length() - 1)
+
+        self.size_mb = size_mb
+        self.entries = entries
+        self.mask = (entries - 1) & ~1
+        self.keys = array("Q", bytes(8 * entries))
+        self.data = array("Q", bytes(8 * entries))
+        self.age = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def clear(self):
+        self.keys = array("Q", bytes(8 * self.entries))
+        self.data = array("Q", bytes(8 * self.entries))
+        self.age = 0
+        self.reset_stats()
+
+    def new_search(self):
+        # Entries from earlier searches become the first to be replaced
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key):
+        # (depth, score, bound, move) for key, or None
+        self.probes += 1
+        index = key & self.mask
+        keys = self.keys
+
+        for slot in (index, index + 1):
+            if keys[slot] == key:
+                self.hits += 1
+                data = self.data[slot]
+                return (
+                    (data >> DEPTH_SHIFT) & 0xFF,
+                    (data & SCORE_MASK) - SCORE_OFFSET,
+                    (data >> BOUND_SHIFT) & 0x3,
+                    (data >> MOVE_SHIFT) & 0xFFFF,
+                )
+
+        self.misses += 1
+        if keys[index] or keys[index + 1]:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, score, bound, move=0):
+        index = key & self.mask
+        keys = self.keys
+        data = self.data
+
+        # Reuse this position's slot, otherwise evict an entry from an older
+        # search first and the shallower entry second
+        if keys[index] == key:
+            slot = index
+        elif keys[index + 1] == key:
+            slot = index + 1
+        else:
+            slot = index
+            for candidate in (index, index + 1):
+                if not keys[candidate]:
+                    slot = candidate
+                    break
+            else:
+                slot = min(
+                    (index, index + 1),
+                    key=lambda candidate: (
+                        ((data[candidate] >> AGE_SHIFT) & 0xFF) == self.age,
+                        (data[candidate] >> DEPTH_SHIFT) & 0xFF,
+                    ),
+                )
+            if keys[slot]:
+                self.overwrites += 1
+
+        if keys[slot] == key and not move:
+            # Keep the best move we already had for this position
+            move = (data[slot] >> MOVE_SHIFT) & 0xFFFF
+
+        self.stores += 1
+        keys[slot] = key
+        data[slot] = (
+            (self.age << AGE_SHIFT)
+            | (move << MOVE_SHIFT)
+            | (bound << BOUND_SHIFT)
+            | (min(depth, 0xFF) << DEPTH_SHIFT)
+            | ((score + SCORE_OFFSET) & SCORE_MASK)
+        )
+
+    def hashfull(self):
+        # Per mille of a sample of slots used by the current search
+        sample = min(1000, self.entries)
+        used = 0
+        for slot in range(sample):
+            if self.keys[slot] and (self.data[slot] >> AGE_SHIFT) & 0xFF == self.age:
+                used += 1
+        return used * 1000 // sample
+
+    def stats(self):
+        return {
+            "size_mb": self.size_mb,
+            "entries": self.entries,
+            "probes": self.probes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+            "hit_rate": self.hits / self.probes if self.probes else 0.0,
+            "hashfull": self.hashfull(),
+        }
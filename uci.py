@@ -0,0 +1,228 @@
+import argparse
+import sys
+import threading
+
+from rules import STARTING_FEN, Position, move_from_uci, move_to_uci
+from search import Search, format_info
+from tablebase import Tablebase
+from transposition import TranspositionTable
+
+NAME = "uChess"
+AUTHOR = "uChess developers"
+DEFAULT_HASH = 16
+MAX_HASH = 1024
+# Share of the remaining clock spent on one move when movestogo isn't given
+MOVES_TO_GO = 30
+# Milliseconds kept back for the GUI and process overhead
+MOVE_OVERHEAD = 50
+# go arguments that take a number
+GO_LIMITS = ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo")
+
+
+def think_time(params, turn):
+    # Seconds to search for a go command, None to search without a clock
+    if "movetime" in params:
+        # The search reads a movetime of 0 as no limit at all
+        return max(params["movetime"], 1) / 1000
+    remaining = params.get("wtime" if turn == "white" else "btime")
+    if remaining is None:
+        return None
+    increment = params.get("winc" if turn == "white" else "binc", 0)
+    moves_to_go = params.get("movestogo", MOVES_TO_GO)
+    budget = remaining / moves_to_go + increment * 0.8
+    budget = min(budget, remaining / 2, remaining - MOVE_OVERHEAD)
+    return max(budget, 1) / 1000
+
+
+class UciEngine:
+    def __init__(self, hash_mb=DEFAULT_HASH, tablebase=None, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.search = Search(TranspositionTable(hash_mb), tablebase)
+        self.position = Position()
+        # The FEN and moves position was built from, so the next position
+        # command only has to play the moves added since
+        self.base_fen = STARTING_FEN
+        self.moves = []
+        self.thread = None
+        # Set by stop so an infinite search waits before its bestmove
+        self.stopped = threading.Event()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        # False once the engine should exit
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+
+        try:
+            return self.dispatch(command, args)
+        except ValueError as error:
+            # A bad number in a command is reported, the engine keeps running
+            self.send(f"info string {error}")
+            return True
+
+    def dispatch(self, command, args):
+        if command == "uci":
+            self.send(f"id name {NAME}")
+            self.send(f"id author {AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH} min 1 max {MAX_HASH}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "ucinewgame":
+            self.stop()
+            self.search.tt.clear()
+            self.set_position(STARTING_FEN, [])
+        elif command == "position":
+            self.stop()
+            self.position_command(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        elif command == "d":
+            self.send(self.position.to_fen())
+        else:
+            self.send(f"info string unknown command {command}")
+        return True
+
+    def set_option(self, args):
+        # setoption name <name> value <value>
+        if "name" not in args:
+            return
+        value_at = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1 : value_at]).lower()
+        value = " ".join(args[value_at + 1 :])
+
+        if name == "hash":
+            self.stop()
+            size = max(1, min(MAX_HASH, int(value)))
+            self.search.tt = TranspositionTable(size)
+        else:
+            self.send(f"info string unknown option {name}")
+
+    def position_command(self, args):
+        if not args:
+            return
+        moves_at = args.index("moves") if "moves" in args else len(args)
+        if args[0] == "startpos":
+            fen = STARTING_FEN
+        elif args[0] == "fen":
+            fen = " ".join(args[1:moves_at])
+        else:
+            self.send("info string bad position command")
+            return
+
+        try:
+            self.set_position(fen, args[moves_at + 1 :])
+        except ValueError as error:
+            self.send(f"info string {error}")
+            self.set_position(STARTING_FEN, [])
+
+    def set_position(self, fen, moves):
+        if fen != self.base_fen:
+            self.position = Position.from_fen(fen)
+            self.base_fen = fen
+            self.moves = []
+
+        # Keep the moves both lists start with, take back the rest and play
+        # the new ones, usually one or two per command during a game
+        common = 0
+        while common < min(len(moves), len(self.moves)) and moves[common] == self.moves[common]:
+            common += 1
+        while len(self.moves) > common:
+            self.position.unmake_move()
+            self.moves.pop()
+
+        for text in moves[common:]:
+            move = move_from_uci(text)
+            if move not in self.position.legal_moves():
+                raise ValueError(f"illegal move {text}")
+            self.position.make_move(*move)
+            self.moves.append(text)
+
+    def go(self, args):
+        params = {}
+        infinite = False
+        words = iter(args)
+        for word in words:
+            if word == "infinite":
+                infinite = True
+            elif word in GO_LIMITS:
+                params[word] = int(next(words, ""))
+
+        # Depth 0 would mean no depth limit to the search
+        depth = max(params["depth"], 1) if "depth" in params else None
+        if infinite:
+            movetime = None
+        else:
+            movetime = think_time(params, self.position.turn)
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.think,
+            args=(depth, movetime, params.get("nodes"), infinite),
+            daemon=True,
+        )
+        self.thread.start()
+
+    def think(self, depth, movetime, nodes, infinite):
+        result = self.search.search(
+            self.position,
+            depth=depth,
+            movetime=movetime,
+            nodes=nodes,
+            info=lambda result: self.send(f"info {format_info(result)}"),
+        )
+        # An infinite search only answers once it is told to stop
+        if infinite:
+            self.stopped.wait()
+
+        if result.move is None:
+            self.send("bestmove 0000")
+        elif len(result.pv) > 1:
+            self.send(f"bestmove {move_to_uci(result.pv[0])} ponder {move_to_uci(result.pv[1])}")
+        else:
+            self.send(f"bestmove {move_to_uci(result.move)}")
+
+    def stop(self):
+        # Ends a running search, which still prints its bestmove
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.search.stop()
+        self.thread.join()
+        self.thread = None
+        # A stop that came after the search had already returned
+        self.search.stop_requested = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the engine as a UCI engine on stdin/stdout")
+    parser.add_argument("--hash", type=int, default=DEFAULT_HASH, help="transposition table MB")
+    parser.add_argument("--tablebase", help="directory of endgame tables")
+    args = parser.parse_args(argv)
+
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+    engine = UciEngine(args.hash, tablebase)
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    else:
+        engine.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
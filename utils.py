@@ -2,8 +2,16 @@ import pygame
 
 from colors import BLACK
 
-pygame.init()
-font = pygame.font.SysFont("comic sans", 20)
+_font = None
+
+
+def get_font():
+    # Created on first use so importing this module doesn't start pygame
+    global _font
+    if _font is None:
+        pygame.font.init()
+        _font = pygame.font.SysFont("comic sans", 20)
+    return _font
 
 
 class Button:
@@ -25,7 +33,7 @@ class Button:
         self.button = pygame.Surface(btn_size)
         self.button.fill(bg_color)
 
-        self.text = font.render(text, True, text_color)
+        self.text = get_font().render(text, True, text_color)
         self.text_rect = self.text.get_rect(center=(btn_size[0] // 2, btn_size[1] // 2))
 
         self.button.blit(self.text, self.text_rect)
@@ -39,14 +47,3 @@ class Button:
             if self.rect.collidepoint(event.pos):
                 self.on_pressed()
 
-
-def generate_pgn(moves):
-    pgn = []
-    for i in range(0, len(moves), 2):
-        move_number = i // 2 + 1
-        white_move = moves[i].title()
-        black_move = moves[i + 1].title() if i + 1 < len(moves) else ""
-
-        pgn.append(f"{move_number}. {white_move} {black_move}")
-
-    return " ".join(pgn)
@@ -0,0 +1,36 @@
+import random
+
+# Fixed seed so keys, and anything stored by hash, are stable across runs
+_random = random.Random(20240601)
+
+PIECES = ["wp", "wn", "wb", "wr", "wq", "wk", "bp", "bn", "bb", "br", "bq", "bk"]
+
+# PIECE_KEYS[piece][y * 8 + x]
+PIECE_KEYS = {piece: [_random.getrandbits(64) for _ in range(64)] for piece in PIECES}
+CASTLING_KEYS = {right: _random.getrandbits(64) for right in "KQkq"}
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)
+
+
+def hash_board(board, turn, castling, en_passant):
+    key = 0
+    for y in range(8):
+        for x in range(8):
+            piece = board[y][x]
+            if piece in PIECE_KEYS:
+                key ^= PIECE_KEYS[piece][y * 8 + x]
+
+    for right in castling:
+        key ^= CASTLING_KEYS[right]
+
+    if en_passant != (None, None):
+        key ^= EN_PASSANT_KEYS[en_passant[0]]
+
+    if turn == "black":
+        key ^= BLACK_TO_MOVE_KEY
+
+    return key
+
+
+def hash_position(position):
+    return hash_board(position.board, position.turn, position.castling, position.en_passant)